@@ -7,6 +7,19 @@ load_dotenv()
 
 class Settings(BaseSettings):
     DATABASE_URL:str = os.getenv("DATABASE_URL")
+    # Comma-separated read replica URLs; analytics and other read paths use them when set
+    DATABASE_REPLICA_URLS: str = os.getenv("DATABASE_REPLICA_URLS", "")
+    DB_REPLICA_HEALTH_CHECK_SECONDS: int = os.getenv("DB_REPLICA_HEALTH_CHECK_SECONDS", 5)
+    READ_YOUR_WRITES_SECONDS: int = os.getenv("READ_YOUR_WRITES_SECONDS", 5)  # 0 disables pinning writers to the primary
+    # Connection pool; keep pool_size + max_overflow per worker within the Postgres connection budget
+    DB_POOL_SIZE: int = os.getenv("DB_POOL_SIZE", 5)
+    DB_MAX_OVERFLOW: int = os.getenv("DB_MAX_OVERFLOW", 10)
+    DB_POOL_TIMEOUT_SECONDS: float = os.getenv("DB_POOL_TIMEOUT_SECONDS", 30)
+    DB_POOL_RECYCLE_SECONDS: int = os.getenv("DB_POOL_RECYCLE_SECONDS", 1800)
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", True)
+    DB_STATEMENT_CACHE_SIZE: int = os.getenv("DB_STATEMENT_CACHE_SIZE", 100)  # asyncpg prepared statements per connection
+    DB_ECHO: bool = os.getenv("DB_ECHO", False)
+
     REDIS_URL: str = os.getenv("REDIS_URL")
 
     REDIS_PASSWORD: str = os.getenv("REDIS_PASSWORD")
@@ -16,5 +29,80 @@ class Settings(BaseSettings):
     ENCRYPTION_KEY: str = os.getenv("ENCRYPTION_KEY")
     ALGORITHM: str = os.getenv("ALGORITHM")
 
+    # In-process L1 cache in front of Redis
+    CACHE_L1_MAX_ENTRIES: int = os.getenv("CACHE_L1_MAX_ENTRIES", 10000)
+    CACHE_L1_TTL_SECONDS: float = os.getenv("CACHE_L1_TTL_SECONDS", 5)
+    CACHE_INVALIDATION_CHANNEL: str = os.getenv("CACHE_INVALIDATION_CHANNEL", "cache:invalidate")
+
+    CACHE_CODEC: str = os.getenv("CACHE_CODEC", "orjson")  # json, orjson or msgpack
+    CACHE_COMPRESSION_THRESHOLD: int = os.getenv("CACHE_COMPRESSION_THRESHOLD", 1024)  # bytes, 0 disables
+
+    # Stampede protection for computed cache entries
+    CACHE_LOCK_TIMEOUT_MS: int = os.getenv("CACHE_LOCK_TIMEOUT_MS", 10000)
+    CACHE_LOCK_WAIT_MS: int = os.getenv("CACHE_LOCK_WAIT_MS", 3000)
+    ANALYTICS_STALE_WHILE_REVALIDATE_SECONDS: int = os.getenv("ANALYTICS_STALE_WHILE_REVALIDATE_SECONDS", 0)  # 0 disables
+
+    # Monthly range partitioning of transactions (opt-in, PostgreSQL only)
+    TRANSACTIONS_PARTITIONING: bool = os.getenv("TRANSACTIONS_PARTITIONING", False)
+    TRANSACTIONS_PARTITION_MONTHS_AHEAD: int = os.getenv("TRANSACTIONS_PARTITION_MONTHS_AHEAD", 3)
+    TRANSACTIONS_PARTITION_RETENTION_MONTHS: int = os.getenv("TRANSACTIONS_PARTITION_RETENTION_MONTHS", 0)  # 0 keeps every partition
+    TRANSACTIONS_PARTITION_MAINTENANCE_SECONDS: int = os.getenv("TRANSACTIONS_PARTITION_MAINTENANCE_SECONDS", 3600)
+
+    # Bulk transaction ingestion
+    BULK_INSERT_CHUNK_SIZE: int = os.getenv("BULK_INSERT_CHUNK_SIZE", 1000)
+    BULK_INSERT_MAX_ROWS: int = os.getenv("BULK_INSERT_MAX_ROWS", 50000)
+
+    # Transaction listing
+    TRANSACTION_PAGE_MAX_LIMIT: int = os.getenv("TRANSACTION_PAGE_MAX_LIMIT", 200)
+
+    # Streaming export
+    EXPORT_BATCH_SIZE: int = os.getenv("EXPORT_BATCH_SIZE", 5000)
+
+    # Batch analytics
+    ANALYTICS_BATCH_MAX_USERS: int = os.getenv("ANALYTICS_BATCH_MAX_USERS", 50000)
+    ANALYTICS_BATCH_CHUNK_SIZE: int = os.getenv("ANALYTICS_BATCH_CHUNK_SIZE", 1000)
+
+    # Time-series analytics; longer ranges are rejected with 400
+    ANALYTICS_TIME_SERIES_MAX_BUCKETS: int = os.getenv("ANALYTICS_TIME_SERIES_MAX_BUCKETS", 3660)
+
+    # Per-user quantile sketches of transaction amounts; higher k is more accurate and larger (about 1.7 / k rank error)
+    QUANTILE_SKETCH_K: int = os.getenv("QUANTILE_SKETCH_K", 200)
+
+    # Transactional outbox: derived-data updates applied after the write commits
+    OUTBOX_BATCH_SIZE: int = os.getenv("OUTBOX_BATCH_SIZE", 500)
+    OUTBOX_POLL_INTERVAL_SECONDS: float = os.getenv("OUTBOX_POLL_INTERVAL_SECONDS", 1)  # writes in this process wake the worker sooner
+    OUTBOX_MAX_ATTEMPTS: int = os.getenv("OUTBOX_MAX_ATTEMPTS", 5)  # failed applies before an event is dead-lettered
+
+    # One-time login codes, kept in Redis
+    OTP_TTL_SECONDS: int = os.getenv("OTP_TTL_SECONDS", 300)
+    OTP_MAX_ATTEMPTS: int = os.getenv("OTP_MAX_ATTEMPTS", 5)  # wrong guesses before the code is burnt
+
+    # In-process cache of authenticated users; entries also expire with the token that loaded them
+    PRINCIPAL_CACHE_MAX_ENTRIES: int = os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", 10000)
+    PRINCIPAL_CACHE_TTL_SECONDS: float = os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", 300)
+
+    # Per-client token buckets in Redis: one client-wide, one for /analytics; capacity is the allowed burst
+    RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", True)
+    RATE_LIMIT_CAPACITY: int = os.getenv("RATE_LIMIT_CAPACITY", 120)
+    RATE_LIMIT_REFILL_PER_SECOND: float = os.getenv("RATE_LIMIT_REFILL_PER_SECOND", 20)
+    RATE_LIMIT_ANALYTICS_CAPACITY: int = os.getenv("RATE_LIMIT_ANALYTICS_CAPACITY", 30)
+    RATE_LIMIT_ANALYTICS_REFILL_PER_SECOND: float = os.getenv("RATE_LIMIT_ANALYTICS_REFILL_PER_SECOND", 5)
+    RATE_LIMIT_EXEMPT_PATHS: str = os.getenv("RATE_LIMIT_EXEMPT_PATHS", "/monitoring,/metrics,/docs,/redoc,/openapi.json")
+    RATE_LIMIT_LOCAL_FRACTION: float = os.getenv("RATE_LIMIT_LOCAL_FRACTION", 0.5)  # 1 sends every request to Redis
+    RATE_LIMIT_SYNC_SECONDS: float = os.getenv("RATE_LIMIT_SYNC_SECONDS", 1)
+    RATE_LIMIT_LOCAL_MAX_BUCKETS: int = os.getenv("RATE_LIMIT_LOCAL_MAX_BUCKETS", 10000)
+    RATE_LIMIT_TRUST_FORWARDED_FOR: bool = os.getenv("RATE_LIMIT_TRUST_FORWARDED_FOR", False)  # only behind a proxy that sets it
+
+    # Thread pool for bcrypt and Fernet work; calls beyond size + queue are rejected with 503
+    CRYPTO_POOL_SIZE: int = os.getenv("CRYPTO_POOL_SIZE", 4)
+    CRYPTO_POOL_MAX_QUEUE: int = os.getenv("CRYPTO_POOL_MAX_QUEUE", 64)
+
+    # Analytics cache refresh scheduler
+    ANALYTICS_REFRESH_INTERVAL_SECONDS: int = os.getenv("ANALYTICS_REFRESH_INTERVAL_SECONDS", 10)
+    ANALYTICS_REFRESH_MARGIN_SECONDS: int = os.getenv("ANALYTICS_REFRESH_MARGIN_SECONDS", 20)
+    ANALYTICS_REFRESH_IDLE_SECONDS: int = os.getenv("ANALYTICS_REFRESH_IDLE_SECONDS", 600)
+    ANALYTICS_REFRESH_CONCURRENCY: int = os.getenv("ANALYTICS_REFRESH_CONCURRENCY", 4)
+    ANALYTICS_REFRESH_MAX_USERS: int = os.getenv("ANALYTICS_REFRESH_MAX_USERS", 10000)  # least recently seen users are dropped first
+
 
 settings = Settings()
\ No newline at end of file
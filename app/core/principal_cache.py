@@ -0,0 +1,84 @@
+import logging
+import time
+from typing import Dict, Optional
+from app.core.config import settings
+from app.schemas.auth import Principal
+from app.utils.cache import MISSING, LocalCache, cache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "principal:"
+
+
+class PrincipalCache:
+    """
+    Bounded in-process cache of authenticated principals, so a token check is only a signature verification
+    instead of a users lookup and a full-name decrypt.
+    Entries are keyed by the token's user_id and live at most PRINCIPAL_CACHE_TTL_SECONDS, and never past the
+    expiry of the token that loaded them. invalidate() drops a user in every worker through the cache's
+    invalidation channel; any code that changes a user's email or name must call it.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.local = LocalCache(int(max_entries), float(ttl))
+        # outcome -> [count, total seconds, max seconds] of the whole auth stage
+        self._latency = {"hit": [0, 0.0, 0.0], "miss": [0, 0.0, 0.0]}
+        cache.add_invalidation_listener(self.handle_invalidation)
+
+    @staticmethod
+    def key(user_id) -> str:
+        return f"{KEY_PREFIX}{user_id}"
+
+    def get(self, user_id, email: str) -> Optional[Principal]:
+        """
+        :return: The cached principal, or None when absent, expired or cached under another email.
+        """
+        principal = self.local.get(self.key(user_id))
+        if principal is MISSING or principal.email != email:
+            return None
+        return principal
+
+    def set(self, principal: Principal, token_expires_at: float) -> None:
+        """
+        :param token_expires_at: The token's `exp` claim (epoch seconds); the entry does not outlive it.
+        """
+        key = self.key(principal.id)
+        # LocalCache.set ignores a non-positive TTL, which would leave an older entry in place
+        self.local.delete(key)
+        self.local.set(key, principal, ttl=token_expires_at - time.time())
+
+    async def invalidate(self, user_id) -> None:
+        """Drops a user's principal here and tells the other workers to drop theirs."""
+        key = self.key(user_id)
+        self.local.delete(key)
+        try:
+            await cache.redis.publish(cache.invalidation_channel, cache.invalidation_message(key))
+        except Exception as e:
+            # Other workers keep their copy until it expires
+            logger.error("Could not broadcast principal invalidation for user_id: %s, error: %s", user_id, str(e))
+
+    def handle_invalidation(self, key: str) -> None:
+        if key == "*":
+            self.local.clear()
+        elif key.startswith(KEY_PREFIX):
+            self.local.delete(key)
+
+    def record(self, outcome: str, seconds: float) -> None:
+        latency = self._latency[outcome]
+        latency[0] += 1
+        latency[1] += seconds
+        latency[2] = max(latency[2], seconds)
+
+    def stats(self) -> Dict:
+        lookups = self.local.hits + self.local.misses
+        report = {
+            **self.local.stats(),
+            "hit_ratio": round(self.local.hits / lookups, 4) if lookups else 0.0,
+        }
+        for outcome, (count, total, maximum) in self._latency.items():
+            report[f"auth_{outcome}_ms_mean"] = round(total / count * 1000, 3) if count else 0.0
+            report[f"auth_{outcome}_ms_max"] = round(maximum * 1000, 3)
+        return report
+
+# Singleton instance used by Security.get_current_user and the monitoring router
+principal_cache = PrincipalCache(settings.PRINCIPAL_CACHE_MAX_ENTRIES, settings.PRINCIPAL_CACHE_TTL_SECONDS)
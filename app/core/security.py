@@ -5,11 +5,20 @@ from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 import random
-from typing import Optional, Tuple
+import time
+from typing import Optional
 from fastapi.security import OAuth2PasswordBearer
-from fastapi import Depends
+from fastapi import Depends, HTTPException, status
+from app.core.principal_cache import principal_cache
+from app.db.models import User
 from app.db.session import get_db
+from app.schemas.auth import Principal
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.utils.bounded_executor import BoundedExecutor
+
+# bcrypt is deliberately slow (~250 ms per hash); running it inline would stall every other request
+crypto_executor = BoundedExecutor("crypto", settings.CRYPTO_POOL_SIZE, settings.CRYPTO_POOL_MAX_QUEUE)
 
 class Security:
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl='login')
@@ -38,6 +47,19 @@ class Security:
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         return self.pwd_context.verify(plain_password, hashed_password)
 
+    # Async variants for request handlers: the work runs on crypto_executor instead of the event loop
+    async def encrypt_async(self, plain_text: str) -> str:
+        return await crypto_executor.run(self.encrypt, plain_text)
+
+    async def decrypt_async(self, cipher_text: str) -> str:
+        return await crypto_executor.run(self.decrypt, cipher_text)
+
+    async def hash_password_async(self, password: str) -> str:
+        return await crypto_executor.run(self.hash_password, password)
+
+    async def verify_password_async(self, plain_password: str, hashed_password: str) -> bool:
+        return await crypto_executor.run(self.verify_password, plain_password, hashed_password)
+
     # JWT handling
     def create_access_token(self, data: dict, expires_delta: Optional[timedelta] = None):
         to_encode = data.copy()
@@ -45,41 +67,45 @@ class Security:
         to_encode.update({"exp": expire})
         return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
-    def verify_token(self,token: str):
+    def verify_token(self, token: str) -> dict:
         credentials_exception = HTTPException(
             status_code=401,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
         try:
-            # Decode the token
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            # Decode the token; jwt.decode also rejects expired tokens
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
             email: str = payload.get("sub")
             user_id: str = payload.get("user_id")
             if email is None or user_id is None:
                 raise credentials_exception
-            return {"sub": email, "user_id": user_id}
+            return {"sub": email, "user_id": user_id, "exp": payload["exp"]}
         except JWTError:
             raise credentials_exception
 
     # Dependency to get the current user from the token
-    async def get_current_user(self,token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
-        # Verify and decode the token
-        token_data = verify_token(token) 
-        user = await db.execute(select(User).filter(User.email == token_data["sub"]))
-        user = user.scalars().first()
-        
-        if user is None:
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> Principal:
+        started = time.perf_counter()
+        token_data = self.verify_token(token)
+        principal = principal_cache.get(token_data["user_id"], token_data["sub"])
+        if principal is not None:
+            principal_cache.record("hit", time.perf_counter() - started)
+            return principal
+
+        result = await db.execute(select(User.id, User.email, User.full_name).where(User.email == token_data["sub"]))
+        user = result.first()
+        if user is None or str(user.id) != token_data["user_id"]:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
-        decrypted_full_name = security.decrypt(user.full_name)
-        user.full_name = decrypted_full_name
-        return user
+        principal = Principal(id=user.id, email=user.email, full_name=await self.decrypt_async(user.full_name))
+        principal_cache.set(principal, token_data["exp"])
+        principal_cache.record("miss", time.perf_counter() - started)
+        return principal
 
     # OTP handling
-    def generate_otp(self) -> Tuple[str, datetime]:
-        """Generates an OTP and its expiration time."""
+    def generate_otp(self) -> str:
+        """Generates an OTP; its expiry is enforced by the OTP store."""
         otp = str(random.randint(100000, 999999))
-        # expiration = datetime.utcnow() + timedelta(minutes=settings.OTP_EXPIRY_MINUTES)
         return otp
 
     def verify_otp(self, provided_otp: str, stored_otp: str, expiration: datetime) -> bool:
@@ -9,6 +9,9 @@ from app.custom_exceptions.exceptions import (
     CacheErrorException,
     AnalyticsDataNotFoundException,
     AnalyticsComputationErrorException,
+    InvalidBulkPayloadException,
+    InvalidCursorException,
+    ExecutorSaturatedException,
 )
 
 
@@ -33,6 +36,15 @@ async def analytics_data_not_found_handler(request: Request, exc: AnalyticsDataN
 async def analytics_computation_error_handler(request: Request, exc: AnalyticsComputationErrorException):
     return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
 
+async def invalid_bulk_payload_handler(request: Request, exc: InvalidBulkPayloadException):
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+
+async def invalid_cursor_handler(request: Request, exc: InvalidCursorException):
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+
+async def executor_saturated_handler(request: Request, exc: ExecutorSaturatedException):
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail}, headers={"Retry-After": "1"})
+
 async def global_exception_handler(request: Request, exc: Exception):
     return JSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -27,3 +27,19 @@ class AnalyticsDataNotFoundException(HTTPException):
 class AnalyticsComputationErrorException(HTTPException):
     def __init__(self, detail="Error occurred while computing analytics data"):
         super().__init__(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=detail)
+
+class InvalidBulkPayloadException(HTTPException):
+    def __init__(self, detail="Bulk payload must be a JSON array or NDJSON"):
+        super().__init__(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+class InvalidCursorException(HTTPException):
+    def __init__(self, detail="Invalid pagination cursor"):
+        super().__init__(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+class InvalidAnalyticsRangeException(HTTPException):
+    def __init__(self, detail="Invalid analytics date range"):
+        super().__init__(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+class ExecutorSaturatedException(HTTPException):
+    def __init__(self, detail="Server is busy, please retry shortly"):
+        super().__init__(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=detail)
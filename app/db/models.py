@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, Enum, ForeignKey, TIMESTAMP, text
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, Integer, BigInteger, Boolean, String, Date, DateTime, Enum, ForeignKey, Index, LargeBinary, TIMESTAMP, text
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -38,3 +38,66 @@ class Transaction(Base):
     updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
 
     user = relationship("User", back_populates="transactions")
+
+    __table_args__ = (
+        # Serves every per-user query: keyset pagination, exports and date-range scans
+        Index("ix_transactions_user_id_transaction_date_id", "user_id", "transaction_date", "id"),
+    )
+
+
+class UserTransactionAggregate(Base):
+    """Running per-user totals, maintained by delta on every transaction write."""
+    __tablename__ = "user_transaction_aggregates"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    transaction_count = Column(BigInteger, nullable=False, default=0)
+    total_amount = Column(BigInteger, nullable=False, default=0)  # Stored in pesewas
+    credit_amount = Column(BigInteger, nullable=False, default=0)  # Stored in pesewas
+    debit_amount = Column(BigInteger, nullable=False, default=0)  # Stored in pesewas
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+
+
+class UserDailyTransactionRollup(Base):
+    """Per-user, per-day totals, maintained by delta alongside UserTransactionAggregate."""
+    __tablename__ = "user_daily_transaction_rollups"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    transaction_count = Column(BigInteger, nullable=False, default=0)
+    credit_amount = Column(BigInteger, nullable=False, default=0)  # Stored in pesewas
+    debit_amount = Column(BigInteger, nullable=False, default=0)  # Stored in pesewas
+
+
+class UserTransactionSketch(Base):
+    """Per-user KLL quantile sketch of transaction amounts, extended on every create."""
+    __tablename__ = "user_transaction_sketches"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    sketch = Column(LargeBinary, nullable=False)  # KLLSketch.to_bytes(), amounts in pesewas
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+
+
+class OutboxEvent(Base):
+    """
+    Derived-data work recorded in the same transaction as a transaction write and drained by the outbox worker.
+    `applied` is set once the aggregate and sketch updates are committed; the row is deleted after the Redis
+    side effects (cache invalidation, read pinning) have run. An event whose updates fail OUTBOX_MAX_ATTEMPTS
+    times is set aside as `dead_lettered` with its last error, until `rebuild` marks it applied.
+    """
+    __tablename__ = "outbox_events"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    event_type = Column(String, nullable=False)
+    user_id = Column(UUID(as_uuid=True), nullable=False)
+    payload = Column(JSONB, nullable=False)
+    applied = Column(Boolean, nullable=False, default=False, server_default=text('false'))
+    attempts = Column(Integer, nullable=False, default=0, server_default=text('0'))
+    last_error = Column(String, nullable=True)
+    dead_lettered = Column(Boolean, nullable=False, default=False, server_default=text('false'))
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+
+    __table_args__ = (
+        # Drain order, and the per-user pending check made before a sketch rebuild is stored
+        Index("ix_outbox_events_applied_id", "applied", "id"),
+        Index("ix_outbox_events_user_id_applied", "user_id", "applied"),
+    )
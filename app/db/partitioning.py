@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import re
+from datetime import date
+from typing import List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from app.core.config import settings
+from app.db.models import Transaction
+from app.services.aggregate_service import subtract_history
+from app.services.sketch_service import discard_sketches, request_rebuild
+
+logger = logging.getLogger(__name__)
+
+PARTITION_NAME = re.compile(r"^transactions_p(\d{4})(\d{2})$")
+
+# Mirrors the Transaction model. The primary key has to include the partition key.
+PARTITIONED_TRANSACTIONS_DDL = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id UUID NOT NULL,
+    user_id UUID NOT NULL REFERENCES users (id),
+    transaction_date TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    transaction_amount INTEGER NOT NULL,
+    transaction_type transactiontype NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, transaction_date)
+) PARTITION BY RANGE (transaction_date)
+"""
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month: date) -> str:
+    return f"transactions_p{month.year:04d}{month.month:02d}"
+
+async def transactions_table_kind(conn: AsyncConnection) -> Optional[str]:
+    """Returns 'p' for a partitioned transactions table, 'r' for a plain one and None when it does not exist."""
+    result = await conn.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass('transactions')"))
+    kind = result.scalar()
+    return kind.decode() if isinstance(kind, bytes) else kind
+
+async def create_partitioned_transactions(conn: AsyncConnection) -> bool:
+    """
+    Creates transactions as a table partitioned by month on transaction_date, with a default partition
+    for rows outside the managed months.
+    :return: False when a plain (non-partitioned) transactions table already exists and was left alone.
+    """
+    kind = await transactions_table_kind(conn)
+    if kind == "r":
+        logger.warning("transactions already exists as a plain table; migrate it manually to enable partitioning")
+        return False
+
+    await conn.run_sync(lambda sync_conn: Transaction.__table__.c.transaction_type.type.create(sync_conn, checkfirst=True))
+    await conn.execute(text(PARTITIONED_TRANSACTIONS_DDL))
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_transactions_user_id_transaction_date_id "
+        "ON transactions (user_id, transaction_date, id)"
+    ))
+    await conn.execute(text("CREATE TABLE IF NOT EXISTS transactions_default PARTITION OF transactions DEFAULT"))
+    logger.info("Partitioned transactions table is in place")
+    return True
+
+async def list_partitions(conn: AsyncConnection) -> List[str]:
+    result = await conn.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = 'transactions'"
+    ))
+    return [row[0] for row in result.all()]
+
+async def default_partition_months(conn: AsyncConnection) -> List[date]:
+    """Returns the months that have rows in transactions_default, oldest first."""
+    result = await conn.execute(text(
+        "SELECT DISTINCT date_trunc('month', transaction_date)::date FROM transactions_default ORDER BY 1"
+    ))
+    return [row[0] for row in result.all()]
+
+async def missing_partitions(conn: AsyncConnection, months_ahead: int, today: Optional[date] = None) -> List[Tuple[date, bool]]:
+    """
+    Lists the monthly partitions to create: the current month, the next `months_ahead` months and every month that
+    already has rows in the default partition (back-dated or historical data), oldest first.
+    :return: (month, has_default_rows) pairs for the months that have no partition yet.
+    """
+    current = (today or date.today()).replace(day=1)
+    existing = set(await list_partitions(conn))
+    default_months = set(await default_partition_months(conn))
+    months = default_months | {_add_months(current, offset) for offset in range(months_ahead + 1)}
+    return [(month, month in default_months) for month in sorted(months) if partition_name(month) not in existing]
+
+async def create_partition(conn: AsyncConnection, month: date, has_default_rows: bool = False) -> str:
+    """
+    Creates the partition for `month`. PostgreSQL refuses to create a partition whose range still has rows in the
+    default partition, so in that case the table is created standalone, the rows are moved out of the default
+    partition into it and it is attached afterwards. Run it in its own transaction.
+    :return: The name of the partition.
+    """
+    name = partition_name(month)
+    start, end = month.isoformat(), _add_months(month, 1).isoformat()
+    if not has_default_rows:
+        await conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF transactions FOR VALUES FROM ('{start}') TO ('{end}')"
+        ))
+        return name
+
+    await conn.execute(text(f"CREATE TABLE {name} (LIKE transactions INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    # Lets ATTACH PARTITION skip the scan that checks every row is in range
+    await conn.execute(text(
+        f"ALTER TABLE {name} ADD CONSTRAINT {name}_range "
+        f"CHECK (transaction_date >= '{start}' AND transaction_date < '{end}')"
+    ))
+    await conn.execute(text(
+        f"WITH moved AS (DELETE FROM transactions_default WHERE transaction_date >= '{start}' "
+        f"AND transaction_date < '{end}' RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+    ))
+    await conn.execute(text(f"ALTER TABLE transactions ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"))
+    await conn.execute(text(f"ALTER TABLE {name} DROP CONSTRAINT {name}_range"))
+    return name
+
+async def ensure_partitions(conn: AsyncConnection, months_ahead: int, today: Optional[date] = None) -> List[str]:
+    """
+    Creates the missing monthly partitions (see missing_partitions) on one connection.
+    :return: The names of the partitions that were created.
+    """
+    created = [
+        await create_partition(conn, month, has_default_rows)
+        for month, has_default_rows in await missing_partitions(conn, months_ahead, today)
+    ]
+    if created:
+        logger.info("Created transaction partitions: %s", ", ".join(created))
+    return created
+
+async def expired_partitions(conn: AsyncConnection, retention_months: int, today: Optional[date] = None) -> List[str]:
+    """Lists the monthly partitions older than `retention_months`; none when retention is 0."""
+    if retention_months <= 0:
+        return []
+
+    cutoff = _add_months((today or date.today()).replace(day=1), -retention_months)
+    return sorted(
+        name for name in await list_partitions(conn) if PARTITION_NAME.match(name) and partition_month(name) < cutoff
+    )
+
+def partition_month(name: str) -> date:
+    match = PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+async def detach_partition(conn: AsyncConnection, name: str) -> List[str]:
+    """
+    Detaches a monthly partition and, in the same transaction, takes its rows out of the aggregates and daily
+    rollups and discards the sketches of the users who had them, so derived data covers only the attached months.
+    :return: The users whose sketches were discarded; call request_rebuild for them once committed.
+    """
+    month = partition_month(name)
+    users = await subtract_history(conn, month, _add_months(month, 1))
+    await discard_sketches(conn, users)
+    await conn.execute(text(f"ALTER TABLE transactions DETACH PARTITION {name}"))
+    return users
+
+async def detach_old_partitions(conn: AsyncConnection, retention_months: int, today: Optional[date] = None) -> List[str]:
+    """
+    Detaches monthly partitions older than `retention_months` (see detach_partition). Detached tables are kept
+    for archiving, not dropped.
+    :return: The names of the partitions that were detached.
+    """
+    detached = await expired_partitions(conn, retention_months, today)
+    for name in detached:
+        await detach_partition(conn, name)
+    if detached:
+        logger.info("Detached transaction partitions: %s", ", ".join(detached))
+    return detached
+
+
+class PartitionMaintainer:
+    """Periodically creates upcoming and back-filled monthly partitions and detaches expired ones."""
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        months_ahead: int = settings.TRANSACTIONS_PARTITION_MONTHS_AHEAD,
+        retention_months: int = settings.TRANSACTIONS_PARTITION_RETENTION_MONTHS,
+        interval: int = settings.TRANSACTIONS_PARTITION_MAINTENANCE_SECONDS,
+    ):
+        self.engine = engine
+        self.months_ahead = int(months_ahead)
+        self.retention_months = int(retention_months)
+        self.interval = int(interval)
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> None:
+        """
+        Historical rows moved out of the default partition get their own monthly partition first, so the
+        retention pass below also detaches them. Every partition is created or detached in its own transaction:
+        one that fails is logged and retried on the next run without holding back the others.
+        """
+        async with self.engine.connect() as conn:
+            if await transactions_table_kind(conn) != "p":
+                return
+            missing = await missing_partitions(conn, self.months_ahead)
+
+        created = []
+        for month, has_default_rows in missing:
+            try:
+                async with self.engine.begin() as conn:
+                    created.append(await create_partition(conn, month, has_default_rows))
+            except Exception as e:
+                logger.error("Could not create transaction partition %s, error: %s", partition_name(month), str(e))
+        if created:
+            logger.info("Created transaction partitions: %s", ", ".join(created))
+
+        async with self.engine.connect() as conn:
+            expired = await expired_partitions(conn, self.retention_months)
+        detached = []
+        for name in expired:
+            try:
+                async with self.engine.begin() as conn:
+                    users = await detach_partition(conn, name)
+                request_rebuild(users)
+                detached.append(name)
+            except Exception as e:
+                logger.error("Could not detach transaction partition %s, error: %s", name, str(e))
+        if detached:
+            logger.info("Detached transaction partitions: %s", ", ".join(detached))
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Transaction partition maintenance failed, error: %s", str(e))
+            await asyncio.sleep(self.interval)
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,63 @@
+import time
+from typing import Dict
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+class PoolStats:
+    """Counters for connection checkouts from one pool."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.overflow_events = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_checkout(self, waited: float) -> None:
+        self.checkouts += 1
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that records how long each checkout waited for a connection, how often it had to open a
+    connection beyond pool_size (overflow) and how often it gave up after pool_timeout.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def connect(self):
+        # Covers the whole acquisition: waiting on the queue, opening a new connection and the pre-ping
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        self.stats.record_checkout(time.perf_counter() - started)
+        return connection
+
+    def _inc_overflow(self) -> bool:
+        opened = super()._inc_overflow()
+        if opened and self.overflow() > 0:
+            self.stats.overflow_events += 1
+        return opened
+
+    def report(self) -> Dict:
+        checkouts = self.stats.checkouts
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "idle": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            "max_overflow": self._max_overflow,
+            "checkouts": checkouts,
+            "overflow_events": self.stats.overflow_events,
+            "timeouts": self.stats.timeouts,
+            "wait_ms_mean": round(self.stats.wait_seconds_total / checkouts * 1000, 3) if checkouts else 0.0,
+            "wait_ms_max": round(self.stats.wait_seconds_max * 1000, 3),
+        }
@@ -1,11 +1,183 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+import asyncio
+import itertools
+import logging
+import time
+from typing import Dict, List, Optional
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
+from app.db.pool import InstrumentedPool
+from app.utils.cache import cache
+from app.utils.metrics import registry
+
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = settings.DATABASE_URL
-print("DATABASE_URL",DATABASE_URL)
+REPLICA_URLS = [url.strip() for url in (settings.DATABASE_REPLICA_URLS or "").split(",") if url.strip()]
+
+DB_STATEMENT_SECONDS = registry.histogram(
+    "db_statement_duration_seconds", "Time from sending a statement to its result, by engine role and statement kind", ("role", "kind")
+)
+STATEMENT_KINDS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "LOCK"}
+
+
+def statement_kind(statement: str) -> str:
+    words = statement.lstrip(" \t\r\n(").split(None, 1)
+    kind = words[0].upper() if words else ""
+    return kind if kind in STATEMENT_KINDS else "OTHER"
+
+def instrument_statements(engine: Engine, role: str) -> None:
+    """Times every statement the engine runs into DB_STATEMENT_SECONDS; labels use the kind, never the SQL text."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        DB_STATEMENT_SECONDS.observe((role, statement_kind(statement)), time.perf_counter() - context._metrics_started)
+
+
+def build_engine(url: str, role: str = "primary") -> AsyncEngine:
+    """
+    Creates an engine with the pool settings from Settings, an instrumented pool and statement timings.
+    :param role: "primary" or "replica", the role label of its statement timings.
+    """
+    connect_args = {}
+    if make_url(url).get_driver_name() == "asyncpg":
+        # Set to 0 when running behind a transaction-pooling PgBouncer
+        connect_args["prepared_statement_cache_size"] = int(settings.DB_STATEMENT_CACHE_SIZE)
+    engine = create_async_engine(
+        url,
+        echo=settings.DB_ECHO,
+        poolclass=InstrumentedPool,
+        pool_size=int(settings.DB_POOL_SIZE),
+        max_overflow=int(settings.DB_MAX_OVERFLOW),
+        pool_timeout=float(settings.DB_POOL_TIMEOUT_SECONDS),
+        pool_recycle=int(settings.DB_POOL_RECYCLE_SECONDS),
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+    instrument_statements(engine.sync_engine, role)
+    return engine
+
+def pool_stats(engine: AsyncEngine) -> dict:
+    return engine.sync_engine.pool.report()
+
+
+
+class ReplicaRouter:
+    """
+    Picks the engine for read-only work: round-robin over the replicas that passed their last health check,
+    or the writer when there are none. Users that wrote within the last `pin_seconds` are pinned to the
+    writer so they read their own writes; pins live in Redis so they hold across workers.
+    """
+
+    def __init__(
+        self,
+        writer: AsyncEngine,
+        replicas: List[AsyncEngine],
+        pin_seconds: int = settings.READ_YOUR_WRITES_SECONDS,
+        interval: int = settings.DB_REPLICA_HEALTH_CHECK_SECONDS,
+    ):
+        self.writer = writer
+        self.replicas = replicas
+        self.pin_seconds = int(pin_seconds)
+        self.interval = int(interval)
+        self._healthy = {id(replica): True for replica in replicas}
+        self._turn = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _pin_key(user_id: str) -> str:
+        return f"primary_pin:{user_id}"
+
+    async def pin(self, user_id) -> None:
+        """Routes the user's reads to the writer for the next `pin_seconds`."""
+        if not self.replicas or self.pin_seconds <= 0:
+            return
+        await cache.redis.set(self._pin_key(user_id), b"1", ex=self.pin_seconds)
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+    async def is_pinned(self, user_id) -> bool:
+        try:
+            return bool(await cache.redis.exists(self._pin_key(user_id)))
+        except Exception as e:
+            # Without the pin we cannot rule out a recent write, the writer is always safe
+            logger.warning("Could not read primary pin for user_id: %s, error: %s", user_id, str(e))
+            return True
+
+    async def engine_for(self, user_id: Optional[str] = None) -> AsyncEngine:
+        if not self.replicas:
+            return self.writer
+        if user_id and self.pin_seconds > 0 and await self.is_pinned(user_id):
+            return self.writer
+        healthy = [replica for replica in self.replicas if self._healthy[id(replica)]]
+        if not healthy:
+            return self.writer
+        return healthy[next(self._turn) % len(healthy)]
+
+    @staticmethod
+    async def _ping(replica: AsyncEngine) -> None:
+        async with replica.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    async def _check(self, replica: AsyncEngine) -> bool:
+        try:
+            await asyncio.wait_for(self._ping(replica), timeout=self.interval)
+            return True
+        except Exception as e:
+            logger.warning("Replica %s failed its health check, error: %s", replica.url.host, str(e))
+            return False
+
+    async def check_health(self) -> None:
+        results = await asyncio.gather(*(self._check(replica) for replica in self.replicas))
+        for replica, healthy in zip(self.replicas, results):
+            if healthy != self._healthy[id(replica)]:
+                logger.info("Replica %s is now %s", replica.url.host, "healthy" if healthy else "unhealthy")
+            self._healthy[id(replica)] = healthy
+
+    async def _run(self) -> None:
+        while True:
+            await self.check_health()
+            await asyncio.sleep(self.interval)
+
+    async def start(self) -> None:
+        if self.replicas and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def dispose(self) -> None:
+        for replica in self.replicas:
+            await replica.dispose()
+
+    def stats(self) -> Dict:
+        return {
+            "writer": pool_stats(self.writer),
+            # Replicas are reported by their position in DATABASE_REPLICA_URLS, never by host or credentials
+            "replicas": [
+                {
+                    "index": index,
+                    "healthy": self._healthy[id(replica)],
+                    "pool": pool_stats(replica),
+                }
+                for index, replica in enumerate(self.replicas)
+            ],
+        }
+
+
+engine = build_engine(DATABASE_URL)
+replica_router = ReplicaRouter(engine, [build_engine(url, "replica") for url in REPLICA_URLS])
 
 AsyncSessionLocal = sessionmaker(
     bind=engine,
@@ -13,6 +185,23 @@ AsyncSessionLocal = sessionmaker(
     expire_on_commit=False
 )
 
-async def get_db():
+async def read_session(user_id: Optional[str] = None) -> AsyncSession:
+    """Opens a session for read-only work on a replica, or on the writer when the user is pinned to it."""
+    return AsyncSessionLocal(bind=await replica_router.engine_for(user_id))
+
+async def get_write_db():
     async with AsyncSessionLocal() as session:
         yield session
+
+# Kept for the routes that read and write in the same request
+get_db = get_write_db
+
+async def get_read_db(user_id: str):
+    """Session dependency for read-only routes; takes `user_id` from the route's path or query."""
+    async with await read_session(user_id) as session:
+        yield session
+
+async def get_replica_db():
+    """Session dependency for bulk read-only routes that are not tied to one user; never pinned to the writer."""
+    async with await read_session() as session:
+        yield session
@@ -1,9 +1,18 @@
 # main.py
 
-from fastapi import FastAPI
-from app.db.models import Base
-from app.db.session import engine
-from app.routers import transactions, analytics, auth
+from fastapi import Depends, FastAPI
+from app.core.config import settings
+from app.db.models import Base, Transaction
+from app.db.partitioning import PartitionMaintainer, create_partitioned_transactions
+from app.db.session import engine, replica_router
+from app.routers import transactions, analytics, auth, metrics, monitoring
+from app.services.aggregate_service import aggregates_need_backfill
+from app.services.refresh_scheduler import refresh_scheduler
+from app.services.outbox_worker import outbox_worker
+from app.utils.cache import cache
+from app.utils.metrics import MetricsMiddleware
+from app.utils.rate_limit import RateLimitMiddleware, rate_limiter
+from app.core.security import crypto_executor, security
 from app.custom_exceptions.exceptions import (
     UserNotFoundException,
     TransactionNotFoundException,
@@ -11,7 +20,10 @@ from app.custom_exceptions.exceptions import (
     DatabaseErrorException,
     CacheErrorException,
     AnalyticsDataNotFoundException,
-    AnalyticsComputationErrorException
+    AnalyticsComputationErrorException,
+    InvalidBulkPayloadException,
+    InvalidCursorException,
+    ExecutorSaturatedException
 )
 
 from app.custom_exceptions.exception_handlers import (
@@ -22,6 +34,9 @@ from app.custom_exceptions.exception_handlers import (
     cache_error_handler,
     analytics_data_not_found_handler,
     analytics_computation_error_handler,
+    invalid_bulk_payload_handler,
+    invalid_cursor_handler,
+    executor_saturated_handler,
     global_exception_handler
 )
 import logging
@@ -30,20 +45,52 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="FidoAPI", version="1.0.0", description="Fido Transaction and Analytics API")
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+# Added last so it is outermost and also times requests the rate limiter turns away
+app.add_middleware(MetricsMiddleware)
+
+partition_maintainer = PartitionMaintainer(engine)
 
 @app.on_event("startup")
 async def on_startup():
     async with engine.begin() as conn:
+        if settings.TRANSACTIONS_PARTITIONING:
+            # transactions is created by hand as a partitioned table, after the tables it references
+            tables = [table for table in Base.metadata.sorted_tables if table is not Transaction.__table__]
+            await conn.run_sync(Base.metadata.create_all, tables=tables)
+            await create_partitioned_transactions(conn)
         await conn.run_sync(Base.metadata.create_all)
+        if await aggregates_need_backfill(conn):
+            logger.error(
+                "user_transaction_aggregates is empty but transactions exist; analytics report zeros until "
+                "`python -m app.scripts.aggregates rebuild` is run"
+            )
+    if settings.TRANSACTIONS_PARTITIONING:
+        await partition_maintainer.start()
+    await cache.start_invalidation_listener()
+    await replica_router.start()
+    await refresh_scheduler.start()
+    await outbox_worker.start()
 
 @app.on_event("shutdown")
 async def on_shutdown():
+    await outbox_worker.stop()
+    await refresh_scheduler.stop()
+    await replica_router.stop()
+    await cache.stop_invalidation_listener()
+    await partition_maintainer.stop()
+    await replica_router.dispose()
     await engine.dispose()
+    crypto_executor.shutdown()
 
 # Include routers
 app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
-app.include_router(transactions.router, prefix="/transactions", tags=["Transactions"])
-app.include_router(analytics.router, prefix="/analytics", tags=["Analytics"])
+# Every transaction, analytics and monitoring route needs a bearer token; cached principals skip the users lookup
+authenticated = [Depends(security.get_current_user)]
+app.include_router(transactions.router, prefix="/transactions", tags=["Transactions"], dependencies=authenticated)
+app.include_router(analytics.router, prefix="/analytics", tags=["Analytics"], dependencies=authenticated)
+app.include_router(monitoring.router, prefix="/monitoring", tags=["Monitoring"], dependencies=authenticated)
+app.include_router(metrics.router, tags=["Monitoring"])
 
 # Register global exception handlers
 app.add_exception_handler(UserNotFoundException, user_not_found_handler)
@@ -53,4 +100,7 @@ app.add_exception_handler(DatabaseErrorException, database_error_handler)
 app.add_exception_handler(CacheErrorException, cache_error_handler)
 app.add_exception_handler(AnalyticsDataNotFoundException, analytics_data_not_found_handler)
 app.add_exception_handler(AnalyticsComputationErrorException, analytics_computation_error_handler)
+app.add_exception_handler(InvalidBulkPayloadException, invalid_bulk_payload_handler)
+app.add_exception_handler(InvalidCursorException, invalid_cursor_handler)
+app.add_exception_handler(ExecutorSaturatedException, executor_saturated_handler)
 app.add_exception_handler(Exception, global_exception_handler)
@@ -1,30 +1,114 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, Dict
 from datetime import date
-from app.db.session import get_db
+from app.db.session import get_read_db, get_replica_db
+from app.schemas.analytics import AnalyticsBatchRequest, AnalyticsBatchResponse, AnalyticsInterval, AnalyticsSummary, AnalyticsTimeSeries
 from app.services.analytics_service import AnalyticsService
+from app.services.refresh_scheduler import refresh_scheduler
+from app.utils.response_cache import response_cache
 from app.custom_exceptions.exceptions import (
     DatabaseErrorException,
     AnalyticsDataNotFoundException,
-    AnalyticsComputationErrorException
+    AnalyticsComputationErrorException,
+    InvalidAnalyticsRangeException
 )
 
 router = APIRouter()
 
+@router.post("/batch", response_model=AnalyticsBatchResponse)
+async def get_batch_analytics(
+    batch: AnalyticsBatchRequest,
+    db: AsyncSession = Depends(get_replica_db)
+):
+    """Retrieve summary metrics for many users in one call. Users without transactions get zero totals and no highest day."""
+    try:
+        # Drop duplicates but keep the caller's order
+        user_ids = list(dict.fromkeys(str(user_id) for user_id in batch.user_ids))
+        results = await AnalyticsService.get_batch(db, user_ids, list(dict.fromkeys(batch.metrics)))
+        return AnalyticsBatchResponse(results=results)
+    except AnalyticsComputationErrorException as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=e.detail)
+    except DatabaseErrorException as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=e.detail)
+
+@router.get("/{user_id}/summary", response_model=AnalyticsSummary)
+async def get_analytics_summary(
+    user_id: str,
+    request: Request,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Retrieve a user's transaction count, average value, credit/debit totals (GHC) and highest transaction day in one response."""
+    try:
+        # Keep this user's cache warm while they stay active
+        refresh_scheduler.track(user_id)
+
+        async def build():
+            return await AnalyticsService.get_summary(db, user_id)
+
+        key = AnalyticsService.response_key(user_id, "summary")
+        return await response_cache.respond(request, key, build, AnalyticsService.CACHE_EXPIRY)
+    except AnalyticsComputationErrorException as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=e.detail)
+    except DatabaseErrorException as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=e.detail)
+
 @router.get("/{user_id}/average_transaction_value", response_model=float)
 async def get_average_transaction_value(
     user_id: str,
-    db: AsyncSession = Depends(get_db),
-    background_tasks: BackgroundTasks = None
+    request: Request,
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Retrieve the average transaction value for a specific user, converted from pesewas to GHC."""
     try:
-        # Trigger cache refresh periodically
-        background_tasks.add_task(AnalyticsService.refresh_cache_periodically, db, user_id)
+        # Keep this user's cache warm while they stay active
+        refresh_scheduler.track(user_id)
+
+        async def build():
+            return await AnalyticsService.get_average_transaction_value(db, user_id)
+
+        key = AnalyticsService.response_key(user_id, "average_transaction_value")
+        return await response_cache.respond(request, key, build, AnalyticsService.CACHE_EXPIRY)
+    except AnalyticsDataNotFoundException as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=e.detail)
+    except AnalyticsComputationErrorException as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=e.detail)
+    except DatabaseErrorException as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=e.detail)
+
+@router.get("/{user_id}/median_transaction_value", response_model=float)
+async def get_median_transaction_value(
+    user_id: str,
+    request: Request,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Retrieve the approximate median transaction value for a specific user, converted from pesewas to GHC."""
+    try:
+        async def build():
+            return await AnalyticsService.get_median_transaction_value(db, user_id)
+
+        key = AnalyticsService.response_key(user_id, "median_transaction_value")
+        return await response_cache.respond(request, key, build, AnalyticsService.CACHE_EXPIRY)
+    except AnalyticsDataNotFoundException as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=e.detail)
+    except AnalyticsComputationErrorException as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=e.detail)
+    except DatabaseErrorException as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=e.detail)
+
+@router.get("/{user_id}/transaction_value_percentiles", response_model=Dict[str, float])
+async def get_transaction_value_percentiles(
+    user_id: str,
+    request: Request,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Retrieve the approximate median, p90 and p99 transaction values for a specific user, converted from pesewas to GHC."""
+    try:
+        async def build():
+            return await AnalyticsService.get_transaction_value_percentiles(db, user_id)
 
-        average_value = await AnalyticsService.get_average_transaction_value(db, user_id)
-        return average_value
+        key = AnalyticsService.response_key(user_id, "transaction_value_percentiles")
+        return await response_cache.respond(request, key, build, AnalyticsService.CACHE_EXPIRY)
     except AnalyticsDataNotFoundException as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=e.detail)
     except AnalyticsComputationErrorException as e:
@@ -35,16 +119,20 @@ async def get_average_transaction_value(
 @router.get("/{user_id}/highest_transaction_day", response_model=Dict[str, Optional[str]])
 async def get_highest_transaction_day(
     user_id: str,
-    db: AsyncSession = Depends(get_db),
-    background_tasks: BackgroundTasks = None
+    request: Request,
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Retrieve the day with the highest number of transactions for a specific user."""
     try:
-        # Trigger cache refresh periodically
-        background_tasks.add_task(AnalyticsService.refresh_cache_periodically, db, user_id)
+        # Keep this user's cache warm while they stay active
+        refresh_scheduler.track(user_id)
+
+        async def build():
+            highest_day = await AnalyticsService.get_highest_transaction_day(db, user_id)
+            return {"highest_transaction_day": highest_day.isoformat() if highest_day else None}
 
-        highest_day = await AnalyticsService.get_highest_transaction_day(db, user_id)
-        return {"highest_transaction_day": highest_day.isoformat() if highest_day else None}
+        key = AnalyticsService.response_key(user_id, "highest_transaction_day")
+        return await response_cache.respond(request, key, build, AnalyticsService.CACHE_EXPIRY)
     except AnalyticsDataNotFoundException as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=e.detail)
     except AnalyticsComputationErrorException as e:
@@ -55,18 +143,50 @@ async def get_highest_transaction_day(
 @router.get("/{user_id}/transaction_totals", response_model=Dict[str, float])
 async def get_transaction_totals(
     user_id: str,
+    request: Request,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    db: AsyncSession = Depends(get_db),
-    background_tasks: BackgroundTasks = None
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Retrieve the total value of debit and credit transactions for a specific user over an optional date range, converted from pesewas to GHC."""
     try:
-        # Trigger cache refresh periodically
-        background_tasks.add_task(AnalyticsService.refresh_cache_periodically, db, user_id)
+        # Keep this user's cache warm while they stay active
+        refresh_scheduler.track(user_id)
+
+        async def build():
+            return await AnalyticsService.get_transaction_totals(db, user_id, start_date, end_date)
+
+        key = AnalyticsService.response_key(user_id, "transaction_totals", start_date, end_date)
+        return await response_cache.respond(request, key, build, AnalyticsService.CACHE_EXPIRY)
+    except AnalyticsDataNotFoundException as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=e.detail)
+    except AnalyticsComputationErrorException as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=e.detail)
+    except DatabaseErrorException as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=e.detail)
+
+@router.get("/{user_id}/time_series", response_model=AnalyticsTimeSeries)
+async def get_time_series(
+    user_id: str,
+    request: Request,
+    interval: AnalyticsInterval = "day",
+    window: int = Query(7, ge=2, le=365),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Retrieve a user's per-day, per-week or per-month credit/debit totals (GHC) and counts, with the rolling average and volatility of the net amount over `window` buckets."""
+    try:
+        # Checked before the cache or the database is touched
+        AnalyticsService.check_time_series_range(interval, start_date, end_date)
+
+        async def build():
+            return await AnalyticsService.get_time_series(db, user_id, interval, window, start_date, end_date)
 
-        totals = await AnalyticsService.get_transaction_totals(db, user_id, start_date, end_date)
-        return totals
+        key = AnalyticsService.time_series_key(user_id, interval, window, start_date, end_date)
+        return await response_cache.respond(request, key, build, AnalyticsService.CACHE_EXPIRY)
+    except InvalidAnalyticsRangeException as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.detail)
     except AnalyticsDataNotFoundException as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=e.detail)
     except AnalyticsComputationErrorException as e:
@@ -20,7 +20,7 @@ async def login(user_data: UserLogin, db: AsyncSession = Depends(get_db)):
     return {"message": "OTP sent for verification", "otp": otp}
 
 @router.post("/verify-otp", response_model=Token)
-async def verify_otp(otp_data: OTPVerify, db: AsyncSession = Depends(get_db)):
+async def verify_otp(otp_data: OTPVerify):
     """Verify OTP and issue JWT token upon successful verification."""
-    token = await AuthService.verify_otp(db, otp_data)
+    token = await AuthService.verify_otp(otp_data)
     return {"access_token": token, "token_type": "bearer"}
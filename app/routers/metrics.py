@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.utils.metrics import CONTENT_TYPE, registry
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Expose request latency histograms, cache hit/miss counters and DB statement timings in Prometheus text format."""
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,46 @@
+from fastapi import APIRouter
+from typing import Dict, Any
+from app.core.principal_cache import principal_cache
+from app.core.security import crypto_executor
+from app.db.session import replica_router
+from app.services.outbox_worker import outbox_worker
+from app.services.refresh_scheduler import refresh_scheduler
+from app.utils.cache import cache
+from app.utils.rate_limit import rate_limiter
+
+router = APIRouter()
+
+@router.get("/refresh_scheduler", response_model=Dict[str, Any])
+async def get_refresh_scheduler_stats():
+    """Report the analytics refresh scheduler's tracked users, queue depth and lag."""
+    return refresh_scheduler.stats()
+
+@router.get("/cache", response_model=Dict[str, Any])
+async def get_cache_stats():
+    """Report hit, miss and eviction counters for the in-process (l1) and Redis (l2) cache tiers."""
+    return cache.stats()
+
+@router.get("/db_pool", response_model=Dict[str, Any])
+async def get_db_pool_stats():
+    """Report checked-out connections, checkout wait times, overflow events and timeouts for the writer and replica pools."""
+    return replica_router.stats()
+
+@router.get("/outbox", response_model=Dict[str, Any])
+async def get_outbox_stats():
+    """Report the outbox backlog (pending, unacknowledged and dead-lettered events, oldest age) and the worker's drain rate."""
+    return await outbox_worker.stats()
+
+@router.get("/crypto_pool", response_model=Dict[str, Any])
+async def get_crypto_pool_stats():
+    """Report the password hashing and encryption pool's queue depth, rejections, queue wait and run times."""
+    return crypto_executor.report()
+
+@router.get("/principal_cache", response_model=Dict[str, Any])
+async def get_principal_cache_stats():
+    """Report the authenticated-user cache's hit ratio and the auth-stage latency on hits and misses."""
+    return principal_cache.stats()
+
+@router.get("/rate_limit", response_model=Dict[str, Any])
+async def get_rate_limit_stats():
+    """Report requests let through locally, Redis bucket checks, rejections and Redis errors of the rate limiter."""
+    return rate_limiter.stats()
@@ -1,8 +1,23 @@
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Query, Request, status
+from fastapi.responses import StreamingResponse
+from typing import Literal, Optional
 from sqlalchemy.orm import Session
-from app.schemas.transaction import TransactionCreate, TransactionUpdate, TransactionResponse
-from app.services.transaction_service import create_transaction, get_transaction, update_transaction, delete_transaction
-from app.db.session import get_db
+from app.schemas.transaction import TransactionCreate, TransactionUpdate, TransactionResponse, BulkTransactionResponse, TransactionPage
+from app.core.config import settings
+from app.services.transaction_service import (
+    create_transaction,
+    get_transaction,
+    update_transaction,
+    delete_transaction,
+    bulk_create_transactions,
+    parse_bulk_payload,
+    export_transactions,
+    list_transactions,
+    transaction_cache_key,
+    CACHE_TTL,
+)
+from app.utils.response_cache import response_cache
+from app.db.session import get_db, get_read_db
 from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter()
@@ -12,10 +27,51 @@ async def create_transaction_route(transaction_data: TransactionCreate, db: Sess
     new_transaction = await create_transaction(db, transaction_data)
     return new_transaction
 
+@router.get("/", response_model=TransactionPage)
+async def list_transactions_route(
+    user_id: str,
+    before: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=settings.TRANSACTION_PAGE_MAX_LIMIT),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """List a user's transactions newest first. Pass the returned next_cursor as `before` to get the next page."""
+    return await list_transactions(db, user_id, before, limit)
+
+@router.post(
+    "/bulk",
+    response_model=BulkTransactionResponse,
+    openapi_extra={
+        "requestBody": {
+            "content": {
+                "application/json": {"schema": {"type": "array", "items": {"type": "object"}}},
+                "application/x-ndjson": {"schema": {"type": "string"}},
+            },
+            "required": True,
+        }
+    },
+)
+async def bulk_create_transactions_route(request: Request, db: AsyncSession = Depends(get_db)):
+    """Create many transactions from a JSON array or an NDJSON body, reporting a result per row."""
+    rows = parse_bulk_payload(await request.body(), request.headers.get("content-type"))
+    return await bulk_create_transactions(db, rows)
+
+@router.get("/export")
+async def export_transactions_route(
+    user_id: str,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    after: Optional[str] = None
+):
+    """Stream a user's full transaction history as NDJSON or CSV, resumable from a row's cursor."""
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    headers = {"Content-Disposition": f'attachment; filename="transactions-{user_id}.{format}"'}
+    return StreamingResponse(export_transactions(user_id, format, after), media_type=media_type, headers=headers)
+
 @router.get("/{transaction_id}", response_model=TransactionResponse)
-async def get_transaction_route(transaction_id: str, db: Session = Depends(get_db)):
-    transaction = await get_transaction(db, transaction_id)
-    return transaction
+async def get_transaction_route(transaction_id: str, request: Request, db: Session = Depends(get_db)):
+    async def build():
+        return await get_transaction(db, transaction_id)
+
+    return await response_cache.respond(request, transaction_cache_key(transaction_id), build, CACHE_TTL)
 
 @router.put("/{transaction_id}", response_model=TransactionResponse)
 async def update_transaction_route(
@@ -0,0 +1,35 @@
+from pydantic import BaseModel, Field
+from datetime import date
+from typing import Any, Dict, List, Literal, Optional
+from uuid import UUID
+from app.core.config import settings
+
+class AnalyticsSummary(BaseModel):
+    transaction_count: int
+    average_transaction_value: float  # GHC
+    credit_total: float  # GHC
+    debit_total: float  # GHC
+    highest_transaction_day: Optional[date] = None
+
+AnalyticsMetric = Literal["transaction_count", "average_transaction_value", "credit_total", "debit_total", "highest_transaction_day"]
+
+class AnalyticsBatchRequest(BaseModel):
+    user_ids: List[UUID] = Field(..., min_length=1, max_length=int(settings.ANALYTICS_BATCH_MAX_USERS))
+    metrics: List[AnalyticsMetric] = Field(..., min_length=1)
+
+class AnalyticsBatchResponse(BaseModel):
+    results: Dict[str, Dict[str, Any]]
+
+AnalyticsInterval = Literal["day", "week", "month"]
+
+class AnalyticsTimeSeries(BaseModel):
+    """Column-oriented series: element i of every list belongs to the bucket starting at period_start[i]."""
+    interval: AnalyticsInterval
+    window: int
+    period_start: List[date]
+    transaction_count: List[int]
+    credit_total: List[float]  # GHC
+    debit_total: List[float]  # GHC
+    net_total: List[float]  # GHC, credit minus debit
+    rolling_average: List[Optional[float]]  # GHC, mean net_total over the trailing window; None until the window is full
+    rolling_volatility: List[Optional[float]]  # GHC, sample standard deviation of net_total over the trailing window
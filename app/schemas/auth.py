@@ -1,3 +1,4 @@
+from uuid import UUID
 from pydantic import BaseModel, EmailStr
 
 class UserRegister(BaseModel):
@@ -16,3 +17,9 @@ class OTPVerify(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str = "bearer"
+
+class Principal(BaseModel):
+    """The authenticated user as seen by request handlers, with the full name already decrypted."""
+    id: UUID
+    email: EmailStr
+    full_name: str
@@ -2,7 +2,7 @@ from pydantic import BaseModel, conint, validator
 from uuid import UUID
 from enum import Enum
 from datetime import datetime
-from typing import Literal, Optional,Any
+from typing import Literal, Optional, Any, List, Dict
 from uuid import uuid4
 
 class TransactionTypeEnum(str, Enum):
@@ -51,3 +51,18 @@ class TransactionResponse(BaseModel):
     class Config:
         orm_mode = True
         from_attributes = True
+
+class BulkTransactionResult(BaseModel):
+    index: int
+    status: Literal["created", "invalid", "failed"]
+    id: Optional[str] = None
+    errors: Optional[List[Dict[str, Any]]] = None
+
+class BulkTransactionResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkTransactionResult]
+
+class TransactionPage(BaseModel):
+    items: List[TransactionResponse]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,49 @@
+"""
+Verify or rebuild the per-user transaction aggregates and quantile sketches.
+
+Usage:
+    python -m app.scripts.aggregates verify [--user-id USER_ID]
+    python -m app.scripts.aggregates rebuild [--user-id USER_ID]
+    python -m app.scripts.aggregates rebuild-sketches [--user-id USER_ID]
+
+`verify` exits with status 1 when any stored aggregate differs from the raw transactions table.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from app.db.session import AsyncSessionLocal, engine
+from app.services.aggregate_service import rebuild_aggregates, verify_aggregates
+from app.services.sketch_service import rebuild_sketches
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def run(command: str, user_id: str = None) -> int:
+    try:
+        async with AsyncSessionLocal() as session:
+            if command == "rebuild":
+                await rebuild_aggregates(session, user_id)
+                return 0
+            if command == "rebuild-sketches":
+                await rebuild_sketches(session, user_id)
+                return 0
+
+            mismatches = await verify_aggregates(session, user_id)
+            for mismatch in mismatches:
+                print(json.dumps(mismatch))
+            return 1 if mismatches else 0
+    finally:
+        await engine.dispose()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Verify or rebuild per-user transaction aggregates and quantile sketches.")
+    parser.add_argument("command", choices=["verify", "rebuild", "rebuild-sketches"])
+    parser.add_argument("--user-id", default=None, help="Limit the operation to a single user.")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.command, args.user_id)))
+
+if __name__ == "__main__":
+    main()
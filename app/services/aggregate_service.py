@@ -0,0 +1,352 @@
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import Date, and_, case, cast, delete, func, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.models import OutboxEvent, Transaction, TransactionType, UserDailyTransactionRollup, UserTransactionAggregate
+
+logger = logging.getLogger(__name__)
+
+AGGREGATE_COLUMNS = ("transaction_count", "total_amount", "credit_amount", "debit_amount")
+ROLLUP_COLUMNS = ("transaction_count", "credit_amount", "debit_amount")
+
+
+def _type_value(transaction_type) -> str:
+    # Accepts both the ORM enum and the schema enum (or a raw string)
+    return getattr(transaction_type, "value", transaction_type)
+
+def transaction_delta(user_id, transaction_date: datetime, transaction_amount: int, transaction_type, sign: int = 1) -> Dict:
+    """
+    Builds the aggregate delta for a single transaction.
+    :param sign: 1 when the transaction is added, -1 when it is removed.
+    """
+    amount = sign * transaction_amount
+    is_credit = _type_value(transaction_type) == TransactionType.CREDIT.value
+    return {
+        "user_id": user_id,
+        "day": transaction_date.date(),
+        "transaction_count": sign,
+        "total_amount": amount,
+        "credit_amount": amount if is_credit else 0,
+        "debit_amount": 0 if is_credit else amount,
+    }
+
+def _merge(deltas: Iterable[Dict], key_columns: Tuple[str, ...], value_columns: Tuple[str, ...]) -> List[Dict]:
+    merged: Dict[tuple, Dict] = {}
+    for delta in deltas:
+        key = tuple(str(delta[column]) for column in key_columns)
+        if key not in merged:
+            merged[key] = {column: delta[column] for column in key_columns + value_columns}
+            continue
+        for column in value_columns:
+            merged[key][column] += delta[column]
+    # An update that nets out to zero needs no write
+    return [row for row in merged.values() if any(row[column] for column in value_columns)]
+
+def merge_deltas(deltas: Iterable[Dict]) -> List[Dict]:
+    """Collapses deltas so that each user appears once, as ON CONFLICT requires."""
+    return _merge(deltas, ("user_id",), AGGREGATE_COLUMNS)
+
+def merge_daily_deltas(deltas: Iterable[Dict]) -> List[Dict]:
+    """Collapses deltas so that each (user, day) appears once."""
+    return _merge(deltas, ("user_id", "day"), ROLLUP_COLUMNS)
+
+async def apply_deltas(db: AsyncSession, deltas: Iterable[Dict]) -> None:
+    """
+    Upserts the deltas into user_transaction_aggregates and user_daily_transaction_rollups.
+    Runs inside the caller's transaction, so both tables commit (or roll back) with the write itself.
+    """
+    deltas = list(deltas)
+
+    rows = merge_deltas(deltas)
+    if rows:
+        stmt = insert(UserTransactionAggregate).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UserTransactionAggregate.user_id],
+            set_={
+                "transaction_count": UserTransactionAggregate.transaction_count + stmt.excluded.transaction_count,
+                "total_amount": UserTransactionAggregate.total_amount + stmt.excluded.total_amount,
+                "credit_amount": UserTransactionAggregate.credit_amount + stmt.excluded.credit_amount,
+                "debit_amount": UserTransactionAggregate.debit_amount + stmt.excluded.debit_amount,
+                "updated_at": func.now(),
+            },
+        )
+        await db.execute(stmt)
+
+    daily_rows = merge_daily_deltas(deltas)
+    if daily_rows:
+        stmt = insert(UserDailyTransactionRollup).values(daily_rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UserDailyTransactionRollup.user_id, UserDailyTransactionRollup.day],
+            set_={
+                "transaction_count": UserDailyTransactionRollup.transaction_count + stmt.excluded.transaction_count,
+                "credit_amount": UserDailyTransactionRollup.credit_amount + stmt.excluded.credit_amount,
+                "debit_amount": UserDailyTransactionRollup.debit_amount + stmt.excluded.debit_amount,
+            },
+        )
+        await db.execute(stmt)
+
+async def get_user_summaries(db: AsyncSession, user_ids: List[str]) -> Dict[str, Dict]:
+    """
+    Reads the running totals and highest day of several users in a single statement: a CTE ranks each
+    user's day rollups with a window function partitioned by user, and the top-ranked day is joined to
+    the users' aggregate rows.
+    :return: Per user id, transaction_count, total_amount, credit_amount, debit_amount (pesewas) and
+             highest_day. Users without an aggregate row are left out.
+    """
+    ranked_days = (
+        select(
+            UserDailyTransactionRollup.user_id,
+            UserDailyTransactionRollup.day,
+            func.row_number().over(
+                partition_by=UserDailyTransactionRollup.user_id,
+                order_by=(UserDailyTransactionRollup.transaction_count.desc(), UserDailyTransactionRollup.day),
+            ).label("rank"),
+        )
+        .where(UserDailyTransactionRollup.user_id.in_(user_ids), UserDailyTransactionRollup.transaction_count > 0)
+        .cte("ranked_days")
+    )
+    result = await db.execute(
+        select(
+            UserTransactionAggregate.user_id,
+            UserTransactionAggregate.transaction_count,
+            UserTransactionAggregate.total_amount,
+            UserTransactionAggregate.credit_amount,
+            UserTransactionAggregate.debit_amount,
+            ranked_days.c.day.label("highest_day"),
+        )
+        .outerjoin(ranked_days, and_(ranked_days.c.user_id == UserTransactionAggregate.user_id, ranked_days.c.rank == 1))
+        .where(UserTransactionAggregate.user_id.in_(user_ids))
+    )
+    return {str(row.user_id): {column: value for column, value in row._mapping.items() if column != "user_id"} for row in result.all()}
+
+async def get_user_summary(db: AsyncSession, user_id: str) -> Optional[Dict]:
+    """Single-user form of get_user_summaries; None when the user has no aggregate row."""
+    return (await get_user_summaries(db, [user_id])).get(str(user_id))
+
+def split_range(start: Optional[datetime], end: Optional[datetime]):
+    """
+    Splits the half-open range [start, end) into whole days and partial edges.
+    :return: (days, edges). days is a (first_day, end_day) pair served by the daily rollup, either bound
+             None when open, or None when the range holds no whole day. edges are (start, end) pairs
+             that must be read from raw transactions.
+    """
+    first_day = None
+    if start is not None:
+        first_day = start.date() if start.time() == time.min else start.date() + timedelta(days=1)
+    end_day = end.date() if end is not None else None
+
+    if first_day is not None and end_day is not None and first_day >= end_day:
+        return None, ([(start, end)] if start < end else [])
+
+    edges = []
+    if start is not None and start.time() != time.min:
+        edges.append((start, datetime.combine(first_day, time.min)))
+    if end is not None and end.time() != time.min:
+        edges.append((datetime.combine(end_day, time.min), end))
+    return (first_day, end_day), edges
+
+async def get_range_totals(db: AsyncSession, user_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Sums the transaction count and credit/debit amounts (in pesewas) over [start, end).
+    Whole days come from the daily rollup; raw rows are read only for partial days at the edges.
+    """
+    totals = {"transaction_count": 0, "credit_amount": 0, "debit_amount": 0}
+    days, edges = split_range(start, end)
+
+    if days is not None:
+        first_day, end_day = days
+        query = select(
+            func.coalesce(func.sum(UserDailyTransactionRollup.transaction_count), 0),
+            func.coalesce(func.sum(UserDailyTransactionRollup.credit_amount), 0),
+            func.coalesce(func.sum(UserDailyTransactionRollup.debit_amount), 0),
+        ).where(UserDailyTransactionRollup.user_id == user_id)
+        if first_day is not None:
+            query = query.where(UserDailyTransactionRollup.day >= first_day)
+        if end_day is not None:
+            query = query.where(UserDailyTransactionRollup.day < end_day)
+        count, credit, debit = (await db.execute(query)).one()
+        totals["transaction_count"] += int(count)
+        totals["credit_amount"] += int(credit)
+        totals["debit_amount"] += int(debit)
+
+    for edge_start, edge_end in edges:
+        result = await db.execute(
+            select(
+                Transaction.transaction_type,
+                func.count(Transaction.id).label("transaction_count"),
+                func.sum(Transaction.transaction_amount).label("total_amount"),
+            )
+            .where(
+                Transaction.user_id == user_id,
+                Transaction.transaction_date >= edge_start,
+                Transaction.transaction_date < edge_end,
+            )
+            .group_by(Transaction.transaction_type)
+        )
+        for row in result.all():
+            totals["transaction_count"] += row.transaction_count
+            column = "credit_amount" if _type_value(row.transaction_type) == TransactionType.CREDIT.value else "debit_amount"
+            totals[column] += int(row.total_amount or 0)
+
+    return totals
+
+async def get_daily_rollups(db: AsyncSession, user_id: str, first_day: Optional[date] = None, end_day: Optional[date] = None) -> List[Tuple]:
+    """
+    Reads a user's daily rollup rows in one query, oldest first.
+    :param end_day: Exclusive upper bound.
+    :return: (day, transaction_count, credit_amount, debit_amount) tuples, amounts in pesewas.
+    """
+    query = (
+        select(
+            UserDailyTransactionRollup.day,
+            UserDailyTransactionRollup.transaction_count,
+            UserDailyTransactionRollup.credit_amount,
+            UserDailyTransactionRollup.debit_amount,
+        )
+        .where(UserDailyTransactionRollup.user_id == user_id, UserDailyTransactionRollup.transaction_count > 0)
+        .order_by(UserDailyTransactionRollup.day)
+    )
+    if first_day is not None:
+        query = query.where(UserDailyTransactionRollup.day >= first_day)
+    if end_day is not None:
+        query = query.where(UserDailyTransactionRollup.day < end_day)
+    result = await db.execute(query)
+    return [tuple(row) for row in result.all()]
+
+def _raw_aggregates_query(user_id: Optional[str] = None):
+    credit = TransactionType.CREDIT
+    query = select(
+        Transaction.user_id,
+        func.count(Transaction.id).label("transaction_count"),
+        func.coalesce(func.sum(Transaction.transaction_amount), 0).label("total_amount"),
+        func.coalesce(func.sum(case((Transaction.transaction_type == credit, Transaction.transaction_amount), else_=0)), 0).label("credit_amount"),
+        func.coalesce(func.sum(case((Transaction.transaction_type != credit, Transaction.transaction_amount), else_=0)), 0).label("debit_amount"),
+    ).group_by(Transaction.user_id)
+    if user_id:
+        query = query.where(Transaction.user_id == user_id)
+    return query
+
+def _raw_daily_rollups_query(user_id: Optional[str] = None):
+    credit = TransactionType.CREDIT
+    day = cast(Transaction.transaction_date, Date)
+    query = select(
+        Transaction.user_id,
+        day.label("day"),
+        func.count(Transaction.id).label("transaction_count"),
+        func.coalesce(func.sum(case((Transaction.transaction_type == credit, Transaction.transaction_amount), else_=0)), 0).label("credit_amount"),
+        func.coalesce(func.sum(case((Transaction.transaction_type != credit, Transaction.transaction_amount), else_=0)), 0).label("debit_amount"),
+    ).group_by(Transaction.user_id, day)
+    if user_id:
+        query = query.where(Transaction.user_id == user_id)
+    return query
+
+async def _compare(db: AsyncSession, model, raw_query, key_columns: Tuple[str, ...], value_columns: Tuple[str, ...], user_id: Optional[str]) -> List[Dict]:
+    def key_of(row):
+        return tuple(str(getattr(row, column)) for column in key_columns)
+
+    stored_query = select(model)
+    if user_id:
+        stored_query = stored_query.where(model.user_id == user_id)
+
+    raw_result = await db.execute(raw_query)
+    raw = {key_of(row): {c: int(getattr(row, c)) for c in value_columns} for row in raw_result.all()}
+    stored_result = await db.execute(stored_query)
+    stored = {key_of(row): {c: int(getattr(row, c)) for c in value_columns} for row in stored_result.scalars().all()}
+
+    empty = dict.fromkeys(value_columns, 0)
+    mismatches = []
+    for key in sorted(raw.keys() | stored.keys()):
+        expected = raw.get(key, empty)
+        actual = stored.get(key, empty)
+        if expected != actual:
+            mismatches.append({"table": model.__tablename__, **dict(zip(key_columns, key)), "expected": expected, "actual": actual})
+    return mismatches
+
+async def subtract_history(db, start: date, end: date) -> List[str]:
+    """
+    Takes the transactions dated in [start, end) out of the aggregates and daily rollups inside the caller's
+    transaction, so they keep describing only the transactions still in the table, as when a partition is
+    detached. The raw rows are subtracted rather than the stored rollups: an outbox event still pending for
+    one of them then nets the rollup to zero when it is applied.
+    :return: The users who had transactions in the range.
+    """
+    in_range = and_(Transaction.transaction_date >= start, Transaction.transaction_date < end)
+    users = (await db.execute(select(Transaction.user_id).where(in_range).distinct())).scalars().all()
+
+    for model, raw_query, key_columns, value_columns, touched in (
+        (UserTransactionAggregate, _raw_aggregates_query(), ("user_id",), AGGREGATE_COLUMNS, {"updated_at": func.now()}),
+        (UserDailyTransactionRollup, _raw_daily_rollups_query(), ("user_id", "day"), ROLLUP_COLUMNS, {}),
+    ):
+        raw = raw_query.where(in_range).subquery()
+        stmt = insert(model).from_select(
+            list(key_columns + value_columns),
+            select(*(raw.c[column] for column in key_columns), *(-raw.c[column] for column in value_columns)),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[getattr(model, column) for column in key_columns],
+            set_={**{column: getattr(model, column) + stmt.excluded[column] for column in value_columns}, **touched},
+        )
+        await db.execute(stmt)
+
+    await db.execute(delete(UserDailyTransactionRollup).where(
+        UserDailyTransactionRollup.day >= start,
+        UserDailyTransactionRollup.day < end,
+        *(getattr(UserDailyTransactionRollup, column) == 0 for column in ROLLUP_COLUMNS),
+    ))
+    logger.info("Subtracted transactions dated %s - %s from the aggregates of %s users", start, end, len(users))
+    return [str(user) for user in users]
+
+async def verify_aggregates(db: AsyncSession, user_id: Optional[str] = None) -> List[Dict]:
+    """
+    Compares the stored aggregates and daily rollups with the raw transactions table.
+    Writes whose outbox events are still pending show up as mismatches until the outbox worker applies them.
+    :return: One entry per user (or user/day) whose stored row differs from the raw totals.
+    """
+    mismatches = await _compare(db, UserTransactionAggregate, _raw_aggregates_query(user_id), ("user_id",), AGGREGATE_COLUMNS, user_id)
+    mismatches += await _compare(db, UserDailyTransactionRollup, _raw_daily_rollups_query(user_id), ("user_id", "day"), ROLLUP_COLUMNS, user_id)
+    logger.info("Verified aggregates for user_id: %s, %s mismatches", user_id or "ALL", len(mismatches))
+    return mismatches
+
+async def aggregates_need_backfill(db) -> bool:
+    """
+    Whether transactions exist but no user has an aggregate row yet, as on a deployment that predates the
+    aggregates: every analytics endpoint would report zeros until `rebuild` is run.
+    """
+    result = await db.execute(select(
+        select(Transaction.id).exists(),
+        ~select(UserTransactionAggregate.user_id).exists(),
+    ))
+    has_transactions, no_aggregates = result.one()
+    return bool(has_transactions and no_aggregates)
+
+async def rebuild_aggregates(db: AsyncSession, user_id: Optional[str] = None) -> None:
+    """
+    Recomputes the aggregates and daily rollups from the raw transactions table and commits.
+    Writes to transactions are blocked while the rebuild runs so no delta is lost. Pending outbox events are
+    marked applied first, dead-lettered ones included, because the raw rows already include their changes.
+    """
+    logger.info("Rebuilding transaction aggregates for user_id: %s", user_id or "ALL")
+    await db.execute(text("LOCK TABLE transactions IN SHARE MODE"))
+
+    # Waits for a worker batch in flight, then claims what is left so it is not applied on top of the rebuild
+    mark_applied = update(OutboxEvent).where(OutboxEvent.applied.is_(False)).values(applied=True, dead_lettered=False)
+    if user_id:
+        mark_applied = mark_applied.where(OutboxEvent.user_id == user_id)
+    await db.execute(mark_applied)
+
+    for model, raw_query, columns in (
+        (UserTransactionAggregate, _raw_aggregates_query(user_id), ("user_id",) + AGGREGATE_COLUMNS),
+        (UserDailyTransactionRollup, _raw_daily_rollups_query(user_id), ("user_id", "day") + ROLLUP_COLUMNS),
+    ):
+        clear = delete(model)
+        if user_id:
+            clear = clear.where(model.user_id == user_id)
+        await db.execute(clear)
+
+        raw = raw_query.subquery()
+        await db.execute(insert(model).from_select(list(columns), select(*(raw.c[column] for column in columns))))
+
+    await db.commit()
+    logger.info("Rebuilt transaction aggregates for user_id: %s", user_id or "ALL")
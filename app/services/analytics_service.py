@@ -1,132 +1,296 @@
-import asyncio
-from datetime import date, datetime, timedelta
+from datetime import date, datetime, time, timedelta
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import func, select
-from typing import Optional, Dict
+from typing import Any, Awaitable, Callable, List, Optional, Dict
+from app.core.config import settings
 from app.db.models import Transaction
-from app.utils.cache import cache
+from app.db.session import read_session
+from app.utils.cache import MISSING, cache
+from app.utils import timeseries
+from app.utils.metrics import registry
+from app.schemas.analytics import AnalyticsSummary, AnalyticsTimeSeries
+from app.services.aggregate_service import get_daily_rollups, get_range_totals, get_user_summaries, get_user_summary
+from app.services.sketch_service import load_sketch, request_rebuild, scan_sketch
 from app.custom_exceptions.exceptions import (
     DatabaseErrorException,
     CacheErrorException,
     AnalyticsDataNotFoundException,
-    AnalyticsComputationErrorException
+    AnalyticsComputationErrorException,
+    InvalidAnalyticsRangeException
 )
 import logging
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+ANALYTICS_CACHE_LOOKUPS = registry.counter(
+    "analytics_cache_lookups_total", "Analytics values served from the cache (hit) or computed (miss), by service method", ("method", "result")
+)
+
 class AnalyticsService:
     CACHE_EXPIRY = 100
+    # Seconds an expired entry may still be served while one background refresh replaces it
+    STALE_WHILE_REVALIDATE = int(settings.ANALYTICS_STALE_WHILE_REVALIDATE_SECONDS)
+    # Ranks served by the percentile endpoints: median, p90 and p99
+    PERCENTILES = (0.5, 0.9, 0.99)
 
     @staticmethod
-    async def get_average_transaction_value(db: AsyncSession, user_id: str) -> float:
-        cache_key = f"average_transaction_value:{user_id}"
-        logger.info("Calculating average transaction value for user_id: %s", user_id)
+    def generation_key(user_id: str) -> str:
+        """Key of the per-user counter that is bumped on every write to the user's transactions."""
+        return f"analytics_generation:{user_id}"
+
+    @staticmethod
+    def cache_keys(user_id: str, generation: int, start_date: Optional[date] = None, end_date: Optional[date] = None) -> Dict[str, str]:
+        # Keys from older generations are never read again and expire with their TTL
+        return {
+            "summary": f"analytics_summary:{user_id}:g{generation}",
+            "average_transaction_value": f"average_transaction_value:{user_id}:g{generation}",
+            "highest_transaction_day": f"highest_transaction_day:{user_id}:g{generation}",
+            "transaction_totals": f"transaction_totals:{user_id}:g{generation}:{start_date}:{end_date}",
+            "transaction_value_percentiles": f"transaction_value_percentiles:{user_id}:g{generation}",
+            "median_transaction_value": f"median_transaction_value:{user_id}:g{generation}",
+        }
+
+    @staticmethod
+    async def current_cache_keys(user_id: str, start_date: Optional[date] = None, end_date: Optional[date] = None) -> Dict[str, str]:
+        generation = await cache.get_generation(AnalyticsService.generation_key(user_id))
+        return AnalyticsService.cache_keys(user_id, generation, start_date, end_date)
+
+    @staticmethod
+    async def response_key(user_id: str, name: str, start_date: Optional[date] = None, end_date: Optional[date] = None) -> str:
+        """Key of the cached HTTP response for one analytics endpoint; it moves with the user's generation."""
+        return (await AnalyticsService.current_cache_keys(user_id, start_date, end_date))[name]
+
+    @staticmethod
+    async def time_series_key(user_id: str, interval: str, window: int, start_date: Optional[date] = None, end_date: Optional[date] = None) -> str:
+        generation = await cache.get_generation(AnalyticsService.generation_key(user_id))
+        return f"time_series:{user_id}:g{generation}:{interval}:{window}:{start_date}:{end_date}"
+
+    @staticmethod
+    async def invalidate(user_id) -> None:
+        """Makes every cached analytics value of the user stale, including all date-range totals."""
+        generation = await cache.bump_generation(AnalyticsService.generation_key(user_id))
+        logger.info("Invalidated analytics cache for user_id: %s, generation: %s", user_id, generation)
+
+    @staticmethod
+    async def _cached(
+        db: AsyncSession,
+        user_id: str,
+        cache_key: str,
+        compute: Callable[[AsyncSession], Awaitable[Any]],
+        force_refresh: bool = False,
+        method: str = "unknown",
+    ) -> Any:
+        """
+        Serves `compute` through the cache with single-flight loading.
+        :param compute: Computes the value to cache from a session.
+        :param method: The public method asking, for the hit/miss counters.
+        """
+        computed = False
+
+        async def load():
+            nonlocal computed
+            computed = True
+            return await compute(db)
+
+        async def refresh():
+            # Background refreshes outlive the request, so they cannot borrow its session
+            async with await read_session(user_id) as session:
+                return await compute(session)
 
         try:
-            # Check cache first
-            cached_value = await cache.get_cache(cache_key)
-            if cached_value is not None:
-                logger.info("Cache hit for average transaction value, user_id: %s", user_id)
-                return float(cached_value["value"]) / 100  # Convert to GHC if cached
-
-            # Query for the average transaction amount
-            result = await db.execute(
-                select(func.avg(Transaction.transaction_amount)).where(Transaction.user_id == user_id)
+            return await cache.get_or_set(
+                cache_key,
+                load,
+                expire=AnalyticsService.CACHE_EXPIRY,
+                stale_ttl=AnalyticsService.STALE_WHILE_REVALIDATE,
+                refresh_loader=refresh,
+                force=force_refresh,
             )
-            average_value = result.scalar() or 0.0
-            average_value /= 100  # Convert to GHC
-            
-            # Cache the result in pesewas
-            await cache.set_cache(cache_key, {"value": int(average_value * 100)}, expire=AnalyticsService.CACHE_EXPIRY)
-            logger.info("Cached average transaction value for user_id: %s", user_id)
-            return average_value
+        finally:
+            ANALYTICS_CACHE_LOOKUPS.inc((method, "miss" if computed else "hit"))
+
+    @staticmethod
+    def _summary_entry(summary: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        # Shapes a get_user_summaries row into the cached summary entry (amounts in pesewas)
+        if summary is None:
+            return {"transaction_count": 0, "total_amount": 0, "credit_amount": 0, "debit_amount": 0, "highest_day": None}
+        return {**summary, "highest_day": summary["highest_day"].isoformat() if summary["highest_day"] else None}
+
+    @staticmethod
+    def _summary_model(summary: Dict[str, Any]) -> AnalyticsSummary:
+        count = summary["transaction_count"]
+        return AnalyticsSummary(
+            transaction_count=count,
+            average_transaction_value=summary["total_amount"] / count / 100 if count else 0.0,  # Convert to GHC
+            credit_total=summary["credit_amount"] / 100,
+            debit_total=summary["debit_amount"] / 100,
+            highest_transaction_day=summary["highest_day"],
+        )
+
+    @staticmethod
+    async def _summary(db: AsyncSession, user_id: str, force_refresh: bool = False, method: str = "get_summary") -> Dict[str, Any]:
+        """Gets the shared summary entry (amounts in pesewas) that backs every whole-history analytic."""
+        async def compute(session: AsyncSession) -> Dict[str, Any]:
+            # One statement over the running totals and day rollups instead of three scans of raw transactions
+            return AnalyticsService._summary_entry(await get_user_summary(session, user_id))
+
+        cache_key = (await AnalyticsService.current_cache_keys(user_id))["summary"]
+        return await AnalyticsService._cached(db, user_id, cache_key, compute, force_refresh, method)
+
+    @staticmethod
+    async def get_summary(db: AsyncSession, user_id: str, force_refresh: bool = False) -> AnalyticsSummary:
+        logger.info("Calculating analytics summary for user_id: %s", user_id)
+
+        try:
+            return AnalyticsService._summary_model(await AnalyticsService._summary(db, user_id, force_refresh))
+        except Exception as e:
+            logger.error("Error calculating analytics summary for user_id: %s, error: %s", user_id, str(e))
+            raise AnalyticsComputationErrorException(detail=str(e))
+
+    @staticmethod
+    async def get_batch(db: AsyncSession, user_ids: List[str], metrics: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Gets summary metrics for many users at once.
+        Cached summaries are read with one MGET, the misses are computed with one grouped query per chunk
+        of ANALYTICS_BATCH_CHUNK_SIZE users, and the results are written back in one pipeline.
+        :param metrics: AnalyticsSummary fields to return per user.
+        :return: The requested metrics per user id.
+        """
+        logger.info("Calculating batch analytics for %s users, metrics: %s", len(user_ids), ", ".join(metrics))
+
+        try:
+            generations = await cache.get_generations([AnalyticsService.generation_key(user_id) for user_id in user_ids])
+            keys = [AnalyticsService.cache_keys(user_id, generation)["summary"] for user_id, generation in zip(user_ids, generations)]
+            cached = await cache.get_many(keys)
+
+            summaries = {user_id: entry for user_id, entry in zip(user_ids, cached) if entry is not MISSING}
+            misses = [(user_id, key) for user_id, key, entry in zip(user_ids, keys, cached) if entry is MISSING]
+            ANALYTICS_CACHE_LOOKUPS.inc(("get_batch", "hit"), len(user_ids) - len(misses))
+            ANALYTICS_CACHE_LOOKUPS.inc(("get_batch", "miss"), len(misses))
+
+            computed = {}
+            chunk_size = int(settings.ANALYTICS_BATCH_CHUNK_SIZE)
+            for start in range(0, len(misses), chunk_size):
+                chunk = misses[start:start + chunk_size]
+                rows = await get_user_summaries(db, [user_id for user_id, _ in chunk])
+                for user_id, key in chunk:
+                    summaries[user_id] = computed[key] = AnalyticsService._summary_entry(rows.get(user_id))
+
+            await cache.set_many(computed, expire=AnalyticsService.CACHE_EXPIRY, stale_ttl=AnalyticsService.STALE_WHILE_REVALIDATE)
+            logger.info("Batch analytics: %s cached, %s computed", len(user_ids) - len(misses), len(misses))
+
+            return {
+                user_id: AnalyticsService._summary_model(summaries[user_id]).model_dump(include=set(metrics))
+                for user_id in user_ids
+            }
+        except Exception as e:
+            logger.error("Error calculating batch analytics, error: %s", str(e))
+            raise AnalyticsComputationErrorException(detail=str(e))
+
+    @staticmethod
+    async def _percentiles(db: AsyncSession, user_id: str, force_refresh: bool = False, method: str = "get_transaction_value_percentiles") -> Dict[str, Any]:
+        """Gets the shared percentiles entry (amounts in pesewas) computed from the user's quantile sketch."""
+        async def compute(session: AsyncSession) -> Dict[str, Any]:
+            sketch = await load_sketch(session, user_id)
+            if sketch is None:
+                # Not built yet, or still being rebuilt by the outbox worker after an update or delete. The scan
+                # reads the same session and is cached until the next write; the worker stores the real sketch
+                request_rebuild([user_id])
+                sketch = await scan_sketch(session, user_id)
+            if not sketch.n:
+                return {"transaction_count": 0}
+            median, p90, p99 = sketch.quantiles(AnalyticsService.PERCENTILES)
+            return {"transaction_count": sketch.n, "median": median, "p90": p90, "p99": p99}
+
+        cache_key = (await AnalyticsService.current_cache_keys(user_id))["transaction_value_percentiles"]
+        return await AnalyticsService._cached(db, user_id, cache_key, compute, force_refresh, method)
+
+    @staticmethod
+    async def get_transaction_value_percentiles(
+        db: AsyncSession, user_id: str, force_refresh: bool = False, method: str = "get_transaction_value_percentiles"
+    ) -> Dict[str, float]:
+        """
+        Gets the approximate median, p90 and p99 transaction value (GHC) from the user's KLL sketch.
+        Values are within about 1.7 / QUANTILE_SKETCH_K in rank of the exact percentiles.
+        :param method: The public method asking, for the hit/miss counters.
+        """
+        logger.info("Calculating transaction value percentiles for user_id: %s", user_id)
+
+        try:
+            percentiles = await AnalyticsService._percentiles(db, user_id, force_refresh, method)
+        except Exception as e:
+            logger.error("Error calculating transaction value percentiles for user_id: %s, error: %s", user_id, str(e))
+            raise AnalyticsComputationErrorException(detail=str(e))
+
+        if not percentiles["transaction_count"]:
+            logger.warning("No transactions found for user_id: %s", user_id)
+            raise AnalyticsDataNotFoundException(detail="No transactions found for the specified user")
+        return {name: percentiles[name] / 100 for name in ("median", "p90", "p99")}  # Convert to GHC
+
+    @staticmethod
+    async def get_median_transaction_value(db: AsyncSession, user_id: str, force_refresh: bool = False) -> float:
+        percentiles = await AnalyticsService.get_transaction_value_percentiles(db, user_id, force_refresh, "get_median_transaction_value")
+        return percentiles["median"]
+
+    @staticmethod
+    async def get_average_transaction_value(db: AsyncSession, user_id: str, force_refresh: bool = False) -> float:
+        logger.info("Calculating average transaction value for user_id: %s", user_id)
+
+        try:
+            summary = await AnalyticsService._summary(db, user_id, force_refresh, "get_average_transaction_value")
+            if not summary["transaction_count"]:
+                return 0.0
+            return summary["total_amount"] / summary["transaction_count"] / 100  # Convert to GHC
         except Exception as e:
             logger.error("Error calculating average transaction value for user_id: %s, error: %s", user_id, str(e))
             raise AnalyticsComputationErrorException(detail=str(e))
     
     @staticmethod
-    async def get_highest_transaction_day(db: AsyncSession, user_id: str) -> Optional[date]:
-        cache_key = f"highest_transaction_day:{user_id}"
+    async def get_highest_transaction_day(db: AsyncSession, user_id: str, force_refresh: bool = False) -> Optional[date]:
         logger.info("Finding highest transaction day for user_id: %s", user_id)
 
         try:
-            # Check cache first
-            cached_day = await cache.get_cache(cache_key)
-            if cached_day is not None:
-                logger.info("Cache hit for highest transaction day, user_id: %s", user_id)
-                return datetime.fromisoformat(cached_day["day"]).date()
-            
-            # Query for the day with the highest transaction count
-            result = await db.execute(
-                select(
-                    func.date_trunc('day', Transaction.transaction_date).label("day"),
-                    func.count(Transaction.id).label("transaction_count")
-                )
-                .where(Transaction.user_id == user_id)
-                .group_by("day")
-                .order_by(func.count(Transaction.id).desc())
-                .limit(1)
-            )
-            highest_transaction_day = result.first()
-            
-            if highest_transaction_day:
-                day = highest_transaction_day.day
-                await cache.set_cache(cache_key, {"day": day.isoformat()}, expire=AnalyticsService.CACHE_EXPIRY)
-                logger.info("Cached highest transaction day for user_id: %s", user_id)
-                return day.date()
-            else:
-                logger.warning("No transactions found for user_id: %s", user_id)
-                raise AnalyticsDataNotFoundException(detail="No transactions found for the specified user")
-        except AnalyticsDataNotFoundException:
-            raise
+            summary = await AnalyticsService._summary(db, user_id, force_refresh, "get_highest_transaction_day")
         except Exception as e:
             logger.error("Error finding highest transaction day for user_id: %s, error: %s", user_id, str(e))
             raise AnalyticsComputationErrorException(detail=str(e))
 
+        if not summary["highest_day"]:
+            logger.warning("No transactions found for user_id: %s", user_id)
+            raise AnalyticsDataNotFoundException(detail="No transactions found for the specified user")
+        return date.fromisoformat(summary["highest_day"])
+
     @staticmethod
-    async def get_transaction_totals(db: AsyncSession, user_id: str, start_date: Optional[date] = None, end_date: Optional[date] = None) -> Dict[str, float]:
-        cache_key = f"transaction_totals:{user_id}:{start_date}:{end_date}"
+    async def get_transaction_totals(db: AsyncSession, user_id: str, start_date: Optional[date] = None, end_date: Optional[date] = None, force_refresh: bool = False) -> Dict[str, float]:
         logger.info("Calculating transaction totals for user_id: %s within dates %s - %s", user_id, start_date, end_date)
 
-        try:
-            # Check cache first
-            cached_totals = await cache.get_cache(cache_key)
-            if cached_totals is not None:
-                logger.info("Cache hit for transaction totals, user_id: %s", user_id)
-                return {k: v / 100 for k, v in cached_totals.items()}
-            
-            # Query totals for credit and debit transactions
-            query = select(
-                Transaction.transaction_type,
-                func.sum(Transaction.transaction_amount).label("total_amount")
-            ).where(Transaction.user_id == user_id)
-            
-            if start_date:
-                query = query.where(Transaction.transaction_date >= datetime.combine(start_date, datetime.min.time()))
-            if end_date:
-                query = query.where(Transaction.transaction_date <= datetime.combine(end_date, datetime.max.time()))
-                
-            query = query.group_by(Transaction.transaction_type)
-            result = await db.execute(query)
-            
-            totals = {"credit": 0.0, "debit": 0.0}
-            rows = result.all()
-            if not rows:
+        if not start_date and not end_date:
+            # Whole-history totals come from the shared summary entry
+            try:
+                summary = await AnalyticsService._summary(db, user_id, force_refresh, "get_transaction_totals")
+            except Exception as e:
+                logger.error("Error calculating transaction totals for user_id: %s, error: %s", user_id, str(e))
+                raise AnalyticsComputationErrorException(detail=str(e))
+            if not summary["transaction_count"]:
+                logger.warning("No transactions found for user_id: %s", user_id)
+                raise AnalyticsDataNotFoundException(detail="No transactions found for the specified user within the given period")
+            return {"credit": summary["credit_amount"] / 100, "debit": summary["debit_amount"] / 100}
+
+        async def compute(session: AsyncSession) -> Dict[str, int]:
+            # Sum whole days from the daily rollup; end_date is inclusive
+            start = datetime.combine(start_date, time.min) if start_date else None
+            end = datetime.combine(end_date + timedelta(days=1), time.min) if end_date else None
+            range_totals = await get_range_totals(session, user_id, start, end)
+            if not range_totals["transaction_count"]:
                 logger.warning("No transactions found for user_id: %s within dates %s - %s", user_id, start_date, end_date)
                 raise AnalyticsDataNotFoundException(detail="No transactions found for the specified user within the given period")
-            
-            for row in rows:
-                ghc_value = (row.total_amount or 0) / 100  # Convert to GHC
-                if row.transaction_type.value == "CREDIT":
-                    totals["credit"] = ghc_value
-                elif row.transaction_type.value == "DEBIT":
-                    totals["debit"] = ghc_value
-            
-            await cache.set_cache(cache_key, {"credit": int(totals["credit"] * 100), "debit": int(totals["debit"] * 100)}, expire=AnalyticsService.CACHE_EXPIRY)
-            logger.info("Cached transaction totals for user_id: %s", user_id)
-            
-            return totals
+            return {"credit": range_totals["credit_amount"], "debit": range_totals["debit_amount"]}
+
+        try:
+            cache_key = (await AnalyticsService.current_cache_keys(user_id, start_date, end_date))["transaction_totals"]
+            cached_totals = await AnalyticsService._cached(db, user_id, cache_key, compute, force_refresh, "get_transaction_totals")
+            return {k: v / 100 for k, v in cached_totals.items()}  # Convert to GHC
         except AnalyticsDataNotFoundException:
             raise
         except Exception as e:
@@ -134,11 +298,73 @@ class AnalyticsService:
             raise AnalyticsComputationErrorException(detail=str(e))
 
     @staticmethod
-    async def refresh_cache_periodically(db: AsyncSession, user_id: str):
-        logger.info("Starting periodic cache refresh for user_id: %s", user_id)
-        while True:
-            await AnalyticsService.get_average_transaction_value(db, user_id)
-            await AnalyticsService.get_highest_transaction_day(db, user_id)
-            await AnalyticsService.get_transaction_totals(db, user_id)
-            logger.info("Refreshed analytics cache for user_id: %s", user_id)
-            await asyncio.sleep(100) 
+    def check_time_series_range(interval: str, start_date, end_date) -> None:
+        """
+        Rejects ranges that run backwards or span more than ANALYTICS_TIME_SERIES_MAX_BUCKETS buckets, since every
+        bucket in the range is materialized. A missing bound is checked once the user's rollups are read.
+        :raises InvalidAnalyticsRangeException: If the range is invalid.
+        """
+        if start_date is None or end_date is None:
+            return
+        if start_date > end_date:
+            raise InvalidAnalyticsRangeException(detail="start_date must not be after end_date")
+        if timeseries.bucket_count(start_date, end_date, interval) > int(settings.ANALYTICS_TIME_SERIES_MAX_BUCKETS):
+            raise InvalidAnalyticsRangeException(
+                detail=f"Date range spans more than {settings.ANALYTICS_TIME_SERIES_MAX_BUCKETS} {interval} buckets"
+            )
+
+    @staticmethod
+    async def get_time_series(
+        db: AsyncSession,
+        user_id: str,
+        interval: str = "day",
+        window: int = 7,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        force_refresh: bool = False,
+    ) -> AnalyticsTimeSeries:
+        """
+        Buckets a user's credit/debit sums and counts by day, week or month and adds the rolling average and
+        volatility of the net amount. The daily rollup rows are read once into NumPy arrays; bucketing and
+        rolling windows run on those arrays.
+        :param window: Number of buckets in each rolling window.
+        :param end_date: Last day included.
+        :raises InvalidAnalyticsRangeException: If the range runs backwards or has too many buckets.
+        """
+        AnalyticsService.check_time_series_range(interval, start_date, end_date)
+        logger.info("Calculating %s time series for user_id: %s, window: %s, dates %s - %s", interval, user_id, window, start_date, end_date)
+
+        async def compute(session: AsyncSession) -> Dict[str, Any]:
+            end_day = end_date + timedelta(days=1) if end_date else None
+            daily = timeseries.daily_arrays(await get_daily_rollups(session, user_id, start_date, end_day))
+            if not daily["transaction_count"].sum():
+                logger.warning("No transactions found for user_id: %s within dates %s - %s", user_id, start_date, end_date)
+                raise AnalyticsDataNotFoundException(detail="No transactions found for the specified user within the given period")
+            AnalyticsService.check_time_series_range(interval, start_date or daily["day"].min(), end_date or daily["day"].max())
+
+            buckets = timeseries.bucketize(daily, interval, start_date, end_date)
+            net = buckets["credit"] - buckets["debit"]
+            # Convert to GHC once per column; NaN marks buckets whose window is not full yet
+            rolling = {
+                "rolling_average": np.round(timeseries.rolling_mean(net, window) / 100, 2),
+                "rolling_volatility": np.round(timeseries.rolling_std(net, window) / 100, 2),
+            }
+            return {
+                "interval": interval,
+                "window": window,
+                "period_start": np.datetime_as_string(buckets["period_start"]).tolist(),
+                "transaction_count": buckets["transaction_count"].tolist(),
+                "credit_total": (buckets["credit"] / 100).tolist(),
+                "debit_total": (buckets["debit"] / 100).tolist(),
+                "net_total": (net / 100).tolist(),
+                **{name: [None if np.isnan(value) else value for value in values.tolist()] for name, values in rolling.items()},
+            }
+
+        try:
+            cache_key = await AnalyticsService.time_series_key(user_id, interval, window, start_date, end_date)
+            return AnalyticsTimeSeries(**await AnalyticsService._cached(db, user_id, cache_key, compute, force_refresh, "get_time_series"))
+        except (AnalyticsDataNotFoundException, InvalidAnalyticsRangeException):
+            raise
+        except Exception as e:
+            logger.error("Error calculating time series for user_id: %s, error: %s", user_id, str(e))
+            raise AnalyticsComputationErrorException(detail=str(e))
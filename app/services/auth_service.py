@@ -3,6 +3,8 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.models import User
 from app.core.security import security
+from app.core.principal_cache import principal_cache
+from app.services.otp_store import otp_store
 from sqlalchemy.future import select
 from fastapi import HTTPException, status
 from pydantic import EmailStr
@@ -23,8 +25,8 @@ class AuthService:
                 logger.warning("Registration failed: Email %s already registered.", user_data.email)
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered.")
             
-            hashed_password = security.hash_password(user_data.password)
-            hashed_full_name = security.encrypt(user_data.full_name)
+            hashed_password = await security.hash_password_async(user_data.password)
+            hashed_full_name = await security.encrypt_async(user_data.full_name)
             new_user = User(email=user_data.email, full_name=hashed_full_name, password=hashed_password)
             session.add(new_user)
             await session.commit()
@@ -39,35 +41,30 @@ class AuthService:
         result = await db.execute(query)
         user = result.scalars().first()
 
-        if not user or not security.verify_password(password, user.password):
+        if not user or not await security.verify_password_async(password, user.password):
             logger.warning("Login failed for email: %s, invalid credentials.", email)
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials.")
         
-        user.otp_code = security.generate_otp()
+        otp_code = security.generate_otp()
+        await otp_store.issue(email, user.id, otp_code)
         logger.info("Generated OTP for user with email: %s", email)
 
-        await db.commit()
-        await db.refresh(user)
-        
-        return user.otp_code  
+        return otp_code
 
     @staticmethod
-    async def verify_otp(db: AsyncSession, otp_data):
+    async def verify_otp(otp_data):
         logger.info("Verifying OTP for email: %s", otp_data.email)
-        query = select(User).filter(User.email == otp_data.email)
-        result = await db.execute(query)
-        user = result.scalars().first()
+        user_id = await otp_store.verify(otp_data.email, otp_data.otp)
 
-        if not user or user.otp_code != otp_data.otp:
+        if user_id is None:
             logger.warning("OTP verification failed for email: %s", otp_data.email)
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid OTP.")
-        
-        token_data = {"sub": user.email, "user_id": str(user.id)}
+
+        token_data = {"sub": otp_data.email, "user_id": user_id}
         token = security.create_access_token(data=token_data)
         logger.info("OTP verified successfully for email: %s, access token generated.", otp_data.email)
-        
-        user.otp_code = None
-        await db.commit()
-        logger.info("Cleared OTP for user with email: %s after successful verification", otp_data.email)
-        
+
+        # A fresh login re-reads the user on its first request, in every worker
+        await principal_cache.invalidate(user_id)
+
         return token
@@ -0,0 +1,64 @@
+import logging
+from typing import Optional
+from app.core.config import settings
+from app.utils.cache import Cache, cache
+
+logger = logging.getLogger(__name__)
+
+# Returns {1, user_id} and deletes the entry when the code matches. Otherwise counts the attempt and
+# returns {0, attempts}, deleting the entry once `max_attempts` is reached. Returns {-1} when there is no entry.
+VERIFY_OTP_SCRIPT = """
+local entry = redis.call("hmget", KEYS[1], "code", "user_id")
+if not entry[1] then
+    return {-1}
+end
+if entry[1] == ARGV[1] then
+    redis.call("del", KEYS[1])
+    return {1, entry[2]}
+end
+local attempts = redis.call("hincrby", KEYS[1], "attempts", 1)
+if attempts >= tonumber(ARGV[2]) then
+    redis.call("del", KEYS[1])
+end
+return {0, attempts}
+"""
+
+
+class OtpStore:
+    """
+    One-time login codes kept in Redis instead of the users table.
+    Each entry is a hash (code, user_id, attempts) that expires after `ttl` seconds. It is checked and consumed
+    by a Lua script, so a code can be used once, and `max_attempts` wrong guesses burn it.
+    """
+
+    def __init__(self, cache: Cache, ttl: int, max_attempts: int):
+        self.cache = cache
+        self.ttl = int(ttl)
+        self.max_attempts = int(max_attempts)
+
+    @staticmethod
+    def key(email: str) -> str:
+        return f"otp:{email}"
+
+    async def issue(self, email: str, user_id, code: str) -> None:
+        """Stores a new code for the user, replacing any earlier one and resetting its attempts."""
+        async with self.cache.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self.key(email), mapping={"code": code, "user_id": str(user_id), "attempts": 0})
+            pipe.expire(self.key(email), self.ttl)
+            await pipe.execute()
+
+    async def verify(self, email: str, code: str) -> Optional[str]:
+        """
+        Checks a code and consumes it when it matches.
+        :return: The user id the code was issued for, or None when it is wrong, expired or burnt.
+        """
+        result = await self.cache.redis.eval(VERIFY_OTP_SCRIPT, 1, self.key(email), code, self.max_attempts)
+        status = int(result[0])
+        if status == 1:
+            return result[1].decode()
+        if status == 0 and int(result[1]) >= self.max_attempts:
+            logger.warning("OTP for email: %s burnt after %s failed attempts", email, result[1])
+        return None
+
+# Singleton instance used by AuthService
+otp_store = OtpStore(cache, settings.OTP_TTL_SECONDS, settings.OTP_MAX_ATTEMPTS)
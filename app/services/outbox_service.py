@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from datetime import date
+from typing import Dict, Iterable, List
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_CREATED = "transaction_created"
+TRANSACTION_UPDATED = "transaction_updated"
+TRANSACTION_DELETED = "transaction_deleted"
+
+# Set after a commit that recorded events, so the worker in this process does not wait for its next poll
+_new_events = asyncio.Event()
+
+
+def _encode_delta(delta: Dict) -> Dict:
+    return {**delta, "user_id": str(delta["user_id"]), "day": delta["day"].isoformat()}
+
+def decode_delta(delta: Dict) -> Dict:
+    return {**delta, "day": date.fromisoformat(delta["day"])}
+
+def transaction_event(
+    event_type: str,
+    user_id,
+    deltas: Iterable[Dict],
+    added_amounts: Iterable[int] = (),
+    discard_sketch: bool = False,
+    transaction_ids: Iterable = (),
+) -> Dict:
+    """
+    Builds the outbox row for one user's share of a transaction write.
+    :param deltas: transaction_delta() results to apply to the aggregates and daily rollups.
+    :param added_amounts: Created amounts to add to the user's quantile sketch.
+    :param discard_sketch: Drop the sketch because an amount was changed or removed.
+    :param transaction_ids: Transactions whose cached copies must be invalidated.
+    """
+    return {
+        "event_type": event_type,
+        "user_id": user_id,
+        "payload": {
+            "deltas": [_encode_delta(delta) for delta in deltas],
+            "added_amounts": list(added_amounts),
+            "discard_sketch": discard_sketch,
+            "transaction_ids": [str(transaction_id) for transaction_id in transaction_ids],
+        },
+    }
+
+async def record_events(db: AsyncSession, events: List[Dict]) -> None:
+    """Inserts outbox rows inside the caller's transaction, so they commit (or roll back) with the write itself."""
+    if events:
+        await db.execute(insert(OutboxEvent), events)
+
+def notify() -> None:
+    """Wakes the outbox worker of this process. Call after committing a transaction that recorded events."""
+    _new_events.set()
+
+async def wait_for_events(timeout: float) -> None:
+    """Returns when notify() is called or after `timeout` seconds, whichever comes first."""
+    try:
+        await asyncio.wait_for(_new_events.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    _new_events.clear()
+
+async def has_pending_events(db: AsyncSession, user_id) -> bool:
+    """Whether the user has events whose aggregate and sketch updates are not committed yet, dead letters included."""
+    result = await db.execute(
+        select(OutboxEvent.id).where(OutboxEvent.user_id == user_id, OutboxEvent.applied.is_(False)).limit(1)
+    )
+    return result.first() is not None
+
+async def get_backlog(db: AsyncSession) -> Dict:
+    """
+    Counts undrained events.
+    :return: pending (aggregates not applied yet), unacknowledged (applied, Redis side effects not done yet),
+             dead_lettered (set aside after OUTBOX_MAX_ATTEMPTS failures) and the age in seconds of the oldest
+             undrained event that is not dead-lettered.
+    """
+    result = await db.execute(
+        select(
+            OutboxEvent.applied,
+            OutboxEvent.dead_lettered,
+            func.count(OutboxEvent.id),
+            func.extract("epoch", func.now() - func.min(OutboxEvent.created_at)),
+        ).group_by(OutboxEvent.applied, OutboxEvent.dead_lettered)
+    )
+    backlog = {"pending": 0, "unacknowledged": 0, "dead_lettered": 0, "oldest_age_seconds": 0.0}
+    for applied, dead_lettered, count, age in result.all():
+        if dead_lettered:
+            backlog["dead_lettered"] += count
+            continue
+        backlog["unacknowledged" if applied else "pending"] += count
+        backlog["oldest_age_seconds"] = max(backlog["oldest_age_seconds"], round(float(age or 0), 3))
+    return backlog
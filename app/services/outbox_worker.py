@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict, deque
+from typing import Dict, Optional
+from sqlalchemy import delete, select, update
+from app.core.config import settings
+from app.db.models import OutboxEvent
+from app.db.session import AsyncSessionLocal
+from app.services.aggregate_service import apply_deltas
+from app.services.outbox_service import decode_delta, get_backlog, wait_for_events
+from app.services.sketch_service import add_to_sketches, discard_sketches, rebuild_sketch, request_rebuild, take_rebuild_requests
+from app.services.transaction_service import invalidate_transaction_cache, record_user_write
+
+logger = logging.getLogger(__name__)
+
+RATE_WINDOW_SECONDS = 60
+
+
+class OutboxWorker:
+    """
+    Drains the transactional outbox in two steps, each over a batch of at most `batch_size` events claimed with
+    FOR UPDATE SKIP LOCKED, so several app processes can drain side by side:
+
+    1. apply: the aggregate deltas and sketch updates of pending events are written and the events are marked
+       applied in one transaction, so they take effect exactly once. Events that keep failing are dead-lettered.
+    2. acknowledge: analytics invalidation, and a repeat of the read pinning and transaction cache invalidation
+       the request already did after its commit, run for applied events, which are then deleted. When
+       Redis fails the events stay and are retried, so these side effects happen at least once.
+
+    Invalidating only after the aggregates are committed keeps readers from caching pre-write values under
+    the new generation.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        batch_size: int = settings.OUTBOX_BATCH_SIZE,
+        interval: float = settings.OUTBOX_POLL_INTERVAL_SECONDS,
+        max_attempts: int = settings.OUTBOX_MAX_ATTEMPTS,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = int(batch_size)
+        self.interval = float(interval)
+        self.max_attempts = max(1, int(max_attempts))
+
+        self._task: Optional[asyncio.Task] = None
+        self._drained = deque()  # (monotonic time, events acknowledged) within the last RATE_WINDOW_SECONDS
+        self.applied_total = 0
+        self.acknowledged_total = 0
+        self.failed_total = 0
+        self.dead_lettered_total = 0
+        self.sketches_rebuilt_total = 0
+        self.last_error: Optional[str] = None
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info("Started outbox worker")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            logger.info("Stopped outbox worker")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                # A full batch means there is probably more; drain it before waiting
+                if await self.run_once() >= self.batch_size:
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed_total += 1
+                self.last_error = str(e)
+                logger.error("Outbox drain failed, error: %s", str(e))
+            await wait_for_events(self.interval)
+
+    @staticmethod
+    async def _apply(db, events) -> None:
+        deltas, added_amounts, discarded = [], defaultdict(list), set()
+        for event in events:
+            deltas.extend(decode_delta(delta) for delta in event.payload["deltas"])
+            added_amounts[str(event.user_id)].extend(event.payload["added_amounts"])
+            if event.payload["discard_sketch"]:
+                discarded.add(str(event.user_id))
+
+        # Rows are upserted in one order in every process, so concurrent batches cannot deadlock
+        deltas.sort(key=lambda delta: (str(delta["user_id"]), delta["day"]))
+        await apply_deltas(db, deltas)
+        await add_to_sketches(db, {user_id: amounts for user_id, amounts in sorted(added_amounts.items()) if amounts})
+        if discarded:
+            await discard_sketches(db, sorted(discarded))
+
+    async def apply_pending(self) -> int:
+        """
+        Applies the aggregate and sketch updates of one batch of pending events and marks them applied.
+        The batch is applied in a savepoint; when that fails, each event is retried in its own savepoint so one
+        poison event cannot hold back the rest. An event that fails counts an attempt, and is dead-lettered
+        once it reaches `max_attempts`, so it is no longer claimed.
+        """
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(OutboxEvent)
+                .where(OutboxEvent.applied.is_(False), OutboxEvent.dead_lettered.is_(False))
+                .order_by(OutboxEvent.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            events = result.scalars().all()
+            if not events:
+                return 0
+
+            try:
+                async with db.begin_nested():
+                    await self._apply(db, events)
+                applied = [event.id for event in events]
+            except Exception as e:
+                logger.warning("Outbox batch of %s events failed, retrying one by one, error: %s", len(events), str(e))
+                applied = []
+                for event in events:
+                    try:
+                        async with db.begin_nested():
+                            await self._apply(db, [event])
+                        applied.append(event.id)
+                    except Exception as e:
+                        await self._record_failure(db, event, e)
+
+            if applied:
+                await db.execute(update(OutboxEvent).where(OutboxEvent.id.in_(applied)).values(applied=True))
+            await db.commit()
+            request_rebuild({str(event.user_id) for event in events if event.id in applied and event.payload["discard_sketch"]})
+            self.applied_total += len(applied)
+            return len(applied)
+
+    async def rebuild_sketches(self) -> int:
+        """
+        Rebuilds the sketches discarded by applied events, or found missing by a read, from the raw rows.
+        A user whose events are still pending is asked for again and retried on the next run.
+        :return: The number of sketches rebuilt.
+        """
+        rebuilt = 0
+        for user_id in take_rebuild_requests():
+            try:
+                async with self.session_factory() as db:
+                    done = await rebuild_sketch(db, user_id)
+            except Exception as e:
+                logger.error("Could not rebuild transaction sketch for user_id: %s, error: %s", user_id, str(e))
+                done = False
+            if done:
+                rebuilt += 1
+            else:
+                request_rebuild([user_id])
+        self.sketches_rebuilt_total += rebuilt
+        return rebuilt
+
+    async def _record_failure(self, db, event, error: Exception) -> None:
+        attempts = event.attempts + 1
+        dead_lettered = attempts >= self.max_attempts
+        await db.execute(
+            update(OutboxEvent)
+            .where(OutboxEvent.id == event.id)
+            .values(attempts=attempts, last_error=str(error)[:1000], dead_lettered=dead_lettered)
+        )
+        self.failed_total += 1
+        self.last_error = str(error)
+        if dead_lettered:
+            self.dead_lettered_total += 1
+            logger.error("Outbox event %s dead-lettered after %s attempts, error: %s", event.id, attempts, str(error))
+        else:
+            logger.warning("Outbox event %s failed (attempt %s of %s), error: %s", event.id, attempts, self.max_attempts, str(error))
+
+    async def acknowledge_applied(self) -> int:
+        """Runs the Redis side effects of one batch of applied events and deletes them."""
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(OutboxEvent.id, OutboxEvent.user_id, OutboxEvent.payload)
+                .where(OutboxEvent.applied.is_(True))
+                .order_by(OutboxEvent.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            events = result.all()
+            if not events:
+                return 0
+
+            # Each user and transaction is handled once per batch, however many events name it
+            for user_id in dict.fromkeys(str(event.user_id) for event in events):
+                await record_user_write(user_id)
+            for transaction_id in dict.fromkeys(t for event in events for t in event.payload["transaction_ids"]):
+                await invalidate_transaction_cache(transaction_id)
+
+            await db.execute(delete(OutboxEvent).where(OutboxEvent.id.in_([event.id for event in events])))
+            await db.commit()
+            self.acknowledged_total += len(events)
+            self._drained.append((time.monotonic(), len(events)))
+            return len(events)
+
+    async def run_once(self) -> int:
+        """
+        Applies one batch, rebuilds the sketches it discarded, then acknowledges one batch.
+        :return: The number of events acknowledged.
+        """
+        await self.apply_pending()
+        await self.rebuild_sketches()
+        return await self.acknowledge_applied()
+
+    @property
+    def drain_rate(self) -> float:
+        """Events acknowledged per second over the last RATE_WINDOW_SECONDS."""
+        cutoff = time.monotonic() - RATE_WINDOW_SECONDS
+        while self._drained and self._drained[0][0] < cutoff:
+            self._drained.popleft()
+        return sum(count for _, count in self._drained) / RATE_WINDOW_SECONDS
+
+    async def stats(self) -> Dict:
+        async with self.session_factory() as db:
+            backlog = await get_backlog(db)
+        return {
+            "running": self._task is not None and not self._task.done(),
+            **backlog,
+            "drain_rate_per_second": round(self.drain_rate, 3),
+            "applied_total": self.applied_total,
+            "acknowledged_total": self.acknowledged_total,
+            "failed_total": self.failed_total,
+            "dead_lettered_total": self.dead_lettered_total,
+            "sketches_rebuilt_total": self.sketches_rebuilt_total,
+            "last_error": self.last_error,
+        }
+
+# Singleton instance shared by the monitoring router and the app lifecycle hooks
+outbox_worker = OutboxWorker()
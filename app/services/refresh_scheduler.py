@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Dict, List, Optional
+from app.core.config import settings
+from app.db.session import read_session
+from app.services.analytics_service import AnalyticsService
+from app.utils.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class _TrackedUser:
+    __slots__ = ("last_seen", "last_refreshed", "due_since")
+
+    def __init__(self, now: float):
+        self.last_seen = now
+        self.last_refreshed = 0.0
+        self.due_since: Optional[float] = None
+
+
+class AnalyticsRefreshScheduler:
+    """
+    Keeps the analytics cache warm for recently active users.
+
+    A single loop runs for the lifetime of the app. Routes only record activity through `track`;
+    the loop expires idle users, picks the ones whose cache entries are about to expire and
+    refreshes them with its own sessions, at most `concurrency` users at a time.
+    """
+
+    def __init__(
+        self,
+        session_factory=read_session,
+        interval: int = settings.ANALYTICS_REFRESH_INTERVAL_SECONDS,
+        margin: int = settings.ANALYTICS_REFRESH_MARGIN_SECONDS,
+        idle_timeout: int = settings.ANALYTICS_REFRESH_IDLE_SECONDS,
+        concurrency: int = settings.ANALYTICS_REFRESH_CONCURRENCY,
+        max_users: int = settings.ANALYTICS_REFRESH_MAX_USERS,
+    ):
+        self.session_factory = session_factory
+        self.interval = int(interval)
+        self.margin = int(margin)
+        self.idle_timeout = int(idle_timeout)
+        self.concurrency = int(concurrency)
+        self.max_users = int(max_users)
+
+        self._users: Dict[str, _TrackedUser] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.refreshed_total = 0
+        self.failed_total = 0
+        self.evicted_total = 0
+        self.last_lag = 0.0
+
+    def track(self, user_id: str) -> None:
+        """
+        Records that analytics were requested for a user. Cheap enough to call on every request.
+        The id comes from the URL, so anything that is not a UUID is ignored, and at most `max_users` users are
+        tracked: the least recently seen one makes room for a new one.
+        """
+        try:
+            user_id = str(uuid.UUID(str(user_id)))
+        except ValueError:
+            return
+        now = time.monotonic()
+        # Re-inserted on every call, so the dict stays ordered from least to most recently seen
+        entry = self._users.pop(user_id, None)
+        if entry is None:
+            entry = _TrackedUser(now)
+            if len(self._users) >= self.max_users:
+                self._users.pop(next(iter(self._users)))
+                self.evicted_total += 1
+        entry.last_seen = now
+        self._users[user_id] = entry
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info("Started analytics refresh scheduler")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            logger.info("Stopped analytics refresh scheduler")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Analytics refresh cycle failed, error: %s", str(e))
+            await asyncio.sleep(self.interval)
+
+    def _expire_idle_users(self, now: float) -> None:
+        idle = [user_id for user_id, entry in self._users.items() if now - entry.last_seen > self.idle_timeout]
+        for user_id in idle:
+            del self._users[user_id]
+        if idle:
+            logger.info("Stopped refreshing analytics for %s idle users", len(idle))
+
+    async def _due_users(self, now: float) -> List[str]:
+        # A user that was refreshed recently cannot be close to expiry yet, skip the TTL lookup
+        min_age = max(AnalyticsService.CACHE_EXPIRY - self.margin, self.interval)
+        candidates = [user_id for user_id, entry in self._users.items() if now - entry.last_refreshed >= min_age]
+        if not candidates:
+            return []
+
+        # Every whole-history analytic is served from the user's summary entry, so that is the key to keep warm
+        generations = await cache.get_generations([AnalyticsService.generation_key(user_id) for user_id in candidates])
+        keys = [AnalyticsService.cache_keys(user_id, generation)["summary"] for user_id, generation in zip(candidates, generations)]
+        ttls = await cache.get_ttls(keys)
+
+        due = []
+        for user_id, ttl in zip(candidates, ttls):
+            # -2 means the entry is already gone (expired or invalidated by a write). Keys outlive their
+            # freshness by the stale-while-revalidate window, which does not count as time left.
+            stale = AnalyticsService.STALE_WHILE_REVALIDATE
+            if ttl == -2 or 0 <= ttl <= stale + self.margin:
+                entry = self._users[user_id]
+                if entry.due_since is None:
+                    entry.due_since = now
+                due.append(user_id)
+        return due
+
+    async def _refresh_user(self, user_id: str, semaphore: asyncio.Semaphore) -> None:
+        async with semaphore:
+            try:
+                async with await self.session_factory(user_id) as session:
+                    await AnalyticsService.get_summary(session, user_id, force_refresh=True)
+                self.refreshed_total += 1
+                logger.info("Refreshed analytics cache for user_id: %s", user_id)
+            except Exception as e:
+                self.failed_total += 1
+                logger.error("Error refreshing analytics cache for user_id: %s, error: %s", user_id, str(e))
+            finally:
+                now = time.monotonic()
+                entry = self._users.get(user_id)
+                if entry is not None:
+                    entry.last_refreshed = now
+                    if entry.due_since is not None:
+                        self.last_lag = now - entry.due_since
+                        entry.due_since = None
+
+    async def run_once(self) -> None:
+        """Runs one scheduling cycle: expire idle users, then refresh the ones that are due."""
+        now = time.monotonic()
+        self._expire_idle_users(now)
+        due = await self._due_users(now)
+        if not due:
+            return
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(self._refresh_user(user_id, semaphore) for user_id in due))
+
+    @property
+    def queue_depth(self) -> int:
+        """Users that are due for a refresh and have not been refreshed yet."""
+        return sum(1 for entry in self._users.values() if entry.due_since is not None)
+
+    @property
+    def lag(self) -> float:
+        """Seconds the oldest pending user has been waiting, or the last observed wait when none is pending."""
+        pending = [entry.due_since for entry in self._users.values() if entry.due_since is not None]
+        return time.monotonic() - min(pending) if pending else self.last_lag
+
+    def stats(self) -> Dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "tracked_users": len(self._users),
+            "queue_depth": self.queue_depth,
+            "lag_seconds": round(self.lag, 3),
+            "refreshed_total": self.refreshed_total,
+            "failed_total": self.failed_total,
+            "evicted_total": self.evicted_total,
+        }
+
+# Singleton instance shared by the routers and the app lifecycle hooks
+refresh_scheduler = AnalyticsRefreshScheduler()
@@ -0,0 +1,152 @@
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import bindparam, delete, func, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.models import OutboxEvent, Transaction, UserTransactionAggregate, UserTransactionSketch
+from app.services.outbox_service import has_pending_events
+from app.utils.quantile_sketch import KLLSketch
+
+logger = logging.getLogger(__name__)
+
+REBUILD_BATCH_SIZE = 1000
+
+# Users whose sketch is missing; the outbox worker of this process rebuilds them off the read path
+_rebuild_requests = set()
+
+
+def new_sketch() -> KLLSketch:
+    return KLLSketch(int(settings.QUANTILE_SKETCH_K))
+
+async def load_sketch(db: AsyncSession, user_id: str) -> Optional[KLLSketch]:
+    """Reads a user's stored sketch; None when there is none yet or it was discarded."""
+    data = (await db.execute(select(UserTransactionSketch.sketch).where(UserTransactionSketch.user_id == user_id))).scalar()
+    return KLLSketch.from_bytes(data) if data is not None else None
+
+async def add_to_sketches(db: AsyncSession, amounts_by_user: Dict[str, List[int]]) -> None:
+    """
+    Adds newly created amounts to the users' stored sketches inside the caller's transaction.
+    The outbox worker runs it after apply_deltas: the aggregate row lock it holds orders this write against rebuild_sketch.
+    Users without a stored sketch are skipped; the outbox worker rebuilds theirs from the raw rows.
+    """
+    if not amounts_by_user:
+        return
+    result = await db.execute(
+        select(UserTransactionSketch.user_id, UserTransactionSketch.sketch)
+        .where(UserTransactionSketch.user_id.in_(list(amounts_by_user)))
+        .with_for_update()
+    )
+    amounts = {str(user_id): values for user_id, values in amounts_by_user.items()}
+    rows = []
+    for user_id, data in result.all():
+        sketch = KLLSketch.from_bytes(data)
+        sketch.update_many(amounts[str(user_id)])
+        rows.append({"sketch_user_id": user_id, "sketch_bytes": sketch.to_bytes()})
+    if rows:
+        table = UserTransactionSketch.__table__
+        await db.execute(
+            update(table)
+            .where(table.c.user_id == bindparam("sketch_user_id"))
+            .values(sketch=bindparam("sketch_bytes"), updated_at=func.now()),
+            rows,
+        )
+
+async def discard_sketches(db: AsyncSession, user_ids: Iterable[str]) -> None:
+    """
+    Drops the users' sketches inside the caller's transaction.
+    A KLL sketch cannot forget a value, so updates that change an amount and deletes discard it instead, and the
+    outbox worker rebuilds it once the discard is committed.
+    """
+    await db.execute(delete(UserTransactionSketch).where(UserTransactionSketch.user_id.in_(list(user_ids))))
+
+async def scan_sketch(db: AsyncSession, user_id: str) -> KLLSketch:
+    """Builds a user's sketch from the raw transactions table without storing it."""
+    sketch = new_sketch()
+    result = await db.stream_scalars(
+        select(Transaction.transaction_amount).where(Transaction.user_id == user_id).execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+    )
+    async for amounts in result.partitions():
+        sketch.update_many(amounts)
+    return sketch
+
+async def rebuild_sketch(db: AsyncSession, user_id: str) -> bool:
+    """
+    Builds a user's sketch from the raw transactions table, stores it and commits.
+    The user's aggregate row is locked first, so the outbox worker cannot apply the user's creates meanwhile.
+    If any of the user's events is still pending, the raw rows may already contain amounts the worker will
+    add again, so nothing is stored and the rebuild has to be retried once they are applied.
+    :return: False when the rebuild has to be retried, True when it is stored or the user has no transactions.
+    """
+    logger.info("Rebuilding transaction sketch for user_id: %s", user_id)
+    await db.execute(select(UserTransactionAggregate.user_id).where(UserTransactionAggregate.user_id == user_id).with_for_update())
+
+    # Checked before the scan too, so a user who stays pending is not rescanned on every retry
+    if await has_pending_events(db, user_id):
+        await db.rollback()
+        return False
+    sketch = await scan_sketch(db, user_id)
+    if not sketch.n or await has_pending_events(db, user_id):
+        await db.rollback()
+        return not sketch.n
+
+    stmt = insert(UserTransactionSketch).values(user_id=user_id, sketch=sketch.to_bytes())
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[UserTransactionSketch.user_id],
+        set_={"sketch": stmt.excluded.sketch, "updated_at": func.now()},
+    ))
+    await db.commit()
+    return True
+
+def request_rebuild(user_ids: Iterable[str]) -> None:
+    """Asks the outbox worker of this process to rebuild the users' sketches on its next run."""
+    _rebuild_requests.update(str(user_id) for user_id in user_ids)
+
+def take_rebuild_requests() -> List[str]:
+    """Returns and clears the users whose sketches were asked to be rebuilt."""
+    user_ids = sorted(_rebuild_requests)
+    _rebuild_requests.clear()
+    return user_ids
+
+async def rebuild_sketches(db: AsyncSession, user_id: Optional[str] = None) -> None:
+    """
+    Rebuilds every user's sketch (or one user's) from the raw transactions table in one pass and commits.
+    Writes to transactions are blocked while the rebuild runs, as in rebuild_aggregates. Users with pending
+    outbox events are left without a sketch, since the worker would add those amounts a second time; the
+    next read asks the outbox worker to rebuild it.
+    """
+    logger.info("Rebuilding transaction sketches for user_id: %s", user_id or "ALL")
+    await db.execute(text("LOCK TABLE transactions IN SHARE MODE"))
+
+    clear = delete(UserTransactionSketch)
+    query = select(Transaction.user_id, Transaction.transaction_amount).order_by(Transaction.user_id)
+    if user_id:
+        clear = clear.where(UserTransactionSketch.user_id == user_id)
+        query = query.where(Transaction.user_id == user_id)
+    await db.execute(clear)
+    # No new events can arrive while the table is locked, so this set only shrinks
+    pending = select(OutboxEvent.user_id).where(OutboxEvent.applied.is_(False)).distinct()
+    skipped = {row_user_id for row_user_id, in (await db.execute(pending)).all()}
+
+    sketches = defaultdict(new_sketch)
+    rebuilt = 0
+    result = await db.stream(query.execution_options(yield_per=settings.EXPORT_BATCH_SIZE))
+    async for rows in result.partitions():
+        for row_user_id, amount in rows:
+            if row_user_id not in skipped:
+                sketches[row_user_id].update(amount)
+        # Rows arrive ordered by user, so every sketch but the last one in the batch is complete
+        if len(sketches) > REBUILD_BATCH_SIZE:
+            last = rows[-1][0]
+            # The last user of the batch may continue in the next one
+            done = [{"user_id": u, "sketch": s.to_bytes()} for u, s in sketches.items() if u != last]
+            await db.execute(insert(UserTransactionSketch), done)
+            rebuilt += len(done)
+            sketches = defaultdict(new_sketch, {last: sketches[last]} if last in sketches else {})
+    if sketches:
+        await db.execute(insert(UserTransactionSketch), [{"user_id": u, "sketch": s.to_bytes()} for u, s in sketches.items()])
+        rebuilt += len(sketches)
+
+    await db.commit()
+    logger.info("Rebuilt %s transaction sketches for user_id: %s", rebuilt, user_id or "ALL")
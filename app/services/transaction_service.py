@@ -1,24 +1,80 @@
+import csv
+import io
 import logging
+import uuid
+import orjson
+from collections import defaultdict
+from typing import Any, AsyncIterator, List, Optional
+from pydantic import ValidationError
+from sqlalchemy import insert, tuple_
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
-from app.db.models import Transaction
-from app.schemas.transaction import TransactionCreate, TransactionUpdate, TransactionResponse
-from app.custom_exceptions.exceptions import TransactionNotFoundException, InvalidTransactionAmountException
+from app.core.config import settings
+from app.db.models import Transaction, TransactionType
+from app.db.session import read_session, replica_router
+from app.schemas.transaction import (
+    TransactionCreate,
+    TransactionUpdate,
+    TransactionResponse,
+    BulkTransactionResult,
+    BulkTransactionResponse,
+    TransactionPage,
+)
+from app.custom_exceptions.exceptions import TransactionNotFoundException, InvalidTransactionAmountException, InvalidBulkPayloadException
 from app.utils.cache import cache
+from app.utils.pagination import decode_cursor, encode_cursor
+from app.utils.response_cache import response_cache
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from app.services.analytics_service import AnalyticsService
+from app.services.aggregate_service import transaction_delta
+from app.services.outbox_service import (
+    TRANSACTION_CREATED,
+    TRANSACTION_DELETED,
+    TRANSACTION_UPDATED,
+    notify as notify_outbox,
+    record_events,
+    transaction_event,
+)
 
 logger = logging.getLogger(__name__)
 
 CACHE_TTL = 300 
 
 
-def analytics_cache_keys(user_id: str):
-    return {
-        "average_transaction": f"average_transaction_value:{user_id}",
-        "highest_transaction_day": f"highest_transaction_day:{user_id}",
-        "transaction_totals": f"transaction_totals:{user_id}"
-    }
+def transaction_cache_key(transaction_id) -> str:
+    return f"transaction:{transaction_id}"
+
+async def invalidate_transaction_cache(transaction_id) -> None:
+    """Drops a transaction's cached model and cached GET response in both tiers and on the other workers."""
+    await cache.clear_cache(transaction_cache_key(transaction_id))
+    await response_cache.invalidate(transaction_cache_key(transaction_id))
+
+async def invalidate_analytics_cache(user_id) -> None:
+    # One INCR retires every cached analytics value of the user, date-range totals included
+    await AnalyticsService.invalidate(user_id)
+
+async def record_committed_write(user_ids, transaction_ids=()) -> None:
+    """
+    Runs right after a write commits: pins the users' reads to the primary and drops the cached copies of the
+    changed transactions, so a client reads its own write straight away. Redis errors are only logged, the
+    outbox worker repeats both when it acknowledges the write's events.
+    """
+    try:
+        for user_id in user_ids:
+            await replica_router.pin(user_id)
+        for transaction_id in transaction_ids:
+            await invalidate_transaction_cache(transaction_id)
+    except Exception as e:
+        logger.warning("Could not pin or invalidate after write for user_ids: %s, error: %s", list(user_ids), str(e))
+
+async def record_user_write(user_id) -> None:
+    """
+    Runs from the outbox worker once a write is applied: pins the user's reads to the primary again (in case
+    record_committed_write failed) and invalidates their analytics.
+    """
+    await replica_router.pin(user_id)
+    await invalidate_analytics_cache(user_id)
 
 async def create_transaction(db: AsyncSession, transaction_data: TransactionCreate) -> TransactionResponse:
     logger.info("Creating a new transaction for user_id: %s", transaction_data.user_id)
@@ -33,25 +89,26 @@ async def create_transaction(db: AsyncSession, transaction_data: TransactionCrea
 
     transaction = Transaction(**transaction_data_dict)
     db.add(transaction)
+    # Aggregates, sketches and analytics caches are updated by the outbox worker
+    await record_events(db, [transaction_event(
+        TRANSACTION_CREATED,
+        transaction.user_id,
+        [transaction_delta(transaction.user_id, transaction.transaction_date, transaction.transaction_amount, transaction.transaction_type)],
+        added_amounts=[transaction.transaction_amount],
+    )])
     await db.commit()
+    notify_outbox()
+    await record_committed_write([transaction.user_id])
     await db.refresh(transaction)
-    transaction_response = TransactionResponse.from_orm(transaction)
-
-    await cache.set_cache(f"transaction:{transaction.id}", transaction_response.dict(), expire=CACHE_TTL)
-    logger.info("Transaction created and cached with id: %s", transaction.id)
-
-    user_cache_keys = analytics_cache_keys(transaction_data.user_id)
-    await cache.clear_cache(user_cache_keys["average_transaction"])
-    await cache.clear_cache(user_cache_keys["highest_transaction_day"])
-    await cache.clear_cache(user_cache_keys["transaction_totals"])
-    logger.info("Invalidated analytics cache for user_id: %s", transaction_data.user_id)
+    logger.info("Transaction created with id: %s", transaction.id)
 
-    return transaction_response
+    return TransactionResponse.from_orm(transaction)
 
 async def update_transaction(db: AsyncSession, transaction_id: int, transaction_data: TransactionUpdate) -> TransactionResponse:
     logger.info("Updating transaction with id: %s", transaction_id)
 
-    stmt = select(Transaction).filter(Transaction.id == transaction_id)
+    # Locked until commit, so concurrent updates compute their aggregate deltas from each other's result
+    stmt = select(Transaction).filter(Transaction.id == transaction_id).with_for_update()
     result = await db.execute(stmt)
     transaction = result.scalars().first()
 
@@ -59,31 +116,36 @@ async def update_transaction(db: AsyncSession, transaction_id: int, transaction_
         logger.warning("Transaction with id %s not found", transaction_id)
         raise TransactionNotFoundException()
 
-    for key, value in transaction_data.dict(exclude_unset=True).items():
+    previous = transaction_delta(transaction.user_id, transaction.transaction_date, transaction.transaction_amount, transaction.transaction_type, sign=-1)
+    previous_amount = transaction.transaction_amount
+    update_data = transaction_data.dict(exclude_unset=True)
+    if update_data.get("transaction_date"):
+        update_data["transaction_date"] = update_data["transaction_date"].replace(tzinfo=None)
+    for key, value in update_data.items():
         setattr(transaction, key, value)
 
+    await record_events(db, [transaction_event(
+        TRANSACTION_UPDATED,
+        transaction.user_id,
+        [previous, transaction_delta(transaction.user_id, transaction.transaction_date, transaction.transaction_amount, transaction.transaction_type)],
+        discard_sketch=transaction.transaction_amount != previous_amount,
+        transaction_ids=[transaction.id],
+    )])
     await db.commit()
+    notify_outbox()
+    await record_committed_write([transaction.user_id], [transaction.id])
     await db.refresh(transaction)
-    transaction_response = TransactionResponse.from_orm(transaction)
+    logger.info("Transaction with id %s updated", transaction.id)
 
-    await cache.set_cache(f"transaction:{transaction.id}", transaction_response.dict(), expire=CACHE_TTL)
-    logger.info("Transaction with id %s updated and cache refreshed", transaction.id)
-
-    user_cache_keys = analytics_cache_keys(transaction.user_id)
-    await cache.clear_cache(user_cache_keys["average_transaction"])
-    await cache.clear_cache(user_cache_keys["highest_transaction_day"])
-    await cache.clear_cache(user_cache_keys["transaction_totals"])
-    logger.info("Invalidated analytics cache for user_id: %s", transaction.user_id)
-
-    return transaction_response
+    return TransactionResponse.from_orm(transaction)
 
 async def get_transaction(db: AsyncSession, transaction_id: str) -> TransactionResponse:
     logger.info("Retrieving transaction with id: %s", transaction_id)
 
-    cached_transaction = await cache.get_cache(f"transaction:{transaction_id}")
+    cached_transaction = await cache.get_cache(transaction_cache_key(transaction_id), model=TransactionResponse)
     if cached_transaction:
         logger.info("Transaction with id %s retrieved from cache", transaction_id)
-        return TransactionResponse(**cached_transaction)
+        return cached_transaction
 
     stmt = select(Transaction).filter(Transaction.id == transaction_id)
     result = await db.execute(stmt)
@@ -94,15 +156,44 @@ async def get_transaction(db: AsyncSession, transaction_id: str) -> TransactionR
         raise TransactionNotFoundException()
 
     transaction_response = TransactionResponse.from_orm(transaction)
-    await cache.set_cache(f"transaction:{transaction_id}", transaction_response.dict(), expire=CACHE_TTL)
+    await cache.set_cache(transaction_cache_key(transaction_id), transaction_response, expire=CACHE_TTL)
     logger.info("Transaction with id %s retrieved from database and cached", transaction_id)
 
     return transaction_response
 
+async def list_transactions(db: AsyncSession, user_id: str, before: Optional[str] = None, limit: int = 50) -> TransactionPage:
+    """
+    Lists a user's transactions newest first using keyset pagination on (transaction_date, id).
+    Each page is a single index range scan on ix_transactions_user_id_transaction_date_id, so deep pages cost
+    the same as the first one.
+    """
+    logger.info("Listing transactions for user_id: %s before: %s limit: %s", user_id, before, limit)
+
+    stmt = (
+        select(Transaction)
+        .where(Transaction.user_id == user_id)
+        .order_by(Transaction.transaction_date.desc(), Transaction.id.desc())
+        .limit(limit + 1)
+    )
+    if before:
+        stmt = stmt.where(tuple_(Transaction.transaction_date, Transaction.id) < tuple_(*decode_cursor(before)))
+
+    result = await db.execute(stmt)
+    transactions = result.scalars().all()
+
+    next_cursor = None
+    if len(transactions) > limit:
+        transactions = transactions[:limit]
+        last = transactions[-1]
+        next_cursor = encode_cursor(last.transaction_date, last.id)
+
+    return TransactionPage(items=[TransactionResponse.from_orm(t) for t in transactions], next_cursor=next_cursor)
+
 async def delete_transaction(db: AsyncSession, transaction_id: int) -> None:
     logger.info("Deleting transaction with id: %s", transaction_id)
 
-    stmt = select(Transaction).filter(Transaction.id == transaction_id)
+    # Locked like in update_transaction, so a concurrent update cannot apply a delta for a deleted row
+    stmt = select(Transaction).filter(Transaction.id == transaction_id).with_for_update()
     result = await db.execute(stmt)
     transaction = result.scalars().first()
 
@@ -111,13 +202,187 @@ async def delete_transaction(db: AsyncSession, transaction_id: int) -> None:
         raise TransactionNotFoundException()
 
     await db.delete(transaction)
+    await record_events(db, [transaction_event(
+        TRANSACTION_DELETED,
+        transaction.user_id,
+        [transaction_delta(transaction.user_id, transaction.transaction_date, transaction.transaction_amount, transaction.transaction_type, sign=-1)],
+        discard_sketch=True,
+        transaction_ids=[transaction_id],
+    )])
     await db.commit()
-    await cache.clear_cache(f"transaction:{transaction_id}")
-    logger.info("Transaction with id %s deleted and cache cleared", transaction_id)
-
-    if transaction.user_id:
-        user_cache_keys = analytics_cache_keys(transaction.user_id)
-        await cache.clear_cache(user_cache_keys["average_transaction"])
-        await cache.clear_cache(user_cache_keys["highest_transaction_day"])
-        await cache.clear_cache(user_cache_keys["transaction_totals"])
-        logger.info("Invalidated analytics cache for user_id: %s", transaction.user_id)
+    notify_outbox()
+    await record_committed_write([transaction.user_id], [transaction_id])
+    logger.info("Transaction with id %s deleted", transaction_id)
+
+def parse_bulk_payload(body: bytes, content_type: Optional[str] = None) -> List[Any]:
+    """
+    Parses a bulk ingestion body into a list of raw rows.
+    A JSON array is accepted as is; NDJSON (one object per line) is used when the content type says so
+    or when the body is not an array. NDJSON lines that are not valid JSON are kept as the exception
+    so the row gets reported as invalid instead of rejecting the whole batch.
+    """
+    body = body.strip()
+    if not body:
+        raise InvalidBulkPayloadException(detail="Bulk payload is empty")
+
+    is_ndjson = bool(content_type) and ("ndjson" in content_type or "jsonlines" in content_type)
+    if not is_ndjson and body.startswith(b"["):
+        try:
+            rows = orjson.loads(body)
+        except orjson.JSONDecodeError as e:
+            raise InvalidBulkPayloadException(detail=f"Invalid JSON array: {e}")
+    else:
+        rows = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                rows.append(orjson.loads(line))
+            except orjson.JSONDecodeError as e:
+                rows.append(e)
+
+    if len(rows) > settings.BULK_INSERT_MAX_ROWS:
+        raise InvalidBulkPayloadException(detail=f"Bulk payload exceeds {settings.BULK_INSERT_MAX_ROWS} rows")
+    return rows
+
+def _validate_bulk_row(row: Any) -> TransactionCreate:
+    if isinstance(row, Exception):
+        raise ValueError(f"Invalid JSON: {row}")
+    if not isinstance(row, dict):
+        raise ValueError("Each row must be a JSON object")
+    return TransactionCreate(**row)
+
+async def bulk_create_transactions(db: AsyncSession, rows: List[Any]) -> BulkTransactionResponse:
+    """
+    Validates and inserts many transactions.
+    Valid rows are inserted with executemany in chunks of BULK_INSERT_CHUNK_SIZE, each chunk in its own
+    savepoint together with one outbox event per user in the chunk, so one bad chunk does not lose the others.
+    The affected users are pinned to the primary at once; the outbox worker then updates aggregates and
+    invalidates analytics caches per user.
+    """
+    logger.info("Bulk creating %s transactions", len(rows))
+    results: List[Optional[BulkTransactionResult]] = [None] * len(rows)
+    pending = []
+
+    for index, row in enumerate(rows):
+        try:
+            transaction_data = _validate_bulk_row(row)
+        except ValidationError as e:
+            errors = [{"loc": list(error["loc"]), "msg": error["msg"]} for error in e.errors()]
+            results[index] = BulkTransactionResult(index=index, status="invalid", errors=errors)
+            continue
+        except ValueError as e:
+            results[index] = BulkTransactionResult(index=index, status="invalid", errors=[{"loc": [], "msg": str(e)}])
+            continue
+
+        pending.append((index, {
+            "id": uuid.uuid4(),
+            "user_id": transaction_data.user_id,
+            "transaction_amount": transaction_data.transaction_amount,
+            "transaction_type": TransactionType(transaction_data.transaction_type.value),
+            "transaction_date": transaction_data.transaction_date.replace(tzinfo=None),
+        }))
+
+    affected_users = set()
+    chunk_size = max(1, settings.BULK_INSERT_CHUNK_SIZE)
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        values = [values for _, values in chunk]
+        try:
+            async with db.begin_nested():
+                await db.execute(insert(Transaction), values)
+                by_user = defaultdict(list)
+                for v in values:
+                    by_user[v["user_id"]].append(v)
+                await record_events(db, [
+                    transaction_event(
+                        TRANSACTION_CREATED,
+                        user_id,
+                        [transaction_delta(v["user_id"], v["transaction_date"], v["transaction_amount"], v["transaction_type"]) for v in user_values],
+                        added_amounts=[v["transaction_amount"] for v in user_values],
+                    )
+                    for user_id, user_values in by_user.items()
+                ])
+        except SQLAlchemyError as e:
+            logger.error("Bulk insert chunk starting at row %s failed, error: %s", chunk[0][0], str(e))
+            for index, _ in chunk:
+                results[index] = BulkTransactionResult(index=index, status="failed", errors=[{"loc": [], "msg": "Database error while inserting the row"}])
+            continue
+
+        for index, v in chunk:
+            results[index] = BulkTransactionResult(index=index, status="created", id=str(v["id"]))
+            affected_users.add(v["user_id"])
+
+    await db.commit()
+    notify_outbox()
+    await record_committed_write(affected_users)
+
+    created = sum(1 for result in results if result.status == "created")
+    logger.info("Bulk created %s of %s transactions for %s users", created, len(rows), len(affected_users))
+    return BulkTransactionResponse(created=created, failed=len(rows) - created, results=results)
+
+EXPORT_COLUMNS = ("id", "user_id", "transaction_amount", "transaction_type", "transaction_date", "created_at", "updated_at", "cursor")
+
+def _export_row(row) -> dict:
+    return {
+        "id": str(row.id),
+        "user_id": str(row.user_id),
+        "transaction_amount": row.transaction_amount,
+        "transaction_type": row.transaction_type.value,
+        "transaction_date": row.transaction_date.isoformat(),
+        "created_at": row.created_at.isoformat(),
+        "updated_at": row.updated_at.isoformat(),
+        "cursor": encode_cursor(row.transaction_date, row.id),
+    }
+
+def _encode_export_chunk(rows, export_format: str) -> bytes:
+    if export_format == "ndjson":
+        return b"".join(orjson.dumps(_export_row(row)) + b"\n" for row in rows)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(_export_row(row).values())
+    return buffer.getvalue().encode()
+
+def export_transactions(user_id: str, export_format: str = "ndjson", after: Optional[str] = None) -> AsyncIterator[bytes]:
+    """
+    Streams all of a user's transactions ordered by (transaction_date, id).
+    Rows are read through a server-side cursor EXPORT_BATCH_SIZE at a time and encoded one batch per
+    chunk, so memory stays flat regardless of history size. Every row carries the cursor to resume after it.
+    The generator owns its session because the request-scoped one is closed before the body is streamed.
+    The cursor is decoded up front so a bad one is rejected before the response starts.
+    """
+    position = decode_cursor(after) if after else None
+
+    async def stream() -> AsyncIterator[bytes]:
+        logger.info("Exporting transactions for user_id: %s as %s, after: %s", user_id, export_format, after)
+        if export_format == "csv":
+            yield (",".join(EXPORT_COLUMNS) + "\r\n").encode()
+
+        query = (
+            select(
+                Transaction.id,
+                Transaction.user_id,
+                Transaction.transaction_amount,
+                Transaction.transaction_type,
+                Transaction.transaction_date,
+                Transaction.created_at,
+                Transaction.updated_at,
+            )
+            .where(Transaction.user_id == user_id)
+            .order_by(Transaction.transaction_date, Transaction.id)
+            .execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+        )
+        if position:
+            query = query.where(tuple_(Transaction.transaction_date, Transaction.id) > tuple_(*position))
+
+        exported = 0
+        async with await read_session(user_id) as session:
+            result = await session.stream(query)
+            async for rows in result.partitions():
+                exported += len(rows)
+                yield _encode_export_chunk(rows, export_format)
+        logger.info("Exported %s transactions for user_id: %s", exported, user_id)
+
+    return stream()
@@ -0,0 +1,41 @@
+import uuid
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.core.security import security
+from app.main import app
+from app.schemas.auth import Principal
+
+@pytest.fixture(autouse=True)
+def authenticated():
+    """Route tests run as a signed-in user; test_principal_cache covers the real token check."""
+    app.dependency_overrides[security.get_current_user] = lambda: Principal(id=uuid.uuid4(), email="test@example.com", full_name="Test User")
+    yield
+    app.dependency_overrides.pop(security.get_current_user, None)
+
+@pytest.fixture
+def mock_session():
+    """An async session that also works as `async with session_factory() as session`."""
+    session = MagicMock()
+    session.__aenter__ = AsyncMock(return_value=session)
+    session.__aexit__ = AsyncMock(return_value=False)
+    session.execute = AsyncMock(return_value=MagicMock())
+    session.commit = AsyncMock()
+    session.rollback = AsyncMock()
+    session.refresh = AsyncMock()
+    return session
+
+@pytest.fixture
+def session_factory(mock_session):
+    return MagicMock(return_value=mock_session)
+
+@pytest.fixture
+def returning(mock_session):
+    """Makes every `await session.execute(...)` return the given rows."""
+    def set_rows(*rows):
+        result = mock_session.execute.return_value
+        result.all.return_value = list(rows)
+        result.first.return_value = rows[0] if rows else None
+        result.scalars.return_value.all.return_value = list(rows)
+        result.scalars.return_value.first.return_value = rows[0] if rows else None
+        return mock_session
+    return set_rows
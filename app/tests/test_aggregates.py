@@ -0,0 +1,92 @@
+import pytest
+from datetime import date, datetime
+from unittest.mock import AsyncMock, MagicMock
+from app.services.aggregate_service import aggregates_need_backfill, apply_deltas, merge_daily_deltas, merge_deltas, split_range, transaction_delta
+
+USER_ID = "4f1c2a8e-7d3b-4a51-9a55-0c1e3f6b2d10"
+MORNING = datetime(2023, 11, 10, 9, 30)
+NEXT_DAY = datetime(2023, 11, 11, 14, 0)
+
+
+def test_transaction_delta_splits_credit_and_debit():
+    credit = transaction_delta(USER_ID, MORNING, 5000, "CREDIT")
+    debit = transaction_delta(USER_ID, MORNING, 2000, "DEBIT", sign=-1)
+
+    assert credit == {"user_id": USER_ID, "day": date(2023, 11, 10), "transaction_count": 1, "total_amount": 5000, "credit_amount": 5000, "debit_amount": 0}
+    assert debit == {"user_id": USER_ID, "day": date(2023, 11, 10), "transaction_count": -1, "total_amount": -2000, "credit_amount": 0, "debit_amount": -2000}
+
+
+def test_merge_deltas_nets_out_update():
+    # Changing the type keeps count and total but moves the amount between columns
+    merged = merge_deltas([
+        transaction_delta(USER_ID, MORNING, 5000, "CREDIT", sign=-1),
+        transaction_delta(USER_ID, MORNING, 5000, "DEBIT"),
+    ])
+
+    assert merged == [{"user_id": USER_ID, "transaction_count": 0, "total_amount": 0, "credit_amount": -5000, "debit_amount": 5000}]
+
+
+def test_merge_daily_deltas_moves_transaction_between_days():
+    deltas = [
+        transaction_delta(USER_ID, MORNING, 5000, "CREDIT", sign=-1),
+        transaction_delta(USER_ID, NEXT_DAY, 5000, "CREDIT"),
+    ]
+
+    # The user total is unchanged, but both day rows move
+    assert merge_deltas(deltas) == []
+    assert merge_daily_deltas(deltas) == [
+        {"user_id": USER_ID, "day": date(2023, 11, 10), "transaction_count": -1, "credit_amount": -5000, "debit_amount": 0},
+        {"user_id": USER_ID, "day": date(2023, 11, 11), "transaction_count": 1, "credit_amount": 5000, "debit_amount": 0},
+    ]
+
+
+def test_split_range_whole_days_need_no_raw_rows():
+    days, edges = split_range(datetime(2023, 11, 1), datetime(2023, 11, 11))
+
+    assert days == (date(2023, 11, 1), date(2023, 11, 11))
+    assert edges == []
+
+
+def test_split_range_partial_edges():
+    end = datetime(2023, 11, 13, 14, 0)
+    days, edges = split_range(MORNING, end)
+
+    assert days == (date(2023, 11, 11), date(2023, 11, 13))
+    assert edges == [(MORNING, datetime(2023, 11, 11)), (datetime(2023, 11, 13), end)]
+
+
+def test_split_range_without_whole_day_reads_raw_rows_once():
+    days, edges = split_range(MORNING, NEXT_DAY)
+
+    assert days is None
+    assert edges == [(MORNING, NEXT_DAY)]
+
+
+def test_merge_deltas_drops_noop_update():
+    merged = merge_deltas([
+        transaction_delta(USER_ID, MORNING, 5000, "CREDIT", sign=-1),
+        transaction_delta(USER_ID, MORNING, 5000, "CREDIT"),
+    ])
+
+    assert merged == []
+
+
+@pytest.mark.asyncio
+async def test_apply_deltas_skips_empty_batch():
+    db_session = AsyncMock()
+
+    await apply_deltas(db_session, [])
+
+    db_session.execute.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_aggregates_need_backfill_only_when_transactions_exist_without_aggregates():
+    db_session = AsyncMock()
+
+    db_session.execute.return_value = MagicMock(**{"one.return_value": (True, True)})
+    assert await aggregates_need_backfill(db_session)
+    db_session.execute.return_value = MagicMock(**{"one.return_value": (True, False)})
+    assert not await aggregates_need_backfill(db_session)
+    db_session.execute.return_value = MagicMock(**{"one.return_value": (False, True)})
+    assert not await aggregates_need_backfill(db_session)
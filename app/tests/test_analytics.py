@@ -3,6 +3,9 @@ from unittest.mock import AsyncMock, patch
 from httpx import AsyncClient
 from datetime import date
 from app.main import app  # Replace with the actual path to the main app instance
+from app.schemas.analytics import AnalyticsSummary
+from app.services.analytics_service import AnalyticsService
+from app.utils.cache import MISSING
 
 @pytest.fixture
 def mock_db():
@@ -10,7 +13,7 @@ def mock_db():
 
 @pytest.mark.asyncio
 @patch("app.routers.analytics.AnalyticsService.get_average_transaction_value", new_callable=AsyncMock)
-@patch("app.routers.analytics.get_db", new_callable=AsyncMock)
+@patch("app.routers.analytics.get_read_db", new_callable=AsyncMock)
 async def test_get_average_transaction_value(
     mock_get_db, mock_get_average_transaction_value, mock_db
 ):
@@ -29,7 +32,7 @@ async def test_get_average_transaction_value(
 
 @pytest.mark.asyncio
 @patch("app.routers.analytics.AnalyticsService.get_highest_transaction_day", new_callable=AsyncMock)
-@patch("app.routers.analytics.get_db", new_callable=AsyncMock)
+@patch("app.routers.analytics.get_read_db", new_callable=AsyncMock)
 async def test_get_highest_transaction_day(
     mock_get_db, mock_get_highest_transaction_day, mock_db
 ):
@@ -48,7 +51,7 @@ async def test_get_highest_transaction_day(
 
 @pytest.mark.asyncio
 @patch("app.routers.analytics.AnalyticsService.get_transaction_totals", new_callable=AsyncMock)
-@patch("app.routers.analytics.get_db", new_callable=AsyncMock)
+@patch("app.routers.analytics.get_read_db", new_callable=AsyncMock)
 async def test_get_transaction_totals(
     mock_get_db, mock_get_transaction_totals, mock_db
 ):
@@ -68,4 +71,86 @@ async def test_get_transaction_totals(
 
     # Assert the response
     assert response.status_code == 200
-    assert response.json() == expected_totals
\ No newline at end of file
+    assert response.json() == expected_totals
+
+def test_analytics_cache_keys_embed_generation():
+    keys = AnalyticsService.cache_keys("user123", 7, date(2023, 11, 1), date(2023, 11, 10))
+
+    assert keys["average_transaction_value"] == "average_transaction_value:user123:g7"
+    assert keys["transaction_totals"] == "transaction_totals:user123:g7:2023-11-01:2023-11-10"
+
+@pytest.mark.asyncio
+@patch("app.services.analytics_service.AnalyticsService._summary", new_callable=AsyncMock)
+async def test_existing_analytics_read_the_shared_summary(mock_summary, mock_db):
+    mock_summary.return_value = {
+        "transaction_count": 4,
+        "total_amount": 60000,
+        "credit_amount": 40000,
+        "debit_amount": 20000,
+        "highest_day": "2023-11-10",
+    }
+
+    summary = await AnalyticsService.get_summary(mock_db, "user123")
+
+    assert summary.average_transaction_value == 150.0
+    assert summary.highest_transaction_day == date(2023, 11, 10)
+    assert await AnalyticsService.get_average_transaction_value(mock_db, "user123") == 150.0
+    assert await AnalyticsService.get_highest_transaction_day(mock_db, "user123") == date(2023, 11, 10)
+    assert await AnalyticsService.get_transaction_totals(mock_db, "user123") == {"credit": 400.0, "debit": 200.0}
+    assert mock_summary.await_count == 4
+
+@pytest.mark.asyncio
+@patch("app.routers.analytics.AnalyticsService.get_summary", new_callable=AsyncMock)
+async def test_get_analytics_summary(mock_get_summary):
+    mock_get_summary.return_value = AnalyticsSummary(
+        transaction_count=4,
+        average_transaction_value=150.0,
+        credit_total=400.0,
+        debit_total=200.0,
+        highest_transaction_day=date(2023, 11, 10),
+    )
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.get("/analytics/user123/summary")
+
+    assert response.status_code == 200
+    assert response.json()["highest_transaction_day"] == "2023-11-10"
+    assert response.json()["average_transaction_value"] == 150.0
+
+@pytest.mark.asyncio
+@patch("app.services.analytics_service.cache")
+@patch("app.services.analytics_service.get_user_summaries", new_callable=AsyncMock)
+async def test_batch_reads_hits_with_one_mget_and_computes_misses_together(mock_get_user_summaries, mock_cache, mock_db):
+    cached_summary = {"transaction_count": 2, "total_amount": 30000, "credit_amount": 30000, "debit_amount": 0, "highest_day": "2023-11-10"}
+    mock_cache.get_generations = AsyncMock(return_value=[1, 0, 0])
+    mock_cache.get_many = AsyncMock(return_value=[cached_summary, MISSING, MISSING])
+    mock_cache.set_many = AsyncMock()
+    mock_get_user_summaries.return_value = {
+        "user2": {"transaction_count": 1, "total_amount": 5000, "credit_amount": 0, "debit_amount": 5000, "highest_day": date(2023, 11, 11)},
+    }
+
+    results = await AnalyticsService.get_batch(mock_db, ["user1", "user2", "user3"], ["average_transaction_value", "highest_transaction_day"])
+
+    assert results == {
+        "user1": {"average_transaction_value": 150.0, "highest_transaction_day": date(2023, 11, 10)},
+        "user2": {"average_transaction_value": 50.0, "highest_transaction_day": date(2023, 11, 11)},
+        "user3": {"average_transaction_value": 0.0, "highest_transaction_day": None},
+    }
+    mock_cache.get_many.assert_awaited_once_with(["analytics_summary:user1:g1", "analytics_summary:user2:g0", "analytics_summary:user3:g0"])
+    mock_get_user_summaries.assert_awaited_once_with(mock_db, ["user2", "user3"])
+    assert set(mock_cache.set_many.await_args.args[0]) == {"analytics_summary:user2:g0", "analytics_summary:user3:g0"}
+
+@pytest.mark.asyncio
+@patch("app.routers.analytics.AnalyticsService.get_batch", new_callable=AsyncMock)
+async def test_batch_analytics_route_deduplicates_users(mock_get_batch):
+    user_id = "6f1c2b9e-8f4a-4e1d-9c1b-2a3b4c5d6e7f"
+    mock_get_batch.return_value = {user_id: {"transaction_count": 2}}
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post("/analytics/batch", json={"user_ids": [user_id, user_id], "metrics": ["transaction_count"]})
+        invalid = await client.post("/analytics/batch", json={"user_ids": [user_id], "metrics": ["median"]})
+
+    assert response.status_code == 200
+    assert response.json() == {"results": {user_id: {"transaction_count": 2}}}
+    assert mock_get_batch.await_args.args[1:] == ([user_id], ["transaction_count"])
+    assert invalid.status_code == 422
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+import pytest
+from app.custom_exceptions.exceptions import ExecutorSaturatedException
+from app.utils.bounded_executor import BoundedExecutor
+
+
+@pytest.mark.asyncio
+async def test_run_returns_result_off_the_event_loop_and_records_timings():
+    executor = BoundedExecutor("test", size=2, max_queue=2)
+    loop_thread = threading.get_ident()
+
+    thread, total = await executor.run(lambda a, b: (threading.get_ident(), a + b), 2, 3)
+
+    assert total == 5
+    assert thread != loop_thread
+    report = executor.report()
+    assert report["completed"] == 1
+    assert report["failed"] == 0
+    assert report["running"] == 0 and report["queued"] == 0
+    assert report["run_ms_max"] >= report["run_ms_mean"] >= 0
+    executor.shutdown()
+
+@pytest.mark.asyncio
+async def test_run_rejects_calls_beyond_size_plus_queue():
+    executor = BoundedExecutor("test", size=1, max_queue=1)
+    release = threading.Event()
+
+    blocked = [asyncio.create_task(executor.run(release.wait)) for _ in range(2)]
+    await asyncio.sleep(0)
+    with pytest.raises(ExecutorSaturatedException) as exc:
+        await executor.run(lambda: None)
+    assert exc.value.status_code == 503
+
+    release.set()
+    await asyncio.gather(*blocked)
+    report = executor.report()
+    assert report["rejected"] == 1
+    assert report["completed"] == 2
+    # The second call waited for the first to finish before it got the thread
+    assert report["queue_wait_ms_max"] > 0
+    executor.shutdown()
+
+@pytest.mark.asyncio
+async def test_run_counts_failures_and_propagates_the_error():
+    executor = BoundedExecutor("test", size=1, max_queue=0)
+
+    def fail():
+        raise ValueError("bad ciphertext")
+
+    with pytest.raises(ValueError):
+        await executor.run(fail)
+    assert executor.report()["failed"] == 1
+    # The failed call released its slot
+    assert await executor.run(lambda: "ok") == "ok"
+    executor.shutdown()
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_keeps_its_slot_until_the_thread_finishes():
+    executor = BoundedExecutor("test", size=1, max_queue=0)
+    started, release = threading.Event(), threading.Event()
+
+    def work():
+        started.set()
+        release.wait()
+
+    caller = asyncio.create_task(executor.run(work))
+    await asyncio.get_running_loop().run_in_executor(None, started.wait)
+    caller.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await caller
+
+    # The thread is still busy, so the bound still holds
+    with pytest.raises(ExecutorSaturatedException):
+        await executor.run(lambda: None)
+
+    release.set()
+    for _ in range(100):
+        report = executor.report()
+        if report["completed"] == 1 and report["queued"] == 0:
+            break
+        await asyncio.sleep(0.01)
+    assert await executor.run(lambda: "ok") == "ok"
+    executor.shutdown()
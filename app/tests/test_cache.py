@@ -0,0 +1,210 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from datetime import datetime
+from app.schemas.transaction import TransactionResponse
+from app.utils.cache import COMPRESSED_FLAG, MISSING, Cache, LocalCache, get_codec
+from app.utils.response_cache import etag_matches, make_etag
+
+TRANSACTION = TransactionResponse(
+    id="123",
+    user_id="user123",
+    transaction_amount=15000,
+    transaction_date=datetime(2023, 11, 10, 12, 0),
+    transaction_type="CREDIT",
+    created_at=datetime(2023, 11, 10, 12, 0),
+    updated_at=datetime(2023, 11, 10, 12, 0),
+)
+
+
+def test_local_cache_evicts_least_recently_used():
+    local = LocalCache(max_entries=2, ttl=60)
+    local.set("a", 1)
+    local.set("b", 2)
+    local.get("a")
+    local.set("c", 3)
+
+    assert local.get("b") is MISSING
+    assert local.get("a") == 1
+    assert local.stats()["evictions"] == 1
+
+
+def test_local_cache_expires_entries():
+    local = LocalCache(max_entries=10, ttl=60)
+    local.set("a", 1, ttl=0.001)
+
+    with patch("app.utils.cache.time.monotonic", return_value=10**9):
+        assert local.get("a") is MISSING
+
+
+@pytest.mark.asyncio
+async def test_get_cache_serves_local_tier_without_redis():
+    cache = Cache()
+    cache.redis = AsyncMock()
+    cache.redis.get.return_value = cache.encode({"value": 15000})
+
+    assert await cache.get_cache("average_transaction_value:user123") == {"value": 15000}
+    assert await cache.get_cache("average_transaction_value:user123") == {"value": 15000}
+
+    cache.redis.get.assert_awaited_once()
+    assert cache.stats()["l1"]["hits"] == 1
+    assert cache.stats()["l2"]["hits"] == 1
+
+
+def test_invalidation_from_other_worker_drops_local_entry():
+    cache = Cache()
+    cache.local.set("transaction:123", {"id": "123"})
+    cache.local.set("transaction:456", {"id": "456"})
+
+    cache.handle_invalidation(f"{cache.instance_id} transaction:456")
+    cache.handle_invalidation("other-worker transaction:123")
+
+    assert cache.local.get("transaction:123") is MISSING
+    assert cache.local.get("transaction:456") == {"id": "456"}
+
+
+@pytest.mark.asyncio
+async def test_get_or_set_coalesces_concurrent_loads():
+    cache = Cache()
+    cache.redis = AsyncMock()
+    cache.redis.get.return_value = None
+    cache.redis.set.return_value = True
+    cache.set_cache = AsyncMock()
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def loader():
+        started.set()
+        await release.wait()
+        return {"value": 15000}
+
+    calls = [asyncio.ensure_future(cache.get_or_set("average_transaction_value:user123", loader, expire=100)) for _ in range(5)]
+    await started.wait()
+    release.set()
+
+    assert await asyncio.gather(*calls) == [{"value": 15000}] * 5
+    cache.set_cache.assert_awaited_once()
+    assert cache.stats()["loads"]["computed"] == 1
+    assert cache.stats()["loads"]["coalesced"] == 4
+    cache.redis.eval.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_get_or_set_serves_stale_value_while_refreshing():
+    cache = Cache()
+    cache.redis = AsyncMock()
+    cache.redis.set.return_value = True
+    cache.set_cache = AsyncMock()
+    cache.local.set("highest_transaction_day:user123", {"value": {"day": "2023-11-10"}, "fresh_until": time.time() - 1})
+    loader = AsyncMock()
+    refresh_loader = AsyncMock(return_value={"day": "2023-11-11"})
+
+    first = await cache.get_or_set("highest_transaction_day:user123", loader, expire=100, stale_ttl=30, refresh_loader=refresh_loader)
+    second = await cache.get_or_set("highest_transaction_day:user123", loader, expire=100, stale_ttl=30, refresh_loader=refresh_loader)
+    await asyncio.gather(*cache._background_refreshes)
+
+    assert first == second == {"day": "2023-11-10"}
+    loader.assert_not_awaited()
+    refresh_loader.assert_awaited_once()
+    assert cache.set_cache.await_args.kwargs["expire"] == 130
+
+
+@pytest.mark.asyncio
+async def test_get_or_set_waits_for_worker_holding_the_lock():
+    cache = Cache()
+    cache.redis = AsyncMock()
+    cache.redis.set.return_value = None  # Another worker holds the lock
+    cache.redis.get.side_effect = [None, None, cache.encode({"value": {"value": 15000}, "fresh_until": time.time() + 100})]
+    loader = AsyncMock()
+
+    assert await cache.get_or_set("average_transaction_value:user123", loader, expire=100) == {"value": 15000}
+    loader.assert_not_awaited()
+    cache.redis.eval.assert_not_awaited()
+    assert cache.stats()["loads"]["lock_waits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_bump_generation_retires_keys_built_from_old_generation():
+    cache = Cache()
+    cache.redis = MagicMock()
+    cache.redis.mget = AsyncMock(return_value=[b"4", None])
+    pipe = AsyncMock()
+    pipe.execute.return_value = [5, 1]
+    cache.redis.pipeline.return_value.__aenter__.return_value = pipe
+
+    assert await cache.get_generations(["analytics_generation:user123", "analytics_generation:user456"]) == [4, 0]
+    assert await cache.bump_generation("analytics_generation:user123") == 5
+    assert await cache.get_generation("analytics_generation:user123") == 5
+
+    pipe.incr.assert_called_once_with("analytics_generation:user123")
+    cache.redis.mget.assert_awaited_once()
+
+
+@pytest.mark.parametrize("codec_name", ["json", "orjson", "msgpack"])
+def test_codecs_round_trip_typed_and_untyped_values(codec_name):
+    cache = Cache()
+    cache.codec = get_codec(codec_name)
+
+    assert cache.decode(cache.encode(TRANSACTION), model=TransactionResponse) == TRANSACTION
+    assert cache.decode(cache.encode({"credit": 2000, "debit": 1000})) == {"credit": 2000, "debit": 1000}
+
+
+def test_frames_are_readable_by_workers_using_another_codec():
+    writer = Cache()
+    writer.codec = get_codec("msgpack")
+    reader = Cache()
+    reader.codec = get_codec("orjson")
+
+    assert reader.decode(writer.encode(TRANSACTION), model=TransactionResponse) == TRANSACTION
+
+
+def test_large_payloads_are_compressed():
+    cache = Cache()
+    cache.compression_threshold = 256
+    small = cache.encode({"value": 15000})
+    large = cache.encode({"items": [TRANSACTION] * 50})
+
+    assert not small[0] & COMPRESSED_FLAG
+    assert large[0] & COMPRESSED_FLAG
+    assert len(cache.decode(large)["items"]) == 50
+
+
+@pytest.mark.asyncio
+async def test_get_cache_treats_undecodable_entry_as_miss():
+    cache = Cache()
+    cache.redis = AsyncMock()
+    cache.redis.get.return_value = b'{"legacy": "json"}'
+
+    assert await cache.get_cache("transaction:123", model=TransactionResponse) is None
+    assert cache.stats()["l2"]["misses"] == 1
+
+
+def test_etag_matches_if_none_match_lists_and_weak_tags():
+    etag = make_etag(b'{"value": 150.0}')
+
+    assert etag == make_etag(b'{"value": 150.0}') != make_etag(b'{"value": 151.0}')
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other"', etag)
+
+
+@pytest.mark.asyncio
+async def test_get_many_and_set_many_use_one_round_trip():
+    cache = Cache()
+    cache.redis = MagicMock()
+    pipe = MagicMock()
+    pipe.execute = AsyncMock()
+    cache.redis.pipeline.return_value.__aenter__.return_value = pipe
+    fresh = cache.encode({"value": {"transaction_count": 2}, "fresh_until": time.time() + 100})
+    expired = cache.encode({"value": {"transaction_count": 1}, "fresh_until": time.time() - 1})
+    cache.redis.mget = AsyncMock(return_value=[fresh, expired, None])
+
+    assert await cache.get_many(["a", "b", "c"]) == [{"transaction_count": 2}, MISSING, MISSING]
+
+    await cache.set_many({"b": {"transaction_count": 3}, "c": {"transaction_count": 0}}, expire=100, stale_ttl=30)
+
+    assert await cache.get_many(["a", "b", "c"]) == [{"transaction_count": 2}, {"transaction_count": 3}, {"transaction_count": 0}]
+    cache.redis.mget.assert_awaited_once()
+    pipe.execute.assert_awaited_once()
+    assert pipe.set.call_args.kwargs == {"ex": 130}
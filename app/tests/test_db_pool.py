@@ -0,0 +1,67 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy import exc
+from sqlalchemy.util import greenlet_spawn
+from app.db.pool import InstrumentedPool
+from app.db.session import ReplicaRouter
+
+
+def checkout_three(pool: InstrumentedPool):
+    connections = [pool.connect(), pool.connect()]
+    with pytest.raises(exc.TimeoutError):
+        pool.connect()
+    for connection in connections:
+        connection.close()
+
+
+@pytest.mark.asyncio
+async def test_instrumented_pool_reports_overflow_and_timeouts():
+    pool = InstrumentedPool(MagicMock, pool_size=1, max_overflow=1, timeout=0.01)
+
+    await greenlet_spawn(checkout_three, pool)
+    report = pool.report()
+
+    assert report["checkouts"] == 2
+    assert report["overflow_events"] == 1
+    assert report["timeouts"] == 1
+    assert report["checked_out"] == 0
+    assert report["wait_ms_max"] >= 0
+
+
+def replica_router(pin_seconds: int = 5) -> ReplicaRouter:
+    return ReplicaRouter(MagicMock(name="writer"), [MagicMock(name="replica1"), MagicMock(name="replica2")], pin_seconds=pin_seconds)
+
+
+@pytest.mark.asyncio
+@patch("app.db.session.cache.redis")
+async def test_replica_router_round_robins_over_healthy_replicas(mock_redis):
+    mock_redis.exists = AsyncMock(return_value=0)
+    router = replica_router()
+    first, second = router.replicas
+
+    assert [await router.engine_for("user123") for _ in range(3)] == [first, second, first]
+
+    router._check = AsyncMock(side_effect=[False, True])
+    await router.check_health()
+    assert [await router.engine_for("user123") for _ in range(2)] == [second, second]
+
+    router._check = AsyncMock(return_value=False)
+    await router.check_health()
+    assert await router.engine_for("user123") is router.writer
+
+
+@pytest.mark.asyncio
+@patch("app.db.session.cache.redis")
+async def test_replica_router_pins_recent_writers_to_primary(mock_redis):
+    mock_redis.set = AsyncMock()
+    mock_redis.exists = AsyncMock(return_value=1)
+    router = replica_router(pin_seconds=5)
+
+    await router.pin("user123")
+
+    mock_redis.set.assert_awaited_once_with("primary_pin:user123", b"1", ex=5)
+    assert await router.engine_for("user123") is router.writer
+    assert await router.engine_for() in router.replicas
+
+    mock_redis.exists = AsyncMock(side_effect=ConnectionError("redis down"))
+    assert await router.engine_for("user123") is router.writer
@@ -0,0 +1,84 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from app.db.session import DB_STATEMENT_SECONDS, instrument_statements, statement_kind
+from app.services.analytics_service import ANALYTICS_CACHE_LOOKUPS, AnalyticsService
+from app.utils.metrics import HTTP_REQUEST_SECONDS, MetricsMiddleware, MetricsRegistry
+
+
+def test_registry_renders_prometheus_text_with_cumulative_buckets():
+    registry = MetricsRegistry()
+    lookups = registry.counter("lookups_total", "Lookups", ("result",))
+    latency = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    lookups.inc(("hit",))
+    lookups.inc(("hit",), 2)
+    latency.observe(('/a/"b"',), 0.05)
+    latency.observe(('/a/"b"',), 0.5)
+    latency.observe(('/a/"b"',), 3)
+
+    assert registry.render().splitlines() == [
+        "# HELP lookups_total Lookups",
+        "# TYPE lookups_total counter",
+        'lookups_total{result="hit"} 3',
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="/a/\\"b\\"",le="0.1"} 1',
+        'latency_seconds_bucket{route="/a/\\"b\\"",le="1"} 2',
+        'latency_seconds_bucket{route="/a/\\"b\\"",le="+Inf"} 3',
+        'latency_seconds_sum{route="/a/\\"b\\""} 3.55',
+        'latency_seconds_count{route="/a/\\"b\\""} 3',
+    ]
+    with pytest.raises(ValueError):
+        registry.counter("lookups_total", "Again")
+
+
+def test_middleware_labels_requests_by_route_template():
+    app = FastAPI()
+
+    @app.get("/metrics_test/{user_id}/summary")
+    async def summary(user_id: str):
+        return {"user_id": user_id}
+
+    app.add_middleware(MetricsMiddleware)
+    client = TestClient(app)
+    before = HTTP_REQUEST_SECONDS.count(("GET", "/metrics_test/{user_id}/summary", "200"))
+
+    client.get("/metrics_test/u1/summary")
+    client.get("/metrics_test/u2/summary")
+    client.get("/metrics_test_missing")
+
+    assert HTTP_REQUEST_SECONDS.count(("GET", "/metrics_test/{user_id}/summary", "200")) == before + 2
+    assert HTTP_REQUEST_SECONDS.count(("GET", "unmatched", "404")) >= 1
+
+
+def test_statement_timings_are_labelled_by_kind():
+    engine = create_engine("sqlite://")
+    instrument_statements(engine, "test")
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        conn.execute(text("  select 2"))
+        conn.execute(text("PRAGMA user_version"))
+
+    assert DB_STATEMENT_SECONDS.count(("test", "SELECT")) == 2
+    assert DB_STATEMENT_SECONDS.count(("test", "OTHER")) == 1
+    assert statement_kind("\n(SELECT 1) UNION (SELECT 2)") == "SELECT"
+
+
+@pytest.mark.asyncio
+@patch("app.services.analytics_service.cache")
+async def test_cached_counts_hits_and_misses_per_method(mock_cache):
+    async def get_or_set(key, loader, **kwargs):
+        return await loader() if key == "cold" else "cached"
+
+    mock_cache.get_or_set = AsyncMock(side_effect=get_or_set)
+    compute = AsyncMock(return_value="computed")
+    hits, misses = ANALYTICS_CACHE_LOOKUPS.value(("test_method", "hit")), ANALYTICS_CACHE_LOOKUPS.value(("test_method", "miss"))
+
+    assert await AnalyticsService._cached(AsyncMock(), "user1", "cold", compute, method="test_method") == "computed"
+    assert await AnalyticsService._cached(AsyncMock(), "user1", "warm", compute, method="test_method") == "cached"
+
+    assert ANALYTICS_CACHE_LOOKUPS.value(("test_method", "hit")) == hits + 1
+    assert ANALYTICS_CACHE_LOOKUPS.value(("test_method", "miss")) == misses + 1
@@ -0,0 +1,132 @@
+import pytest
+from datetime import date, datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+from app.services.outbox_service import transaction_event
+from app.services.outbox_worker import OutboxWorker
+from app.services.sketch_service import request_rebuild, take_rebuild_requests
+from app.services.aggregate_service import transaction_delta
+
+USER_A = "4f1c2a8e-7d3b-4a51-9a55-0c1e3f6b2d10"
+USER_B = "0a9e1b7c-2f4d-4e8a-b1c3-5d6f7a8b9c0d"
+
+
+def event(event_id, user_id, deltas=(), attempts=0, **kwargs):
+    built = transaction_event("transaction_created", user_id, deltas, **kwargs)
+    return SimpleNamespace(id=event_id, user_id=user_id, payload=built["payload"], attempts=attempts)
+
+
+def test_transaction_event_payload_is_json_ready():
+    built = transaction_event(
+        "transaction_updated",
+        USER_A,
+        [transaction_delta(USER_A, datetime(2023, 11, 10, 9, 30), 5000, "CREDIT", sign=-1)],
+        discard_sketch=True,
+        transaction_ids=["t1"],
+    )
+
+    assert built["payload"] == {
+        "deltas": [{"user_id": USER_A, "day": "2023-11-10", "transaction_count": -1, "total_amount": -5000, "credit_amount": -5000, "debit_amount": 0}],
+        "added_amounts": [],
+        "discard_sketch": True,
+        "transaction_ids": ["t1"],
+    }
+
+
+@pytest.mark.asyncio
+@patch("app.services.outbox_worker.discard_sketches", new_callable=AsyncMock)
+@patch("app.services.outbox_worker.add_to_sketches", new_callable=AsyncMock)
+@patch("app.services.outbox_worker.apply_deltas", new_callable=AsyncMock)
+async def test_apply_pending_applies_deltas_and_marks_events_in_one_transaction(mock_apply_deltas, mock_add_to_sketches, mock_discard_sketches, session_factory, returning):
+    rows = [
+        event(1, USER_B, deltas=[transaction_delta(USER_B, datetime(2023, 11, 11), 700, "DEBIT")], added_amounts=[700]),
+        event(2, USER_A, deltas=[transaction_delta(USER_A, datetime(2023, 11, 10), 5000, "CREDIT", sign=-1)], discard_sketch=True),
+    ]
+    session = returning(*rows)
+    worker = OutboxWorker(session_factory=session_factory, batch_size=10)
+
+    assert await worker.apply_pending() == 2
+
+    deltas = mock_apply_deltas.await_args.args[1]
+    # Decoded and sorted by user, so every worker locks aggregate rows in the same order
+    assert [(delta["user_id"], delta["day"]) for delta in deltas] == [(USER_B, date(2023, 11, 11)), (USER_A, date(2023, 11, 10))]
+    mock_add_to_sketches.assert_awaited_once_with(session, {USER_B: [700]})
+    mock_discard_sketches.assert_awaited_once_with(session, [USER_A])
+    assert "applied" in str(session.execute.await_args_list[1].args[0])
+    session.commit.assert_awaited_once()
+    assert worker.applied_total == 2
+    # Rebuilt by the worker once the discard is committed, not by the next read
+    assert take_rebuild_requests() == [USER_A]
+
+
+@pytest.mark.asyncio
+@patch("app.services.outbox_worker.discard_sketches", new_callable=AsyncMock)
+@patch("app.services.outbox_worker.add_to_sketches", new_callable=AsyncMock)
+@patch("app.services.outbox_worker.apply_deltas", new_callable=AsyncMock)
+async def test_apply_pending_retries_a_failed_batch_one_by_one_and_dead_letters_poison_events(mock_apply_deltas, mock_add_to_sketches, mock_discard_sketches, session_factory, returning):
+    rows = [event(1, USER_A, added_amounts=[100]), event(2, USER_B, added_amounts=[200], attempts=2), event(3, USER_A, added_amounts=[300])]
+    session = returning(*rows)
+
+    async def add_to_sketches(db, amounts):
+        if USER_B in amounts:
+            raise ValueError("bad payload")
+
+    mock_add_to_sketches.side_effect = add_to_sketches
+    worker = OutboxWorker(session_factory=session_factory, batch_size=10, max_attempts=3)
+
+    assert await worker.apply_pending() == 2
+
+    # The batch, then each event in its own savepoint
+    assert session.begin_nested.call_count == 4
+    failure, mark_applied = (call.args[0] for call in session.execute.await_args_list[1:])
+    assert failure.compile().params == {"attempts": 3, "last_error": "bad payload", "dead_lettered": True, "id_1": 2}
+    assert mark_applied.compile().params["id_1"] == [1, 3]
+    session.commit.assert_awaited_once()
+    assert (worker.applied_total, worker.failed_total, worker.dead_lettered_total) == (2, 1, 1)
+
+
+@pytest.mark.asyncio
+@patch("app.services.outbox_worker.invalidate_transaction_cache", new_callable=AsyncMock)
+@patch("app.services.outbox_worker.record_user_write", new_callable=AsyncMock)
+async def test_acknowledge_runs_side_effects_once_per_user_then_deletes(mock_record_user_write, mock_invalidate_transaction_cache, session_factory, returning):
+    rows = [event(1, USER_A, transaction_ids=["t1"]), event(2, USER_A, transaction_ids=["t1", "t2"]), event(3, USER_B)]
+    session = returning(*rows)
+    worker = OutboxWorker(session_factory=session_factory)
+
+    assert await worker.acknowledge_applied() == 3
+
+    assert [call.args[0] for call in mock_record_user_write.await_args_list] == [USER_A, USER_B]
+    assert [call.args[0] for call in mock_invalidate_transaction_cache.await_args_list] == ["t1", "t2"]
+    assert str(session.execute.await_args_list[1].args[0]).startswith("DELETE FROM outbox_events")
+    session.commit.assert_awaited_once()
+    assert worker.drain_rate == pytest.approx(3 / 60)
+
+
+@pytest.mark.asyncio
+@patch("app.services.outbox_worker.record_user_write", new_callable=AsyncMock, side_effect=ConnectionError("redis down"))
+async def test_acknowledge_keeps_events_when_redis_fails(mock_record_user_write, session_factory, returning):
+    session = returning(event(1, USER_A))
+    worker = OutboxWorker(session_factory=session_factory)
+
+    with pytest.raises(ConnectionError):
+        await worker.acknowledge_applied()
+
+    # Not deleted, so the next drain retries the side effects
+    assert session.execute.await_count == 1
+    session.commit.assert_not_awaited()
+    assert worker.acknowledged_total == 0
+
+
+@pytest.mark.asyncio
+@patch("app.services.outbox_worker.rebuild_sketch", new_callable=AsyncMock)
+async def test_rebuild_sketches_retries_users_that_are_still_pending(mock_rebuild_sketch, session_factory, returning):
+    session = returning()
+    worker = OutboxWorker(session_factory=session_factory)
+    mock_rebuild_sketch.side_effect = lambda db, user_id: user_id == USER_A
+    request_rebuild([USER_A, USER_B])
+
+    assert await worker.rebuild_sketches() == 1
+
+    assert [call.args[1] for call in mock_rebuild_sketch.await_args_list] == [USER_B, USER_A]
+    # USER_B had pending events, so it is asked for again
+    assert take_rebuild_requests() == [USER_B]
@@ -0,0 +1,84 @@
+import pytest
+from datetime import date
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy.dialects import postgresql
+from app.services.sketch_service import take_rebuild_requests
+from app.db.partitioning import PartitionMaintainer, detach_old_partitions, ensure_partitions
+
+USER_ID = "4f1c2a8e-7d3b-4a51-9a55-0c1e3f6b2d10"
+
+
+def executed_sql(conn):
+    return [str(call.args[0]) for call in conn.execute.await_args_list]
+
+
+@pytest.mark.asyncio
+@patch("app.db.partitioning.default_partition_months", new_callable=AsyncMock, return_value=[])
+@patch("app.db.partitioning.list_partitions", new_callable=AsyncMock)
+async def test_ensure_partitions_creates_missing_months_across_year_end(mock_list_partitions, mock_default_months):
+    conn = AsyncMock()
+    mock_list_partitions.return_value = ["transactions_default", "transactions_p202311"]
+
+    created = await ensure_partitions(conn, months_ahead=2, today=date(2023, 11, 20))
+
+    assert created == ["transactions_p202312", "transactions_p202401"]
+    assert "FOR VALUES FROM ('2024-01-01') TO ('2024-02-01')" in executed_sql(conn)[-1]
+
+
+@pytest.mark.asyncio
+@patch("app.db.partitioning.default_partition_months", new_callable=AsyncMock)
+@patch("app.db.partitioning.list_partitions", new_callable=AsyncMock)
+async def test_ensure_partitions_moves_historical_rows_out_of_the_default_partition(mock_list_partitions, mock_default_months):
+    conn = AsyncMock()
+    mock_list_partitions.return_value = ["transactions_default", "transactions_p202311"]
+    mock_default_months.return_value = [date(2021, 3, 1), date(2023, 11, 1)]
+
+    created = await ensure_partitions(conn, months_ahead=0, today=date(2023, 11, 20))
+
+    assert created == ["transactions_p202103"]
+    sql = executed_sql(conn)
+    assert sql[0].startswith("CREATE TABLE transactions_p202103 (LIKE transactions")
+    assert "DELETE FROM transactions_default WHERE transaction_date >= '2021-03-01' AND transaction_date < '2021-04-01'" in sql[2]
+    assert sql[3] == "ALTER TABLE transactions ATTACH PARTITION transactions_p202103 FOR VALUES FROM ('2021-03-01') TO ('2021-04-01')"
+
+
+@pytest.mark.asyncio
+@patch("app.db.partitioning.list_partitions", new_callable=AsyncMock)
+async def test_detach_old_partitions_keeps_retention_window_and_default(mock_list_partitions, returning):
+    conn = returning(USER_ID)
+    mock_list_partitions.return_value = ["transactions_default", "transactions_p202308", "transactions_p202309", "transactions_p202311"]
+
+    detached = await detach_old_partitions(conn, retention_months=2, today=date(2023, 11, 20))
+
+    assert detached == ["transactions_p202308"]
+    users, aggregates, rollups, empty_rollups, sketches, detach = (call.args[0] for call in conn.execute.await_args_list)
+    # The month's raw rows leave the aggregates and rollups in the transaction that detaches them
+    assert users.compile().params == {"transaction_date_1": date(2023, 8, 1), "transaction_date_2": date(2023, 9, 1)}
+    for stmt, table in ((aggregates, "user_transaction_aggregates"), (rollups, "user_daily_transaction_rollups")):
+        sql = str(stmt.compile(dialect=postgresql.dialect()))
+        assert sql.startswith(f"INSERT INTO {table}") and "-anon_1.transaction_count" in sql
+        assert "ON CONFLICT" in sql and f"transaction_count = ({table}.transaction_count + excluded.transaction_count)" in sql
+    assert str(empty_rollups).startswith("DELETE FROM user_daily_transaction_rollups")
+    assert sketches.compile().params["user_id_1"] == [USER_ID]
+    assert str(detach) == "ALTER TABLE transactions DETACH PARTITION transactions_p202308"
+
+
+@pytest.mark.asyncio
+@patch("app.db.partitioning.detach_partition", new_callable=AsyncMock, return_value=["u1"])
+@patch("app.db.partitioning.create_partition", new_callable=AsyncMock)
+@patch("app.db.partitioning.expired_partitions", new_callable=AsyncMock, return_value=["transactions_p202001"])
+@patch("app.db.partitioning.missing_partitions", new_callable=AsyncMock)
+@patch("app.db.partitioning.transactions_table_kind", new_callable=AsyncMock, return_value="p")
+async def test_run_once_keeps_going_when_one_partition_fails(mock_kind, mock_missing, mock_expired, mock_create, mock_detach):
+    mock_missing.return_value = [(date(2021, 3, 1), True), (date(2023, 12, 1), False)]
+    mock_create.side_effect = [Exception("range overlaps"), "transactions_p202312"]
+    engine = MagicMock()
+
+    await PartitionMaintainer(engine, months_ahead=1, retention_months=12).run_once()
+
+    assert mock_create.await_count == 2
+    mock_detach.assert_awaited_once()
+    # Sketches the detach discarded are rebuilt by the outbox worker
+    assert take_rebuild_requests() == ["u1"]
+    # One transaction per partition created or detached
+    assert engine.begin.call_count == 3
@@ -0,0 +1,91 @@
+import time
+import uuid
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from app.core.principal_cache import PrincipalCache
+from app.core.security import security
+from app.main import app
+from app.schemas.auth import Principal
+
+USER_ID = uuid.UUID("4f1c2a8e-7d3b-4a51-9a55-0c1e3f6b2d10")
+EMAIL = "ama@example.com"
+
+
+def principal(email=EMAIL):
+    return Principal(id=USER_ID, email=email, full_name="Ama Mensah")
+
+def token():
+    return security.create_access_token({"sub": EMAIL, "user_id": str(USER_ID)})
+
+
+def test_get_requires_matching_email_and_respects_token_expiry():
+    principals = PrincipalCache(max_entries=10, ttl=300)
+    principals.set(principal(), time.time() + 60)
+
+    assert principals.get(str(USER_ID), EMAIL).full_name == "Ama Mensah"
+    # A token for the same id but another email must not see this principal
+    assert principals.get(str(USER_ID), "other@example.com") is None
+
+    # An already expired token never caches
+    principals.set(principal(), time.time() - 1)
+    assert principals.get(str(USER_ID), EMAIL) is None
+
+def test_invalidation_from_another_worker_drops_only_principals():
+    principals = PrincipalCache(max_entries=10, ttl=300)
+    principals.set(principal(), time.time() + 60)
+
+    principals.handle_invalidation("analytics:gen:x")
+    assert principals.get(str(USER_ID), EMAIL) is not None
+
+    principals.handle_invalidation(PrincipalCache.key(USER_ID))
+    assert principals.get(str(USER_ID), EMAIL) is None
+
+@pytest.mark.asyncio
+async def test_invalidate_drops_locally_and_broadcasts():
+    principals = PrincipalCache(max_entries=10, ttl=300)
+    principals.set(principal(), time.time() + 60)
+
+    with patch("app.core.principal_cache.cache.redis.publish", new_callable=AsyncMock) as publish:
+        await principals.invalidate(USER_ID)
+
+    assert principals.get(str(USER_ID), EMAIL) is None
+    assert publish.await_args.args[1].endswith(PrincipalCache.key(USER_ID))
+
+@pytest.mark.asyncio
+async def test_get_current_user_reads_the_database_once_per_principal(returning):
+    principals = PrincipalCache(max_entries=10, ttl=300)
+    db = returning(SimpleNamespace(id=USER_ID, email=EMAIL, full_name=security.encrypt("Ama Mensah")))
+
+    with patch("app.core.security.principal_cache", principals):
+        first = await security.get_current_user(token(), db)
+        second = await security.get_current_user(token(), db)
+
+    assert first == second == principal()
+    db.execute.assert_awaited_once()
+    stats = principals.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.5
+
+@pytest.mark.asyncio
+async def test_get_current_user_rejects_unknown_user_and_bad_token(returning):
+    principals = PrincipalCache(max_entries=10, ttl=300)
+
+    with patch("app.core.security.principal_cache", principals):
+        with pytest.raises(HTTPException) as exc:
+            await security.get_current_user(token(), returning(None))
+        assert exc.value.status_code == 401
+
+        with pytest.raises(HTTPException) as exc:
+            await security.get_current_user("not-a-token", returning(None))
+        assert exc.value.status_code == 401
+
+def test_transaction_analytics_and_monitoring_routes_require_a_token():
+    app.dependency_overrides.pop(security.get_current_user, None)
+    client = TestClient(app)
+
+    assert client.get("/transactions/t1").status_code == 401
+    assert client.get("/analytics/user123/summary").status_code == 401
+    assert client.get("/monitoring/db_pool").status_code == 401
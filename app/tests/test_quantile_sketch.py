@@ -0,0 +1,69 @@
+import random
+import pytest
+from bisect import bisect_left
+from unittest.mock import AsyncMock, patch
+from app.services.analytics_service import AnalyticsService
+from app.services.sketch_service import take_rebuild_requests
+from app.utils.quantile_sketch import KLLSketch
+
+def rank_error(ordered, value, fraction):
+    return abs(bisect_left(ordered, value) / len(ordered) - fraction)
+
+def test_sketch_stays_small_and_within_rank_error():
+    rng = random.Random(7)
+    values = [int(rng.lognormvariate(8, 1.5)) for _ in range(50000)]
+    sketch = KLLSketch(200)
+    sketch.update_many(values)
+
+    ordered = sorted(values)
+    for fraction, estimate in zip((0.5, 0.9, 0.99), sketch.quantiles((0.5, 0.9, 0.99))):
+        assert rank_error(ordered, estimate, fraction) < 0.02
+    assert sketch.quantiles((0, 1)) == [ordered[0], ordered[-1]]
+    assert sketch.n == len(values)
+    assert len(sketch.to_bytes()) < 8 * 1024
+
+def test_merged_sketches_answer_for_the_union():
+    rng = random.Random(11)
+    low, high = [rng.randint(1, 1000) for _ in range(20000)], [rng.randint(1000, 2000) for _ in range(20000)]
+    left, right = KLLSketch(200), KLLSketch(200)
+    left.update_many(low)
+    right.update_many(high)
+
+    left.merge(right)
+
+    assert left.n == 40000 and left.min >= 1 and left.max <= 2000
+    assert rank_error(sorted(low + high), left.quantile(0.5), 0.5) < 0.02
+
+def test_bytes_round_trip_keeps_the_sketch():
+    sketch = KLLSketch(50)
+    sketch.update_many(range(1000))
+
+    restored = KLLSketch.from_bytes(sketch.to_bytes())
+
+    assert restored.levels == sketch.levels
+    assert (restored.n, restored.min, restored.max) == (1000, 0, 999)
+    restored.update(5000)
+    assert restored.max == 5000
+    assert KLLSketch.from_bytes(KLLSketch(50).to_bytes()).quantile(0.5) is None
+
+@pytest.mark.asyncio
+@patch("app.services.analytics_service.cache")
+@patch("app.services.analytics_service.scan_sketch", new_callable=AsyncMock)
+@patch("app.services.analytics_service.load_sketch", new_callable=AsyncMock)
+async def test_percentiles_scan_a_missing_sketch_on_the_read_session_and_leave_the_rebuild_to_the_worker(mock_load_sketch, mock_scan_sketch, mock_cache):
+    async def get_or_set(key, loader, **kwargs):
+        return await loader()
+
+    mock_cache.get_generation = AsyncMock(return_value=0)
+    mock_cache.get_or_set = AsyncMock(side_effect=get_or_set)
+    sketch = KLLSketch(200)
+    sketch.update_many([1000, 2000, 3000, 4000, 100000])
+    mock_load_sketch.return_value = None
+    mock_scan_sketch.return_value = sketch
+    db = AsyncMock()
+
+    percentiles = await AnalyticsService.get_transaction_value_percentiles(db, "user1")
+
+    mock_scan_sketch.assert_awaited_once_with(db, "user1")
+    assert take_rebuild_requests() == ["user1"]
+    assert percentiles == {"median": 30.0, "p90": 1000.0, "p99": 1000.0}
@@ -0,0 +1,80 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.utils.rate_limit import RateLimiter, RateLimitMiddleware, RateLimitRule
+
+RULES = [RateLimitRule("client", "/", 100, 10), RateLimitRule("analytics", "/analytics", 10, 1)]
+
+
+def limiter(**kwargs):
+    return RateLimiter(RULES, exempt_paths=("/monitoring",), **kwargs)
+
+
+def test_matching_rules_apply_route_buckets_and_exemptions():
+    rate_limiter = limiter()
+
+    assert [rule.name for rule in rate_limiter.matching_rules("/transactions/")] == ["client"]
+    assert [rule.name for rule in rate_limiter.matching_rules("/analytics/u1/summary")] == ["client", "analytics"]
+    assert rate_limiter.matching_rules("/monitoring/cache") == []
+
+@pytest.mark.asyncio
+async def test_requests_well_under_the_limit_skip_redis_and_are_debited_on_the_next_sync():
+    rate_limiter = limiter(local_fraction=0.5, sync_seconds=60)
+    rules = RULES[:1]
+
+    with patch("app.utils.rate_limit.cache.redis.eval", new_callable=AsyncMock, return_value=[1, 0, 99]) as eval_script:
+        assert await rate_limiter.check("10.0.0.1", rules) == (True, 0)
+        # 99 left: the next 49 requests leave at least half the capacity and never reach Redis
+        for _ in range(49):
+            assert await rate_limiter.check("10.0.0.1", rules) == (True, 0)
+        assert eval_script.await_count == 1
+
+        await rate_limiter.check("10.0.0.1", rules)
+
+    assert eval_script.await_count == 2
+    keys_and_args = eval_script.await_args.args[2:]
+    assert keys_and_args == ("rate_limit:client:10.0.0.1", 100, 10.0, 49)
+    assert rate_limiter.stats()["local_allowed"] == 49
+
+@pytest.mark.asyncio
+async def test_rejected_client_is_turned_away_locally_until_retry_after():
+    rate_limiter = limiter()
+
+    with patch("app.utils.rate_limit.cache.redis.eval", new_callable=AsyncMock, return_value=[0, 2500, 50, 0]) as eval_script:
+        assert await rate_limiter.check("10.0.0.1", RULES) == (False, 3)
+        allowed, retry_after = await rate_limiter.check("10.0.0.1", RULES)
+
+    assert not allowed and 1 <= retry_after <= 3
+    eval_script.assert_awaited_once()
+    assert rate_limiter.stats()["rejected"] == 2
+
+@pytest.mark.asyncio
+async def test_redis_failure_lets_requests_through_and_keeps_local_spending():
+    rate_limiter = limiter(sync_seconds=0)
+
+    with patch("app.utils.rate_limit.cache.redis.eval", new_callable=AsyncMock, side_effect=ConnectionError("down")):
+        assert await rate_limiter.check("10.0.0.1", RULES) == (True, 0)
+
+    assert rate_limiter.stats()["redis_errors"] == 1
+
+
+def test_middleware_answers_429_with_retry_after():
+    app = FastAPI()
+
+    @app.get("/analytics/ping")
+    async def ping():
+        return {"ok": True}
+
+    rate_limiter = limiter(sync_seconds=0)
+    app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+    client = TestClient(app)
+
+    with patch("app.utils.rate_limit.cache.redis.eval", new_callable=AsyncMock, return_value=[1, 0, 99, 9]):
+        assert client.get("/analytics/ping").status_code == 200
+    with patch("app.utils.rate_limit.cache.redis.eval", new_callable=AsyncMock, return_value=[0, 1000, 98, 0]):
+        response = client.get("/analytics/ping")
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+    assert response.json() == {"detail": "Too many requests"}
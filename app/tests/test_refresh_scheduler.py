@@ -0,0 +1,69 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.services.refresh_scheduler import AnalyticsRefreshScheduler
+
+USER_A = "4f1c2a8e-7d3b-4a51-9a55-0c1e3f6b2d10"
+USER_B = "0a9e1b7c-2f4d-4e8a-b1c3-5d6f7a8b9c0d"
+USER_C = "9d8c7b6a-5f4e-4d3c-a2b1-0e9f8a7b6c5d"
+
+
+def test_track_keeps_one_entry_per_user(session_factory):
+    scheduler = AnalyticsRefreshScheduler(session_factory=session_factory)
+
+    scheduler.track(USER_A)
+    scheduler.track(USER_A.upper())
+    scheduler.track(USER_B)
+
+    assert scheduler.stats()["tracked_users"] == 2
+
+
+def test_track_ignores_ids_that_are_not_uuids_and_evicts_the_least_recently_seen(session_factory):
+    scheduler = AnalyticsRefreshScheduler(session_factory=session_factory, max_users=2)
+
+    scheduler.track("../../etc")
+    scheduler.track(USER_A)
+    scheduler.track(USER_B)
+    scheduler.track(USER_A)
+    scheduler.track(USER_C)
+
+    assert list(scheduler._users) == [USER_A, USER_C]
+    assert scheduler.stats()["evicted_total"] == 1
+
+
+@pytest.mark.asyncio
+@patch("app.services.refresh_scheduler.AnalyticsService.get_summary", new_callable=AsyncMock)
+@patch("app.services.refresh_scheduler.cache.get_ttls", new_callable=AsyncMock)
+@patch("app.services.refresh_scheduler.cache.get_generations", new_callable=AsyncMock)
+async def test_run_once_refreshes_only_users_close_to_expiry(
+    mock_get_generations, mock_get_ttls, mock_summary, mock_session
+):
+    # Sessions come from read_session(user_id), which is awaited
+    factory = AsyncMock(return_value=mock_session)
+    scheduler = AnalyticsRefreshScheduler(session_factory=factory, margin=20)
+    scheduler.track(USER_A)
+    scheduler.track(USER_B)
+    # One summary key per user: the first user's entry is fresh, the second is about to expire
+    mock_get_ttls.return_value = [90, 5]
+    mock_get_generations.return_value = [0, 3]
+
+    await scheduler.run_once()
+
+    assert mock_get_ttls.await_args.args[0] == [f"analytics_summary:{USER_A}:g0", f"analytics_summary:{USER_B}:g3"]
+
+    mock_summary.assert_awaited_once()
+    assert mock_summary.await_args.args[1] == USER_B
+    assert mock_summary.await_args.kwargs == {"force_refresh": True}
+    factory.assert_awaited_once_with(USER_B)
+    assert scheduler.queue_depth == 0
+    assert scheduler.stats()["refreshed_total"] == 1
+
+
+@pytest.mark.asyncio
+async def test_run_once_expires_idle_users(mock_session):
+    scheduler = AnalyticsRefreshScheduler(session_factory=AsyncMock(return_value=mock_session), idle_timeout=0)
+    scheduler.track(USER_A)
+    scheduler._users[USER_A].last_seen -= 1
+
+    await scheduler.run_once()
+
+    assert scheduler.stats()["tracked_users"] == 0
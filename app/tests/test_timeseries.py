@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+from datetime import date
+from httpx import AsyncClient
+from unittest.mock import AsyncMock, patch
+from app.main import app
+from app.custom_exceptions.exceptions import InvalidAnalyticsRangeException
+from app.services.analytics_service import AnalyticsService
+from app.utils.timeseries import bucket_count, bucketize, daily_arrays, rolling_mean, rolling_std
+
+ROWS = [
+    (date(2024, 1, 1), 2, 10000, 0),  # Monday
+    (date(2024, 1, 3), 1, 0, 2500),
+    (date(2024, 1, 8), 1, 5000, 0),  # next Monday
+    (date(2024, 2, 2), 3, 0, 6000),
+]
+
+def test_bucketize_fills_gaps_and_aligns_weeks_and_months():
+    daily = daily_arrays(ROWS)
+
+    days = bucketize(daily, "day", end=date(2024, 1, 4))
+    assert np.datetime_as_string(days["period_start"]).tolist() == ["2024-01-01", "2024-01-02", "2024-01-03", "2024-01-04"]
+    assert days["credit"].tolist() == [10000, 0, 0, 0]
+    assert days["debit"].tolist() == [0, 0, 2500, 0]
+
+    weeks = bucketize(daily, "week", start=date(2024, 1, 3))
+    assert str(weeks["period_start"][0]) == "2024-01-01"
+    assert weeks["transaction_count"].tolist() == [1, 1, 0, 0, 3]
+
+    months = bucketize(daily, "month")
+    assert np.datetime_as_string(months["period_start"]).tolist() == ["2024-01-01", "2024-02-01"]
+    assert months["credit"].tolist() == [15000, 0]
+    assert months["transaction_count"].tolist() == [4, 3]
+
+def test_rolling_stats_match_per_window_computation():
+    values = np.array([4, -2, 7, 0, 3, 9], dtype=np.int64)
+
+    mean = rolling_mean(values, 3)
+    std = rolling_std(values, 3)
+
+    assert np.isnan(mean[:2]).all() and np.isnan(std[:2]).all()
+    for end in range(3, len(values) + 1):
+        window = values[end - 3:end]
+        assert mean[end - 1] == pytest.approx(window.mean())
+        assert std[end - 1] == pytest.approx(window.std(ddof=1))
+    assert np.isnan(rolling_mean(values[:2], 3)).all()
+
+def test_rolling_std_in_chunks_matches_one_pass():
+    values = np.random.default_rng(7).integers(-10**8, 10**8, size=500)
+    windows = np.lib.stride_tricks.sliding_window_view(values.astype(np.float64), 30)
+
+    with patch("app.utils.timeseries.STD_CHUNK_ELEMENTS", 100):
+        std = rolling_std(values, 30)
+
+    assert np.isnan(std[:29]).all()
+    assert std[29:] == pytest.approx(windows.std(axis=1, ddof=1))
+
+@pytest.mark.asyncio
+@patch("app.routers.analytics.AnalyticsService.get_time_series", new_callable=AsyncMock)
+async def test_time_series_rejects_backwards_and_oversized_ranges(mock_get_time_series):
+    assert bucket_count(date(1, 1, 1), date(9999, 12, 31), "day") == 3652059
+    assert bucket_count(date(2024, 1, 1), date(2024, 12, 31), "month") == 12
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        too_long = await client.get("/analytics/user1/time_series", params={"start_date": "0001-01-01", "end_date": "9999-12-31"})
+        backwards = await client.get("/analytics/user1/time_series", params={"start_date": "2024-02-01", "end_date": "2024-01-01"})
+
+    assert too_long.status_code == 400
+    assert too_long.json()["detail"] == "Date range spans more than 3660 day buckets"
+    assert backwards.status_code == 400
+    mock_get_time_series.assert_not_awaited()
+
+@pytest.mark.asyncio
+@patch("app.services.analytics_service.cache")
+@patch("app.services.analytics_service.get_daily_rollups", new_callable=AsyncMock)
+async def test_get_time_series_reads_rollups_once(mock_get_daily_rollups, mock_cache):
+    mock_cache.get_generation = AsyncMock(return_value=4)
+    async def get_or_set(key, loader, **kwargs):
+        return await loader()
+
+    mock_cache.get_or_set = AsyncMock(side_effect=get_or_set)
+    mock_get_daily_rollups.return_value = ROWS
+    db = AsyncMock()
+
+    series = await AnalyticsService.get_time_series(db, "user1", "week", 2)
+
+    mock_get_daily_rollups.assert_awaited_once_with(db, "user1", None, None)
+    assert mock_cache.get_or_set.await_args.args[0] == "time_series:user1:g4:week:2:None:None"
+    assert series.period_start[0] == date(2024, 1, 1)
+    assert series.net_total == [75.0, 50.0, 0.0, 0.0, -60.0]
+    assert series.rolling_average == [None, 62.5, 25.0, 0.0, -30.0]
+    assert series.rolling_volatility[1] == pytest.approx(17.68)
+
+@pytest.mark.asyncio
+@patch("app.services.analytics_service.settings.ANALYTICS_TIME_SERIES_MAX_BUCKETS", 4)
+@patch("app.services.analytics_service.cache")
+@patch("app.services.analytics_service.get_daily_rollups", new_callable=AsyncMock)
+async def test_get_time_series_checks_open_ranges_against_the_rollups(mock_get_daily_rollups, mock_cache):
+    mock_cache.get_generation = AsyncMock(return_value=0)
+    async def get_or_set(key, loader, **kwargs):
+        return await loader()
+
+    mock_cache.get_or_set = AsyncMock(side_effect=get_or_set)
+    mock_get_daily_rollups.return_value = ROWS
+
+    # Without an end date the range runs to the last rollup, five weeks after the start
+    with pytest.raises(InvalidAnalyticsRangeException):
+        await AnalyticsService.get_time_series(AsyncMock(), "user1", "week", 2, start_date=date(2024, 1, 1))
@@ -1,9 +1,14 @@
+import json
+import uuid
 import pytest
-from unittest.mock import AsyncMock, patch
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
 from fastapi.testclient import TestClient
 from app.main import app
-from app.schemas.transaction import TransactionCreate, TransactionResponse
+from app.schemas.transaction import TransactionCreate, TransactionUpdate, TransactionResponse, BulkTransactionResponse, BulkTransactionResult
 from app.routers.transactions import router
+from app.services.transaction_service import bulk_create_transactions, create_transaction, delete_transaction, list_transactions, record_committed_write, update_transaction
+from app.utils.pagination import decode_cursor, encode_cursor
 client = TestClient(app)
 
 # Sample transaction data for tests
@@ -63,6 +68,42 @@ async def test_get_transaction_route(mock_get_db, mock_get_transaction):
     assert response_data["id"] == transaction_id
     assert response_data["transaction_amount"] == valid_transaction_data["transaction_amount"]
 
+@patch("app.routers.transactions.get_transaction", new_callable=AsyncMock)
+@patch("app.routers.transactions.response_cache.get", new_callable=AsyncMock)
+@patch("app.routers.transactions.response_cache.get_etag", new_callable=AsyncMock)
+def test_get_transaction_route_serves_cached_bytes_and_304(mock_get_etag, mock_get, mock_get_transaction):
+    mock_get_etag.return_value = '"abc"'
+    mock_get.return_value = ('"abc"', b'{"id":"transaction123"}')
+
+    not_modified = client.get("/transactions/transaction123", headers={"If-None-Match": '"abc"'})
+    cached = client.get("/transactions/transaction123")
+
+    assert not_modified.status_code == 304
+    assert not_modified.headers["etag"] == '"abc"'
+    mock_get.assert_awaited_once()  # The 304 only read the tag
+    assert cached.status_code == 200
+    assert cached.content == b'{"id":"transaction123"}'
+    mock_get_transaction.assert_not_awaited()
+
+@patch("app.routers.transactions.get_transaction", new_callable=AsyncMock)
+@patch("app.routers.transactions.response_cache.set", new_callable=AsyncMock)
+@patch("app.routers.transactions.response_cache.get", new_callable=AsyncMock, return_value=None)
+def test_get_transaction_route_stores_response_with_etag(mock_get, mock_set, mock_get_transaction):
+    mock_get_transaction.return_value = TransactionResponse(
+        id="transaction123",
+        **valid_transaction_data,
+        created_at="2023-11-10T10:00:00Z",
+        updated_at="2023-11-10T10:00:00Z"
+    )
+
+    response = client.get("/transactions/transaction123")
+
+    assert response.status_code == 200
+    key, body, etag, expire = mock_set.await_args.args
+    assert key == "transaction:transaction123"
+    assert body == response.content
+    assert response.headers["etag"] == etag
+
 @pytest.mark.asyncio
 @patch("app.routers.transactions.update_transaction", new_callable=AsyncMock)
 @patch("app.routers.transactions.get_db", new_callable=AsyncMock)
@@ -100,3 +141,174 @@ async def test_delete_transaction_route(mock_get_db, mock_delete_transaction):
     # Assert the response
     assert response.status_code == 204
     assert response.content == b""
+
+@pytest.mark.asyncio
+@patch("app.routers.transactions.bulk_create_transactions", new_callable=AsyncMock)
+async def test_bulk_create_transactions_route_accepts_ndjson(mock_bulk_create_transactions):
+    mock_bulk_create_transactions.return_value = BulkTransactionResponse(
+        created=1,
+        failed=1,
+        results=[
+            BulkTransactionResult(index=0, status="created", id="transaction123"),
+            BulkTransactionResult(index=1, status="invalid", errors=[{"loc": [], "msg": "Invalid JSON"}]),
+        ]
+    )
+    body = json.dumps(valid_transaction_data) + "\n{not json\n"
+
+    response = client.post("/transactions/bulk", content=body, headers={"Content-Type": "application/x-ndjson"})
+
+    assert response.status_code == 200
+    assert response.json()["created"] == 1
+    rows = mock_bulk_create_transactions.await_args.args[1]
+    assert rows[0] == valid_transaction_data
+    assert isinstance(rows[1], Exception)
+
+@pytest.mark.asyncio
+async def test_bulk_create_transactions_validates_rows_and_records_one_event_per_user():
+    db_session = AsyncMock()
+    db_session.begin_nested = MagicMock(return_value=AsyncMock())
+    rows = [valid_transaction_data, {**valid_transaction_data, "transaction_amount": -5}, valid_transaction_data]
+
+    with patch("app.services.transaction_service.invalidate_analytics_cache", new_callable=AsyncMock) as mock_invalidate, \
+            patch("app.services.transaction_service.record_events", new_callable=AsyncMock) as mock_record_events:
+        response = await bulk_create_transactions(db_session, rows)
+
+    assert [result.status for result in response.results] == ["created", "invalid", "created"]
+    assert response.created == 2 and response.failed == 1
+    # Derived data is left to the outbox worker
+    mock_invalidate.assert_not_awaited()
+    events = mock_record_events.await_args.args[1]
+    assert [(event["event_type"], event["user_id"]) for event in events] == [("transaction_created", "user123")]
+    assert events[0]["payload"]["added_amounts"] == [5000, 5000]
+    assert [delta["transaction_count"] for delta in events[0]["payload"]["deltas"]] == [1, 1]
+    db_session.commit.assert_awaited_once()
+
+@pytest.mark.asyncio
+@patch("app.services.transaction_service.cache")
+async def test_create_transaction_records_outbox_event_and_skips_redis(mock_cache):
+    db_session = MagicMock()
+    db_session.execute = AsyncMock()
+    db_session.commit = AsyncMock()
+
+    async def refresh(transaction):
+        transaction.id = uuid.uuid4()
+        transaction.created_at = transaction.updated_at = datetime(2023, 11, 10, 10, 0)
+
+    db_session.refresh = AsyncMock(side_effect=refresh)
+
+    response = await create_transaction(db_session, TransactionCreate(**valid_transaction_data))
+
+    assert response.transaction_amount == 5000
+    (statement, events), _ = db_session.execute.await_args
+    assert statement.table.name == "outbox_events"
+    assert events[0]["payload"]["deltas"][0]["day"] == "2023-11-10"
+    assert events[0]["payload"]["added_amounts"] == [5000]
+    db_session.commit.assert_awaited_once()
+    assert not mock_cache.mock_calls
+
+@pytest.mark.asyncio
+@patch("app.services.transaction_service.invalidate_transaction_cache", new_callable=AsyncMock)
+@patch("app.services.transaction_service.replica_router")
+async def test_update_transaction_pins_writer_and_invalidates_right_after_commit(mock_replica_router, mock_invalidate_transaction_cache):
+    transaction = MagicMock(
+        id=uuid.uuid4(), user_id="user123", transaction_amount=5000, transaction_type="DEBIT",
+        transaction_date=datetime(2023, 11, 10, 10, 0), created_at=datetime(2023, 11, 10, 10, 0), updated_at=datetime(2023, 11, 10, 10, 0),
+    )
+    db_session = AsyncMock()
+    db_session.execute.return_value = MagicMock(**{"scalars.return_value.first.return_value": transaction})
+    calls = []
+    db_session.commit.side_effect = lambda: calls.append("commit")
+    mock_replica_router.pin = AsyncMock(side_effect=lambda user_id: calls.append(("pin", user_id)))
+    mock_invalidate_transaction_cache.side_effect = lambda transaction_id: calls.append(("invalidate", transaction_id))
+
+    with patch("app.services.transaction_service.TransactionResponse.from_orm"):
+        await update_transaction(db_session, transaction.id, TransactionUpdate(transaction_amount=6000))
+
+    # Not left to the outbox worker, so the next read already goes to the primary and misses the cache
+    assert calls == ["commit", ("pin", "user123"), ("invalidate", transaction.id)]
+
+@pytest.mark.asyncio
+@patch("app.services.transaction_service.record_committed_write", new_callable=AsyncMock)
+@patch("app.services.transaction_service.record_events", new_callable=AsyncMock)
+async def test_delete_transaction_locks_the_row_before_computing_its_delta(mock_record_events, mock_record_committed_write):
+    transaction = MagicMock(id="t1", user_id="user123", transaction_amount=5000, transaction_type="DEBIT", transaction_date=datetime(2023, 11, 10, 10, 0))
+    db_session = AsyncMock()
+    db_session.execute.return_value = MagicMock(**{"scalars.return_value.first.return_value": transaction})
+
+    await delete_transaction(db_session, "t1")
+
+    # Without the lock two concurrent writes would both subtract the same old amount
+    assert str(db_session.execute.await_args.args[0]).endswith("FOR UPDATE")
+    events = mock_record_events.await_args.args[1]
+    assert events[0]["payload"]["deltas"][0]["total_amount"] == -5000
+
+@pytest.mark.asyncio
+@patch("app.services.transaction_service.invalidate_transaction_cache", new_callable=AsyncMock, side_effect=ConnectionError("redis down"))
+@patch("app.services.transaction_service.replica_router")
+async def test_record_committed_write_leaves_redis_failures_to_the_outbox_worker(mock_replica_router, mock_invalidate_transaction_cache):
+    mock_replica_router.pin = AsyncMock()
+
+    await record_committed_write(["user123"], ["t1"])
+
+    mock_replica_router.pin.assert_awaited_once_with("user123")
+
+def test_bulk_create_transactions_route_rejects_malformed_array():
+    response = client.post("/transactions/bulk", content="[{", headers={"Content-Type": "application/json"})
+
+    assert response.status_code == 400
+
+@patch("app.routers.transactions.export_transactions")
+def test_export_transactions_route_streams_ndjson(mock_export_transactions):
+    async def chunks():
+        yield b'{"id": "transaction123"}\n'
+        yield b'{"id": "transaction456"}\n'
+    mock_export_transactions.return_value = chunks()
+
+    response = client.get("/transactions/export", params={"user_id": "user123"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == ["transaction123", "transaction456"]
+    mock_export_transactions.assert_called_once_with("user123", "ndjson", None)
+
+def test_export_transactions_route_rejects_invalid_cursor():
+    response = client.get("/transactions/export", params={"user_id": "user123", "after": "not-a-cursor"})
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid pagination cursor"}
+
+def test_cursor_round_trip():
+    transaction_date = datetime(2023, 11, 10, 10, 0)
+    transaction_id = uuid.uuid4()
+
+    assert decode_cursor(encode_cursor(transaction_date, transaction_id)) == (transaction_date, transaction_id)
+
+@pytest.mark.asyncio
+async def test_list_transactions_returns_next_cursor_from_last_row():
+    rows = [
+        MagicMock(
+            id=uuid.uuid4(),
+            user_id="user123",
+            transaction_amount=5000,
+            transaction_type="DEBIT",
+            transaction_date=datetime(2023, 11, 10 - day),
+            created_at=datetime(2023, 11, 10),
+            updated_at=datetime(2023, 11, 10),
+        )
+        for day in range(3)
+    ]
+    db_session = AsyncMock()
+    db_session.execute.return_value = MagicMock()
+    db_session.execute.return_value.scalars.return_value.all.return_value = rows
+
+    page = await list_transactions(db_session, "user123", limit=2)
+
+    assert [item.id for item in page.items] == [str(rows[0].id), str(rows[1].id)]
+    assert decode_cursor(page.next_cursor) == (rows[1].transaction_date, rows[1].id)
+
+@patch("app.routers.transactions.list_transactions", new_callable=AsyncMock)
+def test_list_transactions_route_rejects_oversized_limit(mock_list_transactions):
+    response = client.get("/transactions/", params={"user_id": "user123", "limit": 100000})
+
+    assert response.status_code == 422
+    mock_list_transactions.assert_not_called()
@@ -4,6 +4,7 @@ import pytest
 from fastapi import HTTPException, status
 from unittest.mock import AsyncMock, MagicMock
 from app.services.auth_service import AuthService
+from app.services.otp_store import VERIFY_OTP_SCRIPT, OtpStore
 from app.db.models import User
 from app.core.security import security
 
@@ -17,12 +18,14 @@ class OTPData:
     email = "test@example.com"
     otp = "123456"
 
+USER_ID = "4f1c2a8e-7d3b-4a51-9a55-0c1e3f6b2d10"
+
+
 @pytest.mark.asyncio
-async def test_register_user_existing_email(mocker):
+async def test_register_user_existing_email(mocker, returning):
     # Arrange
-    db_session = AsyncMock()
     mock_user = User(email=UserData.email, full_name="Existing User", password="hashedpassword")
-    db_session.execute.return_value.scalars.return_value.first.return_value = mock_user
+    db_session = returning(mock_user)
 
     # Act and Assert
     with pytest.raises(HTTPException) as excinfo:
@@ -32,10 +35,9 @@ async def test_register_user_existing_email(mocker):
 
 
 @pytest.mark.asyncio
-async def test_register_user_success(mocker):
+async def test_register_user_success(mocker, returning):
     # Arrange
-    db_session = AsyncMock()
-    db_session.execute.return_value.scalars.return_value.first.return_value = None
+    db_session = returning(None)
     mocker.patch("app.core.security.security.hash_password", return_value="hashedpassword")
     mocker.patch("app.core.security.security.encrypt", return_value="encryptedfullname")
 
@@ -51,10 +53,9 @@ async def test_register_user_success(mocker):
 
 
 @pytest.mark.asyncio
-async def test_login_user_invalid_credentials(mocker):
+async def test_login_user_invalid_credentials(mocker, returning):
     # Arrange
-    db_session = AsyncMock()
-    db_session.execute.return_value.scalars.return_value.first.return_value = None
+    db_session = returning(None)
 
     # Act and Assert
     with pytest.raises(HTTPException) as excinfo:
@@ -64,34 +65,31 @@ async def test_login_user_invalid_credentials(mocker):
 
 
 @pytest.mark.asyncio
-async def test_login_user_success(mocker):
+async def test_login_user_success(mocker, returning):
     # Arrange
-    db_session = AsyncMock()
-    mock_user = User(email=UserData.email, password="hashedpassword", otp_code=None)
-    db_session.execute.return_value.scalars.return_value.first.return_value = mock_user
+    mock_user = User(id=USER_ID, email=UserData.email, password="hashedpassword")
+    db_session = returning(mock_user)
     mocker.patch("app.core.security.security.verify_password", return_value=True)
     mocker.patch("app.core.security.security.generate_otp", return_value="123456")
+    issue = mocker.patch("app.services.auth_service.otp_store.issue", new_callable=AsyncMock)
 
     # Act
     otp_code = await AuthService.login_user(db_session, UserData.email, UserData.password)
 
     # Assert
     assert otp_code == "123456"
-    assert mock_user.otp_code == "123456"
-    db_session.commit.assert_called_once()
-    db_session.refresh.assert_called_once_with(mock_user)
+    issue.assert_awaited_once_with(UserData.email, USER_ID, "123456")
+    db_session.commit.assert_not_called()  # The OTP lives in Redis, login writes nothing to Postgres
 
 
 @pytest.mark.asyncio
 async def test_verify_otp_invalid_otp(mocker):
     # Arrange
-    db_session = AsyncMock()
-    mock_user = User(email=UserData.email, otp_code="654321")
-    db_session.execute.return_value.scalars.return_value.first.return_value = mock_user
+    mocker.patch("app.services.auth_service.otp_store.verify", new_callable=AsyncMock, return_value=None)
 
     # Act and Assert
     with pytest.raises(HTTPException) as excinfo:
-        await AuthService.verify_otp(db_session, OTPData)
+        await AuthService.verify_otp(OTPData)
     assert excinfo.value.status_code == status.HTTP_401_UNAUTHORIZED
     assert excinfo.value.detail == "Invalid OTP."
 
@@ -99,15 +97,29 @@ async def test_verify_otp_invalid_otp(mocker):
 @pytest.mark.asyncio
 async def test_verify_otp_success(mocker):
     # Arrange
-    db_session = AsyncMock()
-    mock_user = User(email=UserData.email, otp_code=OTPData.otp)
-    db_session.execute.return_value.scalars.return_value.first.return_value = mock_user
-    mocker.patch("app.core.security.security.create_access_token", return_value="access_token")
+    verify = mocker.patch("app.services.auth_service.otp_store.verify", new_callable=AsyncMock, return_value=USER_ID)
+    mocker.patch("app.services.auth_service.principal_cache.invalidate", new_callable=AsyncMock)
+    create_token = mocker.patch("app.core.security.security.create_access_token", return_value="access_token")
 
     # Act
-    token = await AuthService.verify_otp(db_session, OTPData)
+    token = await AuthService.verify_otp(OTPData)
 
     # Assert
     assert token == "access_token"
-    assert mock_user.otp_code is None  # OTP should be cleared after verification
-    db_session.commit.assert_called_once()
+    verify.assert_awaited_once_with(OTPData.email, OTPData.otp)
+    create_token.assert_called_once_with(data={"sub": OTPData.email, "user_id": USER_ID})
+
+
+@pytest.mark.asyncio
+async def test_otp_store_verify_maps_script_results():
+    redis = MagicMock()
+    store = OtpStore(MagicMock(redis=redis), ttl=300, max_attempts=3)
+
+    redis.eval = AsyncMock(return_value=[1, USER_ID.encode()])
+    assert await store.verify(OTPData.email, OTPData.otp) == USER_ID
+    redis.eval.assert_awaited_once_with(VERIFY_OTP_SCRIPT, 1, "otp:test@example.com", OTPData.otp, 3)
+
+    # Wrong code, last allowed attempt, and no code at all
+    for result in ([0, 1], [0, 3], [-1]):
+        redis.eval = AsyncMock(return_value=result)
+        assert await store.verify(OTPData.email, "000000") is None
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, TypeVar
+from app.custom_exceptions.exceptions import ExecutorSaturatedException
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ExecutorStats:
+    """Counters for calls run on one executor."""
+
+    def __init__(self):
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.queue_wait_seconds_total = 0.0
+        self.queue_wait_seconds_max = 0.0
+        self.run_seconds_total = 0.0
+        self.run_seconds_max = 0.0
+
+    def record(self, waited: float, ran: float, failed: bool = False) -> None:
+        if failed:
+            self.failed += 1
+        else:
+            self.completed += 1
+        self.queue_wait_seconds_total += waited
+        self.queue_wait_seconds_max = max(self.queue_wait_seconds_max, waited)
+        self.run_seconds_total += ran
+        self.run_seconds_max = max(self.run_seconds_max, ran)
+
+
+class BoundedExecutor:
+    """
+    Runs blocking, CPU-heavy calls on a dedicated thread pool so they do not stall the event loop.
+    At most `size` calls run at once and at most `max_queue` more wait for a thread; further calls are
+    rejected with ExecutorSaturatedException instead of piling up behind a burst.
+    bcrypt and the OpenSSL-backed Fernet primitives release the GIL, so the threads run in parallel.
+    The counters are updated from the pool threads and read on the event loop, so they are guarded by a lock.
+    """
+
+    def __init__(self, name: str, size: int, max_queue: int):
+        self.name = name
+        self.size = int(size)
+        self.max_queue = int(max_queue)
+        self.stats = ExecutorStats()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._running = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix=name)
+
+    def _timed(self, submitted: float, func: Callable[..., T], args) -> T:
+        started = time.perf_counter()
+        with self._lock:
+            self._running += 1
+        failed = False
+        try:
+            return func(*args)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            ran = time.perf_counter() - started
+            with self._lock:
+                self._running -= 1
+                self.stats.record(started - submitted, ran, failed)
+
+    def _release(self, future: Future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        """
+        Runs func(*args) on the pool and returns its result.
+        The slot is released when the call itself finishes, not when the caller stops waiting: a cancelled
+        caller cannot free room for more calls while its thread is still busy.
+        :raises ExecutorSaturatedException: When `size + max_queue` calls are already in flight.
+        """
+        with self._lock:
+            saturated = self._in_flight >= self.size + self.max_queue
+            if saturated:
+                self.stats.rejected += 1
+            else:
+                self._in_flight += 1
+        if saturated:
+            logger.warning("%s executor saturated, rejecting call to %s", self.name, getattr(func, "__name__", func))
+            raise ExecutorSaturatedException()
+
+        try:
+            future = self._executor.submit(self._timed, time.perf_counter(), func, args)
+        except Exception:
+            self._release(None)
+            raise
+        # A call cancelled before it started is released here too, since cancelling the future completes it
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def report(self) -> Dict:
+        with self._lock:
+            stats = self.stats
+            finished = stats.completed + stats.failed
+            return {
+                "size": self.size,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": max(self._in_flight - self._running, 0),
+                "completed": stats.completed,
+                "failed": stats.failed,
+                "rejected": stats.rejected,
+                "queue_wait_ms_mean": round(stats.queue_wait_seconds_total / finished * 1000, 3) if finished else 0.0,
+                "queue_wait_ms_max": round(stats.queue_wait_seconds_max * 1000, 3),
+                "run_ms_mean": round(stats.run_seconds_total / finished * 1000, 3) if finished else 0.0,
+                "run_ms_max": round(stats.run_seconds_max * 1000, 3),
+            }
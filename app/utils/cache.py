@@ -1,43 +1,563 @@
 import aioredis
+import asyncio
 import json
-from datetime import datetime
+import logging
+import orjson
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type, TypeVar
+from uuid import UUID
+from pydantic import BaseModel
 from app.core.config import settings
+from app.utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+# Deletes the lock only if it still holds our token, so an expired lock taken over by another worker is left alone
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+CACHE_LOOKUPS = registry.counter("cache_lookups_total", "Cache lookups by tier (l1 in process, l2 Redis) and result", ("tier", "result"))
+L1_HIT, L1_MISS, L2_HIT, L2_MISS = ("l1", "hit"), ("l1", "miss"), ("l2", "hit"), ("l2", "miss")
+
+# Set on the frame header when the payload is zlib-compressed; the low bits hold the codec id
+COMPRESSED_FLAG = 0x80
+COMPRESSION_LEVEL = 1
+
+
+def _encode_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    raise TypeError(f"Cannot encode {type(value).__name__} for the cache")
+
+
+class CacheCodec:
+    """Turns cache values into bytes and back. Every stored frame records the codec `id`, so any worker can read it."""
+    id = 0
+    name = ""
+
+    def encode(self, value: Any) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, data: bytes) -> Any:
+        raise NotImplementedError
+
+    def decode_model(self, data: bytes, model: Type[ModelT]) -> ModelT:
+        return model.model_validate(self.decode(data))
+
+
+class JsonCodec(CacheCodec):
+    id = 1
+    name = "json"
+
+    def encode(self, value: Any) -> bytes:
+        if isinstance(value, BaseModel):
+            return value.model_dump_json().encode()
+        return json.dumps(value, default=_encode_default).encode()
+
+    def decode(self, data: bytes) -> Any:
+        return json.loads(data)
+
+    def decode_model(self, data: bytes, model: Type[ModelT]) -> ModelT:
+        # One pass from bytes to the model, without building an intermediate dict
+        return model.model_validate_json(data)
+
+
+class OrjsonCodec(JsonCodec):
+    id = 2
+    name = "orjson"
+
+    def encode(self, value: Any) -> bytes:
+        if isinstance(value, BaseModel):
+            return value.model_dump_json().encode()
+        return orjson.dumps(value, default=_encode_default)
+
+    def decode(self, data: bytes) -> Any:
+        return orjson.loads(data)
+
+
+class MsgpackCodec(CacheCodec):
+    id = 3
+    name = "msgpack"
+
+    def __init__(self):
+        import msgpack  # Only needed by deployments that select this codec
+        self._msgpack = msgpack
+
+    def encode(self, value: Any) -> bytes:
+        if isinstance(value, BaseModel):
+            value = value.model_dump(mode="json")
+        return self._msgpack.packb(value, default=_encode_default, use_bin_type=True)
+
+    def decode(self, data: bytes) -> Any:
+        return self._msgpack.unpackb(data, raw=False)
+
+
+CODECS: Dict[str, Type[CacheCodec]] = {codec.name: codec for codec in (JsonCodec, OrjsonCodec, MsgpackCodec)}
+_codec_instances: Dict[int, CacheCodec] = {}
+
+
+def get_codec(name_or_id) -> CacheCodec:
+    """Returns the shared codec instance for a codec name or frame id."""
+    codec_class = CODECS.get(name_or_id) if isinstance(name_or_id, str) else next(
+        (codec for codec in CODECS.values() if codec.id == name_or_id), None
+    )
+    if codec_class is None:
+        raise ValueError(f"Unknown cache codec: {name_or_id}")
+    if codec_class.id not in _codec_instances:
+        _codec_instances[codec_class.id] = codec_class()
+    return _codec_instances[codec_class.id]
+
+
+class LocalCache:
+    """
+    Bounded in-process cache with per-entry TTL and LRU eviction.
+    Values are shared, not copied, so callers must treat what they get back as read-only.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Any:
+        """
+        Gets an entry and marks it as most recently used.
+        :return: The value, or MISSING when the key is absent or expired.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if self.max_entries <= 0 or ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
 
 class Cache:
+    """
+    Two-tier cache: a small in-process LocalCache (L1) in front of Redis (L2).
+    Every write or delete is broadcast on a Redis pub/sub channel so the other workers drop their L1 copy.
+    """
+
     def __init__(self):
         # Initialize the Redis connection with password
         self.REDIS_URL = settings.REDIS_URL
-        
+
         redis_password = settings.REDIS_PASSWORD
-        self.redis = aioredis.from_url(self.REDIS_URL, password=redis_password, decode_responses=True)
+        # Values are stored as codec frames, so responses stay as bytes
+        self.redis = aioredis.from_url(self.REDIS_URL, password=redis_password, decode_responses=False)
+        self.codec = get_codec(settings.CACHE_CODEC)
+        self.compression_threshold = int(settings.CACHE_COMPRESSION_THRESHOLD)
 
-    async def set_cache(self, key, value, expire=None):
-        # Convert datetime fields to ISO format strings before JSON encoding
-        value = {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in value.items()}
-        await self.redis.set(key, json.dumps(value), ex=expire)
+        self.local = LocalCache(settings.CACHE_L1_MAX_ENTRIES, settings.CACHE_L1_TTL_SECONDS)
+        self.invalidation_channel = settings.CACHE_INVALIDATION_CHANNEL
+        self.instance_id = uuid.uuid4().hex
+        self.redis_hits = 0
+        self.redis_misses = 0
+        self._listener_task: Optional[asyncio.Task] = None
+        self._invalidation_listeners: List[Callable[[str], None]] = []
 
-    async def get_cache(self, key: str) -> dict:
+        self.lock_timeout_ms = settings.CACHE_LOCK_TIMEOUT_MS
+        self.lock_wait_ms = settings.CACHE_LOCK_WAIT_MS
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._background_refreshes = set()
+        self.loads = 0
+        self.coalesced = 0
+        self.stale_served = 0
+        self.lock_waits = 0
+
+    def encode(self, value: Any) -> bytes:
+        """
+        Encodes a value into a frame: one header byte (codec id and compression flag) and the payload.
+        Payloads of at least `compression_threshold` bytes are zlib-compressed.
         """
-        Gets a cache entry.
+        payload = self.codec.encode(value)
+        flags = self.codec.id
+        if self.compression_threshold > 0 and len(payload) >= self.compression_threshold:
+            payload = zlib.compress(payload, COMPRESSION_LEVEL)
+            flags |= COMPRESSED_FLAG
+        return bytes([flags]) + payload
+
+    def _unframe(self, data: bytes) -> Tuple[CacheCodec, bytes]:
+        flags = data[0]
+        codec = get_codec(flags & ~COMPRESSED_FLAG)
+        payload = data[1:]
+        if flags & COMPRESSED_FLAG:
+            payload = zlib.decompress(payload)
+        return codec, payload
+
+    def decode(self, data: bytes, model: Optional[Type[ModelT]] = None) -> Any:
+        """
+        Decodes a frame written by `encode`, with whichever codec wrote it.
+        :param model: When given, the payload is decoded straight into this model.
+        """
+        codec, payload = self._unframe(data)
+        return codec.decode_model(payload, model) if model is not None else codec.decode(payload)
+
+    async def set_cache(self, key: str, value: Any, expire: Optional[int] = None) -> None:
+        """
+        Sets a cache entry in both tiers.
+        :param value: A JSON-compatible value or a Pydantic model. The local tier keeps the object itself.
+        :param expire: Time to live in seconds.
+        """
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.set(key, self.encode(value), ex=expire)
+            pipe.publish(self.invalidation_channel, self.invalidation_message(key))
+            await pipe.execute()
+        self.local.set(key, value, ttl=expire)
+
+    async def get_cache(self, key: str, model: Optional[Type[ModelT]] = None) -> Any:
+        """
+        Gets a cache entry, from the local tier when possible.
         :param key: The key of the cache entry.
-        :return: The cached value as a dictionary, or None if not found.
+        :param model: Decode into this Pydantic model. Local hits return the stored instance as is.
+        :return: The cached value, or None if not found. The value must not be mutated.
+        """
+        value = self.local.get(key)
+        if value is not MISSING:
+            CACHE_LOOKUPS.inc(L1_HIT)
+            if model is not None and not isinstance(value, model):
+                value = model.model_validate(value)
+            return value
+        CACHE_LOOKUPS.inc(L1_MISS)
+
+        raw = await self.redis.get(key)
+        if not raw:
+            self.redis_misses += 1
+            CACHE_LOOKUPS.inc(L2_MISS)
+            return None
+        try:
+            value = self.decode(raw, model)
+        except Exception as e:
+            # Entries written in an older format are treated as missing and get recomputed
+            logger.warning("Could not decode cache entry %s, error: %s", key, str(e))
+            self.redis_misses += 1
+            CACHE_LOOKUPS.inc(L2_MISS)
+            return None
+        self.redis_hits += 1
+        CACHE_LOOKUPS.inc(L2_HIT)
+        self.local.set(key, value)
+        return value
+
+    async def get_or_set(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        expire: int,
+        stale_ttl: int = 0,
+        refresh_loader: Optional[Callable[[], Awaitable[Any]]] = None,
+        force: bool = False,
+    ) -> Any:
+        """
+        Gets a computed entry, running `loader` at most once per key at a time.
+        Concurrent callers in this worker share one in-flight load, and a Redis lock lets only one worker
+        compute while the others wait for it to fill the key.
+        :param expire: Seconds the computed value stays fresh.
+        :param stale_ttl: When set, an expired value is kept this much longer and served while a single
+                          background refresh (using `refresh_loader`) replaces it.
+        :param refresh_loader: Loader for background refreshes, which outlive the caller's request.
+        :param force: Skip the cached value and recompute.
+        """
+        if not force:
+            entry = await self.get_cache(key)
+            if entry is not None:
+                if time.time() < entry["fresh_until"]:
+                    return entry["value"]
+                if stale_ttl:
+                    self.stale_served += 1
+                    self._refresh_in_background(key, refresh_loader or loader, expire, stale_ttl)
+                    return entry["value"]
+
+        return await self._single_flight(key, lambda: self._load(key, loader, expire, stale_ttl))
+
+    async def _single_flight(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shielded so that one cancelled caller does not cancel the load the others are waiting on
+        return await asyncio.shield(task)
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]], expire: int, stale_ttl: int) -> Any:
+        lock_key = f"lock:{key}"
+        token = uuid.uuid4().hex
+        acquired = await self.redis.set(lock_key, token, nx=True, px=self.lock_timeout_ms)
+        if not acquired:
+            self.lock_waits += 1
+            entry = await self._wait_for_fill(key)
+            if entry is not None:
+                return entry["value"]
+            logger.warning("Timed out waiting for another worker to compute %s, computing it here", key)
+
+        try:
+            self.loads += 1
+            value = await loader()
+            await self.set_cache(key, {"value": value, "fresh_until": time.time() + expire}, expire=expire + stale_ttl)
+            return value
+        finally:
+            if acquired:
+                await self.redis.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+
+    async def _wait_for_fill(self, key: str) -> Optional[dict]:
+        deadline = time.monotonic() + self.lock_wait_ms / 1000
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            raw = await self.redis.get(key)
+            if raw:
+                entry = self.decode(raw)
+                if time.time() < entry["fresh_until"]:
+                    self.local.set(key, entry)
+                    return entry
+        return None
+
+    def _refresh_in_background(self, key: str, loader: Callable[[], Awaitable[Any]], expire: int, stale_ttl: int) -> None:
+        if key in self._inflight:
+            return
+        task = asyncio.ensure_future(self._single_flight(key, lambda: self._load(key, loader, expire, stale_ttl)))
+        self._background_refreshes.add(task)
+        task.add_done_callback(self._background_refresh_done)
+
+    def _background_refresh_done(self, task: asyncio.Task) -> None:
+        self._background_refreshes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Background cache refresh failed, error: %s", str(task.exception()))
+
+    async def get_many(self, keys: List[str]) -> List[Any]:
+        """
+        Gets several entries written by get_or_set or set_many, reading the ones missing from the local
+        tier in one MGET.
+        :return: The value per key, or MISSING when the entry is absent, undecodable or no longer fresh.
+        """
+        entries = [self.local.get(key) for key in keys]
+        missing = [index for index, entry in enumerate(entries) if entry is MISSING]
+        CACHE_LOOKUPS.inc(L1_HIT, len(keys) - len(missing))
+        CACHE_LOOKUPS.inc(L1_MISS, len(missing))
+        if missing:
+            raw_entries = await self.redis.mget([keys[index] for index in missing])
+            for index, raw in zip(missing, raw_entries):
+                if not raw:
+                    self.redis_misses += 1
+                    CACHE_LOOKUPS.inc(L2_MISS)
+                    continue
+                try:
+                    entries[index] = self.decode(raw)
+                except Exception as e:
+                    logger.warning("Could not decode cache entry %s, error: %s", keys[index], str(e))
+                    self.redis_misses += 1
+                    CACHE_LOOKUPS.inc(L2_MISS)
+                    continue
+                self.redis_hits += 1
+                CACHE_LOOKUPS.inc(L2_HIT)
+                self.local.set(keys[index], entries[index])
+
+        now = time.time()
+        return [
+            entry["value"] if entry is not MISSING and now < entry["fresh_until"] else MISSING
+            for entry in entries
+        ]
+
+    async def set_many(self, values: Dict[str, Any], expire: int, stale_ttl: int = 0) -> None:
+        """
+        Stores several computed values in the get_or_set entry format with one pipelined round trip.
+        :param values: The value per key.
+        :param expire: Seconds the values stay fresh.
+        :param stale_ttl: Extra seconds the entries are kept for stale-while-revalidate.
+        """
+        if not values:
+            return
+        fresh_until = time.time() + expire
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key, value in values.items():
+                entry = {"value": value, "fresh_until": fresh_until}
+                pipe.set(key, self.encode(entry), ex=expire + stale_ttl)
+                pipe.publish(self.invalidation_channel, self.invalidation_message(key))
+                self.local.set(key, entry, ttl=expire)
+            await pipe.execute()
+
+    async def get_generation(self, key: str) -> int:
+        """
+        Gets the current value of a generation counter, 0 when it was never bumped.
+        :param key: The key of the counter.
+        """
+        return (await self.get_generations([key]))[0]
+
+    async def get_generations(self, keys: List[str]) -> List[int]:
+        """
+        Gets several generation counters, reading the ones missing from the local tier in one MGET.
+        :param keys: The keys of the counters.
+        :return: The generation per key, 0 for counters that were never bumped.
+        """
+        generations = [self.local.get(key) for key in keys]
+        missing = [index for index, generation in enumerate(generations) if generation is MISSING]
+        if missing:
+            raw = await self.redis.mget([keys[index] for index in missing])
+            for index, value in zip(missing, raw):
+                generations[index] = int(value or 0)
+                self.local.set(keys[index], generations[index])
+        return generations
+
+    async def bump_generation(self, key: str) -> int:
+        """
+        Increments a generation counter in one round trip, which retires every key built from the old value.
+        Other workers are told to drop their local copy of the counter.
+        :param key: The key of the counter.
+        :return: The new generation.
+        """
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.incr(key)
+            pipe.publish(self.invalidation_channel, self.invalidation_message(key))
+            generation, _ = await pipe.execute()
+        self.local.set(key, generation)
+        return generation
+
+    async def get_ttls(self, keys: List[str]) -> List[int]:
+        """
+        Gets the remaining time to live of several keys in one round trip.
+        :param keys: The keys to inspect.
+        :return: The TTL in seconds per key, -2 when the key does not exist and -1 when it never expires.
         """
-        value = await self.redis.get(key)
-        return json.loads(value) if value else None
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.ttl(key)
+            return await pipe.execute()
 
     async def clear_cache(self, key: str) -> None:
         """
-        Clears a specific cache entry.
+        Clears a specific cache entry in both tiers and tells the other workers to drop it.
         :param key: The key of the cache entry to clear.
         """
-        await self.redis.delete(key)
+        self.local.delete(key)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.delete(key)
+            pipe.publish(self.invalidation_channel, self.invalidation_message(key))
+            await pipe.execute()
 
     async def clear_all_cache(self) -> None:
         """
         Clears all cache entries.
         Use this carefully as it will flush the entire Redis database.
         """
+        self.local.clear()
         await self.redis.flushdb()
+        await self.redis.publish(self.invalidation_channel, self.invalidation_message("*"))
+
+    def invalidation_message(self, key: str) -> str:
+        return f"{self.instance_id} {key}"
+
+    def add_invalidation_listener(self, listener: Callable[[str], None]) -> None:
+        """
+        Registers another in-process cache to be told about invalidated keys ("*" for everything).
+        Listeners see keys broadcast by other workers, including keys they published through this channel.
+        """
+        self._invalidation_listeners.append(listener)
+
+    def _drop_local(self, key: str) -> None:
+        if key == "*":
+            self.local.clear()
+        else:
+            self.local.delete(key)
+        for listener in self._invalidation_listeners:
+            listener(key)
+
+    def handle_invalidation(self, message: str) -> None:
+        """Applies an invalidation broadcast by another worker to the local tier."""
+        sender, _, key = message.partition(" ")
+        if sender == self.instance_id:
+            return
+        self._drop_local(key)
+
+    async def _listen_for_invalidations(self) -> None:
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.invalidation_channel)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.handle_invalidation(message["data"].decode())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Entries published while disconnected may be missed, drop everything to stay safe
+                logger.error("Cache invalidation listener failed, error: %s", str(e))
+                self._drop_local("*")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
+
+    async def start_invalidation_listener(self) -> None:
+        if self._listener_task is None or self._listener_task.done():
+            self._listener_task = asyncio.create_task(self._listen_for_invalidations())
+
+    async def stop_invalidation_listener(self) -> None:
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            "l1": self.local.stats(),
+            "l2": {"hits": self.redis_hits, "misses": self.redis_misses},
+            "loads": {
+                "computed": self.loads,
+                "coalesced": self.coalesced,
+                "stale_served": self.stale_served,
+                "lock_waits": self.lock_waits,
+            },
+        }
 
 # Singleton instance of Cache for usage across the application
 cache = Cache()
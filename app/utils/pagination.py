@@ -0,0 +1,27 @@
+import base64
+import uuid
+from datetime import datetime
+from typing import Tuple
+from app.custom_exceptions.exceptions import InvalidCursorException
+
+
+def encode_cursor(transaction_date: datetime, transaction_id) -> str:
+    """
+    Encodes a keyset position on (transaction_date, id) as an opaque URL-safe token.
+    :param transaction_date: The transaction_date of the last row the client has seen.
+    :param transaction_id: The id of that row, used as the tie-breaker.
+    """
+    raw = f"{transaction_date.isoformat()}|{transaction_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """
+    Decodes a token produced by encode_cursor.
+    :raises InvalidCursorException: If the token is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        transaction_date, transaction_id = raw.split("|", 1)
+        return datetime.fromisoformat(transaction_date), uuid.UUID(transaction_id)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursorException()
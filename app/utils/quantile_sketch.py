@@ -0,0 +1,140 @@
+import math
+import random
+import struct
+from array import array
+from typing import Iterable, List, Optional, Sequence
+
+# version, k, n, min, max, number of levels
+HEADER = struct.Struct("<BHQqqB")
+FORMAT_VERSION = 1
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch over integer values (amounts in pesewas).
+    Level h holds items that each stand for 2**h inserted values. When the sketch outgrows its capacity, the
+    lowest full level is sorted and every other item (odd or even, at random) is promoted to the next level,
+    so memory stays O(k log(n / k)) while the rank error stays around 1.7 / k with high probability.
+    Sketches built on different data merge into one that answers for the union.
+    """
+    C = 2 / 3  # Capacity ratio between a level and the level above it
+
+    def __init__(self, k: int = 200):
+        self.k = k
+        self.n = 0
+        self.min: Optional[int] = None
+        self.max: Optional[int] = None
+        self.levels: List[List[int]] = [[]]
+        self.size = 0
+        self.max_size = self._capacity(0)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(int(math.ceil(self.k * self.C ** depth)), 2)
+
+    def _grow(self) -> None:
+        self.levels.append([])
+        self.max_size = sum(self._capacity(level) for level in range(len(self.levels)))
+
+    def _compress(self) -> None:
+        for level in range(len(self.levels)):
+            items = self.levels[level]
+            if len(items) < self._capacity(level):
+                continue
+            if level + 1 == len(self.levels):
+                self._grow()
+            items.sort()
+            # An odd item out stays behind so the promoted items keep exactly half the weight
+            kept = [items.pop()] if len(items) % 2 else []
+            self.levels[level + 1].extend(items[random.getrandbits(1)::2])
+            self.levels[level] = kept
+            self.size = sum(len(items) for items in self.levels)
+            if self.size < self.max_size:
+                return
+
+    def update(self, value: int) -> None:
+        self.update_many((value,))
+
+    def update_many(self, values: Iterable[int]) -> None:
+        for value in values:
+            self.levels[0].append(value)
+            self.n += 1
+            self.size += 1
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+            if self.size >= self.max_size:
+                self._compress()
+
+    def merge(self, other: "KLLSketch") -> None:
+        """Folds another sketch into this one."""
+        while len(self.levels) < len(other.levels):
+            self._grow()
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.n += other.n
+        self.size = sum(len(items) for items in self.levels)
+        if other.n:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        while self.size >= self.max_size:
+            self._compress()
+
+    def quantiles(self, fractions: Sequence[float]) -> List[Optional[int]]:
+        """
+        Approximate values at the given ranks.
+        :param fractions: Ranks between 0 and 1; 0 and 1 return the exact minimum and maximum.
+        :return: One value per fraction, or None each when the sketch is empty.
+        """
+        if not self.n:
+            return [None] * len(fractions)
+
+        weighted = sorted((value, 1 << level) for level, items in enumerate(self.levels) for value in items)
+        total = sum(weight for _, weight in weighted)
+        results = []
+        for fraction in fractions:
+            if fraction <= 0:
+                results.append(self.min)
+                continue
+            if fraction >= 1:
+                results.append(self.max)
+                continue
+            target, cumulative = fraction * total, 0
+            for value, weight in weighted:
+                cumulative += weight
+                if cumulative >= target:
+                    results.append(value)
+                    break
+        return results
+
+    def quantile(self, fraction: float) -> Optional[int]:
+        return self.quantiles((fraction,))[0]
+
+    def to_bytes(self) -> bytes:
+        """Serializes to a fixed header, the per-level item counts and the items as int64."""
+        header = HEADER.pack(FORMAT_VERSION, self.k, self.n, self.min or 0, self.max or 0, len(self.levels))
+        counts = array("I", (len(items) for items in self.levels))
+        items = array("q", (value for level in self.levels for value in level))
+        return header + counts.tobytes() + items.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "KLLSketch":
+        version, k, n, minimum, maximum, level_count = HEADER.unpack_from(data)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported sketch format version: {version}")
+        counts = array("I")
+        counts.frombytes(data[HEADER.size:HEADER.size + 4 * level_count])
+        items = array("q")
+        items.frombytes(data[HEADER.size + 4 * level_count:])
+
+        sketch = cls(k)
+        sketch.n = n
+        sketch.min, sketch.max = (minimum, maximum) if n else (None, None)
+        sketch.levels, start = [], 0
+        for count in counts:
+            sketch.levels.append(items[start:start + count].tolist())
+            start += count
+        sketch.size = start
+        sketch.max_size = sum(sketch._capacity(level) for level in range(len(sketch.levels)))
+        return sketch
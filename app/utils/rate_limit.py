@@ -0,0 +1,228 @@
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from fastapi.responses import JSONResponse
+from app.core.config import settings
+from app.utils.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Token buckets checked and debited atomically. KEYS are bucket hashes (tokens, ts); ARGV holds three values per
+# key: capacity, refill per second, and tokens already spent by requests the caller let through locally.
+# The request itself costs one token in every bucket and is only debited when every bucket has one.
+# Returns {allowed, retry after in ms, remaining tokens per key}. Uses the server clock, so workers need not agree.
+TOKEN_BUCKET_SCRIPT = """
+local now = redis.call("time")
+local now_ms = now[1] * 1000 + math.floor(now[2] / 1000)
+local tokens = {}
+local allowed = 1
+local retry_ms = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 3 - 2])
+    local rate = tonumber(ARGV[i * 3 - 1])
+    local state = redis.call("hmget", key, "tokens", "ts")
+    local available = tonumber(state[1]) or capacity
+    local elapsed = math.max(0, now_ms - (tonumber(state[2]) or now_ms))
+    available = math.min(capacity, available + elapsed * rate / 1000)
+    available = math.max(0, available - tonumber(ARGV[i * 3]))
+    if available < 1 then
+        allowed = 0
+        retry_ms = math.max(retry_ms, math.ceil((1 - available) * 1000 / rate))
+    end
+    tokens[i] = available
+end
+local result = {allowed, retry_ms}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 3 - 2])
+    local rate = tonumber(ARGV[i * 3 - 1])
+    local available = tokens[i] - allowed
+    redis.call("hset", key, "tokens", available, "ts", now_ms)
+    redis.call("pexpire", key, math.ceil(capacity * 1000 / rate) + 1000)
+    result[i + 2] = math.floor(available)
+end
+return result
+"""
+
+
+class RateLimitRule(NamedTuple):
+    name: str
+    path_prefix: str
+    capacity: int
+    refill_per_second: float
+
+
+class LocalBucket:
+    """What this worker last learned about a Redis bucket, plus the tokens it has spent since."""
+    __slots__ = ("capacity", "remaining", "pending", "synced_at", "blocked_until")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.remaining = 0
+        self.pending = 0
+        self.synced_at = 0.0
+        self.blocked_until = 0.0
+
+
+class RateLimiter:
+    """
+    Per-client token buckets kept in Redis: one client-wide bucket and one per matching route rule.
+    Requests are let through without a Redis call while every bucket they need was synced within `sync_seconds`
+    and still had more than `local_fraction` of its capacity left after this worker's local spending. The
+    tokens spent that way are debited on the next Redis call, so each worker can overshoot a bucket by at
+    most (1 - local_fraction) of its capacity per sync interval. A client Redis turned away is also turned
+    away locally until its Retry-After has passed. If Redis fails, requests are let through.
+    """
+
+    def __init__(
+        self,
+        rules: List[RateLimitRule],
+        exempt_paths: Tuple[str, ...] = (),
+        local_fraction: float = 0.5,
+        sync_seconds: float = 1.0,
+        max_local_buckets: int = 10000,
+        trust_forwarded_for: bool = False,
+    ):
+        self.rules = rules
+        self.exempt_paths = exempt_paths
+        self.local_fraction = float(local_fraction)
+        self.sync_seconds = float(sync_seconds)
+        self.max_local_buckets = int(max_local_buckets)
+        self.trust_forwarded_for = trust_forwarded_for
+        self._buckets: "OrderedDict[str, LocalBucket]" = OrderedDict()
+
+        self.local_allowed = 0
+        self.redis_checks = 0
+        self.rejected = 0
+        self.redis_errors = 0
+
+    def client_id(self, scope) -> str:
+        if self.trust_forwarded_for:
+            for name, value in scope.get("headers", ()):
+                if name == b"x-forwarded-for":
+                    return value.decode("latin-1").split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    def matching_rules(self, path: str) -> List[RateLimitRule]:
+        if any(path.startswith(prefix) for prefix in self.exempt_paths):
+            return []
+        return [rule for rule in self.rules if path.startswith(rule.path_prefix)]
+
+    def _local_bucket(self, key: str, capacity: int) -> LocalBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = LocalBucket(capacity)
+            while len(self._buckets) > self.max_local_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _allow_locally(self, buckets: List[LocalBucket]) -> bool:
+        now = time.monotonic()
+        for bucket in buckets:
+            if now - bucket.synced_at >= self.sync_seconds:
+                return False
+            if bucket.remaining - bucket.pending - 1 < bucket.capacity * self.local_fraction:
+                return False
+        for bucket in buckets:
+            bucket.pending += 1
+        return True
+
+    async def check(self, client: str, rules: List[RateLimitRule]) -> Tuple[bool, int]:
+        """
+        Takes one token from the client's bucket for every rule.
+        :return: Whether the request may proceed, and when it may not, the seconds until it would.
+        """
+        keys = [f"rate_limit:{rule.name}:{client}" for rule in rules]
+        buckets = [self._local_bucket(key, rule.capacity) for key, rule in zip(keys, rules)]
+        blocked_until = max(bucket.blocked_until for bucket in buckets)
+        if blocked_until > time.monotonic():
+            self.rejected += 1
+            return False, max(1, math.ceil(blocked_until - time.monotonic()))
+        if self._allow_locally(buckets):
+            self.local_allowed += 1
+            return True, 0
+
+        # Taken now, so concurrent calls never debit the same locally spent tokens twice
+        args, spent = [], [bucket.pending for bucket in buckets]
+        for rule, bucket in zip(rules, buckets):
+            args.extend((rule.capacity, rule.refill_per_second, bucket.pending))
+            bucket.pending = 0
+        try:
+            self.redis_checks += 1
+            result = await cache.redis.eval(TOKEN_BUCKET_SCRIPT, len(keys), *keys, *args)
+        except Exception as e:
+            for bucket, pending in zip(buckets, spent):
+                bucket.pending += pending
+            self.redis_errors += 1
+            logger.error("Rate limit check failed, letting the request through, error: %s", str(e))
+            return True, 0
+
+        now = time.monotonic()
+        allowed, retry_seconds = bool(int(result[0])), int(result[1]) / 1000
+        for bucket, remaining in zip(buckets, result[2:]):
+            bucket.remaining = int(remaining)
+            bucket.synced_at = now
+            if not allowed and bucket.remaining < 1:
+                bucket.blocked_until = now + retry_seconds
+        if allowed:
+            return True, 0
+        self.rejected += 1
+        return False, max(1, math.ceil(retry_seconds))
+
+    def stats(self) -> Dict:
+        return {
+            "local_allowed": self.local_allowed,
+            "redis_checks": self.redis_checks,
+            "rejected": self.rejected,
+            "redis_errors": self.redis_errors,
+            "local_buckets": len(self._buckets),
+        }
+
+
+class RateLimitMiddleware:
+    """ASGI middleware answering 429 with Retry-After when a client runs out of tokens."""
+
+    def __init__(self, app, limiter: Optional[RateLimiter] = None):
+        self.app = app
+        self.limiter = limiter or rate_limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.RATE_LIMIT_ENABLED:
+            return await self.app(scope, receive, send)
+        rules = self.limiter.matching_rules(scope["path"])
+        if rules:
+            allowed, retry_after = await self.limiter.check(self.limiter.client_id(scope), rules)
+            if not allowed:
+                response = JSONResponse(
+                    status_code=429,
+                    content={"detail": "Too many requests"},
+                    headers={"Retry-After": str(retry_after)},
+                )
+                return await response(scope, receive, send)
+        await self.app(scope, receive, send)
+
+
+def rules_from_settings() -> List[RateLimitRule]:
+    return [
+        RateLimitRule("client", "/", int(settings.RATE_LIMIT_CAPACITY), float(settings.RATE_LIMIT_REFILL_PER_SECOND)),
+        RateLimitRule(
+            "analytics",
+            "/analytics",
+            int(settings.RATE_LIMIT_ANALYTICS_CAPACITY),
+            float(settings.RATE_LIMIT_ANALYTICS_REFILL_PER_SECOND),
+        ),
+    ]
+
+# Singleton instance shared by the middleware and the monitoring router
+rate_limiter = RateLimiter(
+    rules_from_settings(),
+    exempt_paths=tuple(path for path in settings.RATE_LIMIT_EXEMPT_PATHS.split(",") if path),
+    local_fraction=settings.RATE_LIMIT_LOCAL_FRACTION,
+    sync_seconds=settings.RATE_LIMIT_SYNC_SECONDS,
+    max_local_buckets=settings.RATE_LIMIT_LOCAL_MAX_BUCKETS,
+    trust_forwarded_for=settings.RATE_LIMIT_TRUST_FORWARDED_FOR,
+)
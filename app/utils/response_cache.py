@@ -0,0 +1,123 @@
+import hashlib
+import logging
+import orjson
+from typing import Any, Awaitable, Callable, Optional, Tuple, Union
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from app.utils.cache import MISSING, Cache, cache
+
+logger = logging.getLogger(__name__)
+
+
+def make_etag(body: bytes) -> str:
+    """Builds a strong ETag from the exact response bytes."""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Applies the weak comparison that If-None-Match uses, so W/ prefixed tags match too."""
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+def encode_json(content: Any) -> bytes:
+    if isinstance(content, BaseModel):
+        return content.model_dump_json().encode()
+    return orjson.dumps(jsonable_encoder(content))
+
+
+class ResponseCache:
+    """
+    Caches the final JSON bytes of GET responses together with a strong ETag.
+    Both live in one Redis hash, so a conditional request reads only the tag and never the body.
+    Redis errors are logged and treated as misses; the response is then built as if nothing was cached.
+    """
+    PREFIX = "response:"
+
+    def __init__(self, backend: Cache):
+        self.backend = backend
+
+    def _key(self, key: str) -> str:
+        return f"{self.PREFIX}{key}"
+
+    async def get_etag(self, key: str) -> Optional[str]:
+        entry = self.backend.local.get(self._key(key))
+        if entry is not MISSING:
+            return entry[0]
+        etag = await self.backend.redis.hget(self._key(key), "etag")
+        return etag.decode() if etag else None
+
+    async def get(self, key: str) -> Optional[Tuple[str, bytes]]:
+        """
+        Gets a stored response.
+        :return: The (etag, body) pair, or None if not found.
+        """
+        full_key = self._key(key)
+        entry = self.backend.local.get(full_key)
+        if entry is not MISSING:
+            return entry
+        etag, body = await self.backend.redis.hmget(full_key, ["etag", "body"])
+        if not etag or body is None:
+            return None
+        entry = (etag.decode(), body)
+        self.backend.local.set(full_key, entry)
+        return entry
+
+    async def set(self, key: str, body: bytes, etag: str, expire: int) -> None:
+        full_key = self._key(key)
+        async with self.backend.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(full_key, mapping={"etag": etag, "body": body})
+            pipe.expire(full_key, expire)
+            pipe.publish(self.backend.invalidation_channel, self.backend.invalidation_message(full_key))
+            await pipe.execute()
+        self.backend.local.set(full_key, (etag, body), ttl=expire)
+
+    async def invalidate(self, key: str) -> None:
+        """Drops a stored response in both tiers and on the other workers."""
+        await self.backend.clear_cache(self._key(key))
+
+    async def respond(
+        self,
+        request: Request,
+        key: Union[str, Awaitable[str]],
+        build: Callable[[], Awaitable[Any]],
+        expire: int,
+    ) -> Response:
+        """
+        Serves a GET response from the cache, or builds, stores and serves it.
+        :param key: The cache key, or an awaitable that resolves to it.
+        :param build: Produces the response content on a miss. Its exceptions propagate.
+        :param expire: Seconds the stored response is kept.
+        :return: 304 when If-None-Match matches the current ETag, otherwise the JSON body with its ETag.
+        """
+        if_none_match = request.headers.get("if-none-match")
+        entry = None
+        try:
+            if not isinstance(key, str):
+                key = await key
+            if if_none_match:
+                etag = await self.get_etag(key)
+                if etag and etag_matches(if_none_match, etag):
+                    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+            entry = await self.get(key)
+        except Exception as e:
+            logger.warning("Response cache unavailable, building the response directly, error: %s", str(e))
+            key = None
+
+        if entry is not None:
+            etag, body = entry
+        else:
+            body = encode_json(await build())
+            etag = make_etag(body)
+            if key is not None:
+                try:
+                    await self.set(key, body, etag, expire)
+                except Exception as e:
+                    logger.warning("Could not store response for %s, error: %s", key, str(e))
+
+        if if_none_match and etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+# Singleton instance sharing the application's cache connection and local tier
+response_cache = ResponseCache(cache)
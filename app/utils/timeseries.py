@@ -0,0 +1,106 @@
+from datetime import date
+from typing import Dict, Optional, Sequence, Tuple
+import numpy as np
+
+INTERVALS = ("day", "week", "month")
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# rolling_std copies at most this many window elements at a time
+STD_CHUNK_ELEMENTS = 1 << 20
+
+
+def daily_arrays(rows: Sequence[Tuple[date, int, int, int]]) -> Dict[str, np.ndarray]:
+    """
+    Packs (day, transaction_count, credit_amount, debit_amount) rows into one typed array per column.
+    :return: day as datetime64[D]; transaction_count, credit and debit as int64.
+    """
+    days, counts, credits, debits = zip(*rows) if rows else ((), (), (), ())
+    # Converting date objects to datetime64 one by one is slow; proleptic ordinals go through an integer array
+    ordinals = np.fromiter((day.toordinal() for day in days), dtype=np.int64, count=len(days))
+    return {
+        "day": (ordinals - EPOCH_ORDINAL).astype("datetime64[D]"),
+        "transaction_count": np.array(counts, dtype=np.int64),
+        "credit": np.array(credits, dtype=np.int64),
+        "debit": np.array(debits, dtype=np.int64),
+    }
+
+def _bucket_ordinals(days: np.ndarray, interval: str) -> np.ndarray:
+    # Consecutive integers per bucket, so bucket i + 1 always follows bucket i
+    ordinals = days.astype(np.int64)
+    if interval == "day":
+        return ordinals
+    if interval == "week":
+        # Day 0 (1970-01-01) is a Thursday; shifting by 3 starts every bucket on a Monday
+        return (ordinals + 3) // 7
+    if interval == "month":
+        return days.astype("datetime64[M]").astype(np.int64)
+    raise ValueError(f"Unknown interval: {interval}")
+
+def _bucket_starts(ordinals: np.ndarray, interval: str) -> np.ndarray:
+    if interval == "day":
+        return ordinals.astype("datetime64[D]")
+    if interval == "week":
+        return (ordinals * 7 - 3).astype("datetime64[D]")
+    return ordinals.astype("datetime64[M]").astype("datetime64[D]")
+
+def bucket_count(start, end, interval: str) -> int:
+    """Number of buckets bucketize produces for the inclusive range [start, end]; 0 when start is after end."""
+    first, last = _bucket_ordinals(np.array([start, end], dtype="datetime64[D]"), interval)
+    return max(int(last - first) + 1, 0)
+
+def bucketize(
+    series: Dict[str, np.ndarray],
+    interval: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Sums daily columns into contiguous day, week (Monday) or month buckets.
+    Buckets without transactions are kept as zeros so rolling windows span calendar time, not activity.
+    :param start: First day to cover; defaults to the first day in the series.
+    :param end: Last day to cover (inclusive); defaults to the last day in the series.
+    :return: period_start plus the summed columns, one element per bucket.
+    """
+    days = series["day"]
+    if start is None and not len(days):
+        return {"period_start": days, **{column: np.zeros(0, dtype=np.int64) for column in series if column != "day"}}
+
+    first = _bucket_ordinals(np.array([start or days.min()], dtype="datetime64[D]"), interval)[0]
+    last = _bucket_ordinals(np.array([end or (days.max() if len(days) else start)], dtype="datetime64[D]"), interval)[0]
+    size = max(int(last - first) + 1, 0)
+
+    index = _bucket_ordinals(days, interval) - first
+    # Days outside [start, end] are dropped even when they share a bucket with days inside it
+    inside = (index >= 0) & (index < size)
+    if start is not None:
+        inside &= days >= np.datetime64(start, "D")
+    if end is not None:
+        inside &= days <= np.datetime64(end, "D")
+    index = index[inside]
+
+    buckets = {"period_start": _bucket_starts(np.arange(first, first + size), interval)}
+    for column, values in series.items():
+        if column != "day":
+            # bincount sums in float64, which is exact for totals below 2**53 pesewas
+            buckets[column] = np.bincount(index, weights=values[inside], minlength=size).astype(np.int64)
+    return buckets
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Mean of each full trailing window; the first window - 1 positions are NaN."""
+    result = np.full(len(values), np.nan)
+    if len(values) >= window:
+        sums = np.cumsum(np.concatenate(([0.0], values.astype(np.float64))))
+        result[window - 1:] = (sums[window:] - sums[:-window]) / window
+    return result
+
+def rolling_std(values: np.ndarray, window: int) -> np.ndarray:
+    """Sample standard deviation of each full trailing window; the first window - 1 positions are NaN."""
+    result = np.full(len(values), np.nan)
+    if len(values) >= window:
+        # Deviations are taken per window rather than from running sums of squares, which lose precision.
+        # std copies the windows it reads, so they are taken in chunks to keep that copy bounded.
+        windows = np.lib.stride_tricks.sliding_window_view(values.astype(np.float64), window)
+        step = max(STD_CHUNK_ELEMENTS // window, 1)
+        for offset in range(0, len(windows), step):
+            chunk = windows[offset:offset + step]
+            result[window - 1 + offset:window - 1 + offset + len(chunk)] = chunk.std(axis=1, ddof=1)
+    return result
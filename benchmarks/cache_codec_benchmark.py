@@ -0,0 +1,92 @@
+"""
+Encode/decode cost and stored size of the cache codecs for transaction and analytics payloads.
+
+Runs in-process, no Redis needed (settings are still loaded from the environment or .env).
+
+Usage:
+    python -m benchmarks.cache_codec_benchmark --number 20000 --thresholds 0,1024
+
+Prints one JSON object per (payload, codec, compression threshold) with the mean encode and decode time in
+microseconds and the frame size in bytes. The `legacy` rows reproduce the previous path: a datetime-converting
+dict comprehension plus json.dumps, and TransactionResponse(**json.loads(...)) on read.
+"""
+import argparse
+import json
+import time
+import timeit
+import uuid
+from datetime import datetime, timedelta
+from app.schemas.transaction import TransactionResponse
+from app.utils.cache import CODECS, Cache, get_codec
+
+
+def make_transaction(index: int) -> TransactionResponse:
+    moment = datetime(2024, 1, 1, 9, 30) + timedelta(minutes=index)
+    return TransactionResponse(
+        id=str(uuid.uuid4()),
+        user_id=str(uuid.uuid4()),
+        transaction_amount=1000 + index,
+        transaction_date=moment,
+        transaction_type="CREDIT" if index % 2 else "DEBIT",
+        created_at=moment,
+        updated_at=moment,
+    )
+
+def payloads():
+    transaction = make_transaction(0)
+    page = {"items": [make_transaction(i).model_dump(mode="json") for i in range(50)], "next_cursor": "MjAyNC0wMS0wMVQwOTozMDowMHw"}
+    totals = {"value": {"credit": 1250000, "debit": 830000}, "fresh_until": time.time() + 100}
+    average = {"value": {"value": 15234.5}, "fresh_until": time.time() + 100}
+    return {
+        "transaction": (transaction, TransactionResponse),
+        "transaction_page_50": (page, None),
+        "analytics_totals": (totals, None),
+        "analytics_average": (average, None),
+    }
+
+def mean_us(func, number: int) -> float:
+    return round(timeit.timeit(func, number=number) / number * 1_000_000, 3)
+
+def legacy_rows(number: int):
+    for name, (value, model) in payloads().items():
+        as_dict = value.dict() if model else value
+        encode = lambda: json.dumps({k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in as_dict.items()})
+        encoded = encode()
+        decode = (lambda: model(**json.loads(encoded))) if model else (lambda: json.loads(encoded))
+        yield {
+            "payload": name,
+            "codec": "legacy",
+            "threshold": 0,
+            "encode_us": mean_us(encode, number),
+            "decode_us": mean_us(decode, number),
+            "bytes": len(encoded.encode()),
+        }
+
+def codec_rows(number: int, thresholds):
+    cache = Cache()
+    for name, (value, model) in payloads().items():
+        for codec_name in CODECS:
+            cache.codec = get_codec(codec_name)
+            for threshold in thresholds:
+                cache.compression_threshold = threshold
+                frame = cache.encode(value)
+                yield {
+                    "payload": name,
+                    "codec": codec_name,
+                    "threshold": threshold,
+                    "encode_us": mean_us(lambda: cache.encode(value), number),
+                    "decode_us": mean_us(lambda: cache.decode(frame, model), number),
+                    "bytes": len(frame),
+                }
+
+def main(args) -> None:
+    for row in legacy_rows(args.number):
+        print(json.dumps(row), flush=True)
+    for row in codec_rows(args.number, args.thresholds):
+        print(json.dumps(row), flush=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=20000)
+    parser.add_argument("--thresholds", type=lambda value: [int(v) for v in value.split(",")], default=[0, 1024])
+    main(parser.parse_args())
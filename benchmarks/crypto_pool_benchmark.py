@@ -0,0 +1,85 @@
+"""
+Event-loop lag under concurrent logins, with bcrypt run inline on the loop against on the bounded crypto pool.
+
+Runs in-process, no database needed.
+
+Usage:
+    python -m benchmarks.crypto_pool_benchmark --concurrency 1,8,32 --pool-sizes 2,4,8 --tick-ms 5
+
+A ticker task sleeps `--tick-ms` in a loop while `--concurrency` logins verify a bcrypt password at once; its
+oversleep is the delay every other request on the loop would see. Prints one JSON object per (mode, concurrency,
+pool size) with the p50, p99 and max lag in milliseconds, the wall time and logins per second, and for the pool
+the mean and max queue wait. `inline` is the behaviour before the pool: each verify holds the loop for its full
+duration, so the max lag grows with the number of logins.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from passlib.context import CryptContext
+from app.utils.bounded_executor import BoundedExecutor
+
+PASSWORD = "correct horse battery staple"
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+async def ticker(tick: float, lags: list, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(tick)
+        lags.append(max(time.perf_counter() - started - tick, 0.0))
+
+async def measure(verify, concurrency: int, tick: float):
+    lags, stop = [], asyncio.Event()
+    ticking = asyncio.create_task(ticker(tick, lags, stop))
+    await asyncio.sleep(tick * 2)
+    started = time.perf_counter()
+    await asyncio.gather(*(verify() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticking
+    return lags or [0.0], elapsed
+
+async def run(args) -> None:
+    context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=args.rounds)
+    hashed = context.hash(PASSWORD)
+    tick = args.tick_ms / 1000
+
+    async def inline():
+        return context.verify(PASSWORD, hashed)
+
+    for concurrency in args.concurrency:
+        modes = [("inline", None, inline)]
+        for size in args.pool_sizes:
+            executor = BoundedExecutor("bench", size, concurrency)
+            modes.append(("pool", executor, lambda executor=executor: executor.run(context.verify, PASSWORD, hashed)))
+
+        for mode, executor, verify in modes:
+            lags, elapsed = await measure(verify, concurrency, tick)
+            row = {
+                "mode": mode,
+                "concurrency": concurrency,
+                "pool_size": executor.size if executor else 0,
+                "lag_p50_ms": round(statistics.median(lags) * 1000, 2),
+                "lag_p99_ms": round(percentile(lags, 0.99) * 1000, 2),
+                "lag_max_ms": round(max(lags) * 1000, 2),
+                "wall_ms": round(elapsed * 1000, 1),
+                "logins_per_second": round(concurrency / elapsed, 1),
+            }
+            if executor:
+                report = executor.report()
+                row.update(queue_wait_ms_mean=report["queue_wait_ms_mean"], queue_wait_ms_max=report["queue_wait_ms_max"])
+                executor.shutdown()
+            print(json.dumps(row), flush=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=lambda value: [int(v) for v in value.split(",")], default=[1, 8, 32])
+    parser.add_argument("--pool-sizes", type=lambda value: [int(v) for v in value.split(",")], default=[2, 4, 8])
+    parser.add_argument("--tick-ms", type=float, default=5)
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost factor (passlib default 12)")
+    asyncio.run(run(parser.parse_args()))
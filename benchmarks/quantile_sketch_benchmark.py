@@ -0,0 +1,98 @@
+"""
+Accuracy against memory of the KLL transaction-value sketch.
+
+Runs in-process, no database needed (settings are still loaded from the environment or .env).
+
+Usage:
+    python -m benchmarks.quantile_sketch_benchmark --sizes 1000,100000,1000000 --ks 50,100,200,400 --trials 5
+
+Prints one JSON object per (distribution, size, k) with the serialized sketch size in bytes, the worst and mean
+rank error of the median, p90 and p99 over the trials, the mean time per update in microseconds, and the time to
+load the stored bytes and answer the three percentiles in microseconds. The `exact` rows store every amount as
+int64 and sort it, which is what serving the percentiles without a sketch would cost.
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from bisect import bisect_left, bisect_right
+from app.utils.quantile_sketch import KLLSketch
+
+FRACTIONS = (0.5, 0.9, 0.99)
+
+DISTRIBUTIONS = {
+    # Typical spending: most amounts small, a long tail of large ones
+    "lognormal": lambda rng: int(rng.lognormvariate(8, 1.5)) + 1,
+    "uniform": lambda rng: rng.randint(100, 1_000_000),
+    # Salary-like account: a few repeated amounts with rare outliers
+    "clustered": lambda rng: rng.choice((5000, 5000, 12000, 250000)) if rng.random() < 0.999 else rng.randint(1, 50_000_000),
+}
+
+
+def rank_errors(ordered, estimates):
+    # A repeated value covers a range of ranks; the error is the distance from that range
+    errors = []
+    for fraction, value in zip(FRACTIONS, estimates):
+        low, high = bisect_left(ordered, value) / len(ordered), bisect_right(ordered, value) / len(ordered)
+        errors.append(max(low - fraction, fraction - high, 0.0))
+    return errors
+
+def exact_row(distribution: str, values):
+    started = time.perf_counter()
+    ordered = sorted(values)
+    [ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] for fraction in FRACTIONS]
+    return {
+        "distribution": distribution,
+        "size": len(values),
+        "k": "exact",
+        "bytes": 8 * len(values),
+        "max_rank_error": 0.0,
+        "mean_rank_error": 0.0,
+        "update_us": 0.0,
+        "query_us": round((time.perf_counter() - started) * 1_000_000, 1),
+    }
+
+def sketch_row(distribution: str, values, k: int, trials: int):
+    ordered = sorted(values)
+    errors, update_seconds, query_seconds, sizes = [], [], [], []
+    for _ in range(trials):
+        sketch = KLLSketch(k)
+        started = time.perf_counter()
+        sketch.update_many(values)
+        update_seconds.append((time.perf_counter() - started) / len(values))
+
+        data = sketch.to_bytes()
+        started = time.perf_counter()
+        estimates = KLLSketch.from_bytes(data).quantiles(FRACTIONS)
+        query_seconds.append(time.perf_counter() - started)
+
+        errors.extend(rank_errors(ordered, estimates))
+        sizes.append(len(data))
+    return {
+        "distribution": distribution,
+        "size": len(values),
+        "k": k,
+        "bytes": max(sizes),
+        "max_rank_error": round(max(errors), 5),
+        "mean_rank_error": round(statistics.mean(errors), 5),
+        "update_us": round(statistics.mean(update_seconds) * 1_000_000, 3),
+        "query_us": round(statistics.mean(query_seconds) * 1_000_000, 1),
+    }
+
+def main(args) -> None:
+    rng = random.Random(args.seed)
+    for distribution, draw in DISTRIBUTIONS.items():
+        for size in args.sizes:
+            values = [draw(rng) for _ in range(size)]
+            print(json.dumps(exact_row(distribution, values)), flush=True)
+            for k in args.ks:
+                print(json.dumps(sketch_row(distribution, values, k, args.trials)), flush=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=lambda value: [int(v) for v in value.split(",")], default=[1000, 100_000])
+    parser.add_argument("--ks", type=lambda value: [int(v) for v in value.split(",")], default=[50, 100, 200, 400])
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    main(parser.parse_args())
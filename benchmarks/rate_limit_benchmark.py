@@ -0,0 +1,107 @@
+"""
+Per-request overhead of the rate limiter middleware.
+
+Needs the Redis server from REDIS_URL / REDIS_PASSWORD (settings are loaded from the environment or .env); no
+database needed. Buckets are given a huge capacity, so no request is rejected and only the check itself is timed.
+
+Usage:
+    python -m benchmarks.rate_limit_benchmark --requests 20000 --clients 1,100 --concurrency 1,32
+
+Calls a one-route ASGI app directly, without a server or sockets, in three modes:
+    none    no middleware (the baseline)
+    redis   every request runs the token-bucket script in Redis (local_fraction 1)
+    local   the in-process pre-check, which only goes to Redis once per sync interval or when a bucket runs low
+
+Prints one JSON object per (mode, clients, concurrency) with the mean, p50 and p99 request latency in
+microseconds, the overhead of the mean over `none`, and the share of requests that needed a Redis call.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from fastapi import FastAPI
+from app.utils.cache import cache
+from app.utils.rate_limit import RateLimiter, RateLimitMiddleware, RateLimitRule
+
+RULES = [RateLimitRule("bench", "/", 1_000_000_000, 1_000_000_000), RateLimitRule("bench_analytics", "/analytics", 1_000_000_000, 1_000_000_000)]
+
+
+def build_app():
+    app = FastAPI()
+
+    @app.get("/analytics/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+async def call(app, client: str) -> float:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/analytics/ping", "raw_path": b"/analytics/ping", "root_path": "", "query_string": b"",
+        "headers": [], "client": (client, 1234), "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    started = time.perf_counter()
+    await app(scope, receive, send)
+    return time.perf_counter() - started
+
+async def measure(app, requests: int, clients: int, concurrency: int):
+    latencies = []
+
+    async def worker(offset: int):
+        for i in range(offset, requests, concurrency):
+            latencies.append(await call(app, f"10.0.{i % clients // 256}.{i % clients % 256}"))
+
+    await asyncio.gather(*(worker(offset) for offset in range(concurrency)))
+    return latencies
+
+async def run(args) -> None:
+    await cache.redis.ping()
+    baselines = {}
+    for clients in args.clients:
+        for concurrency in args.concurrency:
+            for mode in ("none", "redis", "local"):
+                app = build_app()
+                limiter = None
+                if mode != "none":
+                    limiter = RateLimiter(RULES, local_fraction=1 if mode == "redis" else 0.5, sync_seconds=args.sync_seconds)
+                    app.add_middleware(RateLimitMiddleware, limiter=limiter)
+                await measure(app, min(1000, args.requests), clients, concurrency)  # warm up
+                if limiter:
+                    limiter.redis_checks = limiter.local_allowed = 0
+
+                latencies = await measure(app, args.requests, clients, concurrency)
+                mean_us = statistics.mean(latencies) * 1_000_000
+                if mode == "none":
+                    baselines[(clients, concurrency)] = mean_us
+                ordered = sorted(latencies)
+                print(json.dumps({
+                    "mode": mode,
+                    "clients": clients,
+                    "concurrency": concurrency,
+                    "mean_us": round(mean_us, 1),
+                    "p50_us": round(ordered[len(ordered) // 2] * 1_000_000, 1),
+                    "p99_us": round(ordered[int(len(ordered) * 0.99)] * 1_000_000, 1),
+                    "overhead_us": round(mean_us - baselines[(clients, concurrency)], 1),
+                    "redis_share": round(limiter.redis_checks / len(latencies), 4) if limiter else 0.0,
+                }), flush=True)
+
+    keys = [key async for key in cache.redis.scan_iter(match="rate_limit:bench*")]
+    if keys:
+        await cache.redis.delete(*keys)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--clients", type=lambda value: [int(v) for v in value.split(",")], default=[1, 100])
+    parser.add_argument("--concurrency", type=lambda value: [int(v) for v in value.split(",")], default=[1, 32])
+    parser.add_argument("--sync-seconds", type=float, default=1.0)
+    asyncio.run(run(parser.parse_args()))